@@ -0,0 +1,80 @@
+"""
+Admission control in front of the recognition views
+
+Frames beyond the in-flight limit (plus a short wait queue), or beyond a
+kiosk's frame rate, get an immediate 429 with a Retry-After hint instead of
+queueing behind the recognizer. The kiosk page slows its polling to match.
+"""
+import functools
+import math
+import os
+import time
+
+from django.conf import settings
+from django.http import JsonResponse
+
+from .instrumentation import metrics
+from load_shedding import AdmissionController
+
+admission = AdmissionController(
+    max_in_flight=getattr(settings, 'FACE_MAX_IN_FLIGHT', None) or os.cpu_count() or 1,
+    max_waiting=getattr(settings, 'FACE_MAX_WAITING', 4),
+    wait_timeout=getattr(settings, 'FACE_ADMISSION_WAIT', 1.0),
+    rate=getattr(settings, 'FACE_KIOSK_MAX_FPS', 1.0),
+    burst=getattr(settings, 'FACE_KIOSK_BURST', 2),
+)
+
+metrics.counter('face_admission_rejected_total', 'Recognition requests turned away, by endpoint and reason')
+metrics.histogram('face_admission_wait_seconds', 'Time admitted recognition requests waited for a slot')
+
+
+def client_key(request):
+    """
+    The kiosk id in the query string, else None
+
+    Not the client address: behind a reverse proxy or a school's NAT every
+    kiosk would share one address, and so one rate limit. Without a kiosk
+    id only the in-flight limit applies.
+    """
+    return request.GET.get('kiosk_id') or None
+
+
+def admission_controlled(endpoint, key=client_key, when=None):
+    """
+    Run a view only when the admission controller has a slot for it
+
+    key(request) names the client the per-kiosk rate applies to; with
+    key=None, or for requests it returns None for, only the in-flight
+    limit applies. when(request) can limit
+    control to some requests (e.g. face logins but not password logins);
+    GET requests are never controlled.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method == 'GET' or (when is not None and not when(request)):
+                return view(request, *args, **kwargs)
+
+            start = time.perf_counter()
+            rejection = admission.acquire(key(request) if key else None)
+            if rejection is not None:
+                reason, retry_after = rejection
+                metrics.inc('face_admission_rejected_total', endpoint=endpoint, reason=reason)
+                response = JsonResponse({
+                    'success': False,
+                    'busy': True,
+                    'reason': reason,
+                    'retry_after': round(retry_after, 2),
+                    'message': 'Server busy, please try again shortly.',
+                }, status=429)
+                response['Retry-After'] = str(math.ceil(retry_after))
+                return response
+
+            admitted = time.perf_counter()
+            metrics.observe('face_admission_wait_seconds', admitted - start, endpoint=endpoint)
+            try:
+                return view(request, *args, **kwargs)
+            finally:
+                admission.release(time.perf_counter() - admitted)
+        return wrapper
+    return decorator
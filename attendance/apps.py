@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class AttendanceConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'attendance'
+
+    def ready(self):
+        # Connect the signals that keep the daily summary and cached counters
+        # fresh; the summary first, so a counter rebuilt after invalidation sees it
+        from . import trends  # noqa: F401
+        from . import counters  # noqa: F401
+        from . import timetables  # noqa: F401
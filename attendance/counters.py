@@ -0,0 +1,86 @@
+"""
+Cached dashboard counters
+
+The admin dashboard, statistics page and kiosk page all show how many
+teachers are registered and present today. Those numbers (and the page
+fragments that show them) are cached in the ATTENDANCE_CACHE cache under a
+data version: saving or deleting a User or Attendance bumps the version,
+so every entry made before the change is ignored from then on. Bulk
+inserts send no signals; code using them calls invalidate() itself.
+
+The default file-based backend is shared by all workers on a host. A
+local-memory cache is private to each worker, so other workers only see a
+change once their entries expire (ATTENDANCE_CACHE_TIMEOUT).
+"""
+import time
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import User, Attendance
+
+VERSION_KEY = 'attendance:version'
+
+CACHE_ALIAS = getattr(settings, 'ATTENDANCE_CACHE', 'default')
+TIMEOUT = getattr(settings, 'ATTENDANCE_CACHE_TIMEOUT', 300)
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def data_version() -> str:
+    """Changes whenever users or attendance change, and every day"""
+    cache = _cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # First use, or evicted: a fresh token cannot match older entries
+        cache.add(VERSION_KEY, time.time_ns(), None)
+        version = cache.get(VERSION_KEY)
+    return f'{version}:{date.today().isoformat()}'
+
+
+def invalidate():
+    """Make every cached counter and fragment stale"""
+    _cache().set(VERSION_KEY, time.time_ns(), None)
+
+
+def cached(name, compute, version=None):
+    """compute(), cached under name for the current data version"""
+    key = f'attendance:{name}:{version or data_version()}'
+    cache = _cache()
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, TIMEOUT)
+    return value
+
+
+def headline_counters() -> dict:
+    """
+    Registered teachers and today's attendance, for the dashboard pages
+
+    Also carries 'cache_version', 'cache_timeout' and 'cache_alias' for
+    the {% cache %} tags around the fragments that show them.
+    """
+    version = data_version()
+
+    def compute():
+        total = User.objects.count()
+        present = Attendance.objects.filter(date=date.today()).count()
+        return {'total_teachers': total, 'present_today': present, 'absent_today': total - present}
+
+    counters = dict(cached('counters', compute, version))
+    counters.update(cache_version=version, cache_timeout=TIMEOUT, cache_alias=CACHE_ALIAS)
+    return counters
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Attendance)
+@receiver(post_delete, sender=Attendance)
+def _data_changed(sender, **kwargs):
+    invalidate()
@@ -0,0 +1,95 @@
+"""
+Shared face recognition system, created on first use
+
+Loading the detector, gallery and recognizer is too slow to do at import
+time (every migrate, shell and test run would pay for it), so views call
+get_face_system() instead. Servers call warm_up() at start so the first
+real request does not pay for the load either.
+"""
+import os
+import sys
+import threading
+import time
+
+from django.conf import settings
+
+# Add src directory to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from simple_face_recognition import SimpleFaceRecognitionSystem
+
+from .instrumentation import metrics
+
+_face_system = None
+_lock = threading.Lock()
+_status = {
+    'loaded': False,
+    'load_ms': None,
+    'warmed_up': False,
+    'warming_up': False,
+    'self_test': None,
+    'error': None,
+}
+
+
+def get_face_system() -> SimpleFaceRecognitionSystem:
+    """The process-wide face recognition system, loading it if needed"""
+    global _face_system
+    if _face_system is None:
+        with _lock:
+            if _face_system is None:
+                start = time.perf_counter()
+                system = SimpleFaceRecognitionSystem(
+                    detector=getattr(settings, 'FACE_DETECTOR', 'haar'),
+                    detector_options=getattr(settings, 'FACE_DETECTOR_OPTIONS', None),
+                    detection_scale=getattr(settings, 'FACE_DETECTION_SCALE', 1.0),
+                    refine_detections=getattr(settings, 'FACE_DETECTION_REFINE', True),
+                    recognizer_backend=getattr(settings, 'FACE_RECOGNIZER', 'lbph'),
+                    embedding_model=getattr(settings, 'FACE_EMBEDDING_MODEL', None),
+                    embedding_threshold=getattr(settings, 'FACE_EMBEDDING_THRESHOLD', 0.363),
+                    top_k=getattr(settings, 'FACE_TOP_K', 1),
+                    max_samples_per_user=getattr(settings, 'FACE_MAX_SAMPLES_PER_USER', 10),
+                    sample_redundancy=getattr(settings, 'FACE_SAMPLE_REDUNDANCY', 20.0),
+                    background_training=getattr(settings, 'FACE_BACKGROUND_TRAINING', True),
+                    training_delay=getattr(settings, 'FACE_TRAINING_DELAY', 0.5),
+                    detection_budget=getattr(settings, 'FACE_DETECTION_BUDGET', None),
+                    detection_max_in_flight=getattr(settings, 'FACE_DETECTION_MAX_IN_FLIGHT', None),
+                    metrics=metrics,
+                )
+                _status['load_ms'] = round((time.perf_counter() - start) * 1000, 2)
+                _status['loaded'] = True
+                _face_system = system
+    return _face_system
+
+
+def warm_up() -> dict:
+    """Load the system and run its self-test; returns the readiness status"""
+    _status['warming_up'] = True
+    try:
+        _status['self_test'] = get_face_system().warm_up()
+        _status['warmed_up'] = True
+        _status['error'] = None
+    except Exception as e:
+        _status['error'] = str(e)
+        print(f"Face system warm-up failed: {e}")
+    finally:
+        _status['warming_up'] = False
+    return readiness()
+
+
+def warm_up_in_background():
+    """Start warm_up() on a daemon thread so server start is not delayed"""
+    # Not ready until the self-test has run, even once the model has loaded
+    _status['warming_up'] = True
+    threading.Thread(target=warm_up, name='face-warm-up', daemon=True).start()
+
+
+def readiness() -> dict:
+    """
+    Whether the model is loaded, with load and self-test latency
+
+    The system counts as ready once it has loaded, by warm-up or on first
+    use, unless a warm-up is still running or has failed.
+    """
+    ready = _status['loaded'] and not _status['warming_up'] and _status['error'] is None
+    return dict(_status, ready=ready)
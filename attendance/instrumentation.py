@@ -0,0 +1,40 @@
+"""
+Process-wide metrics registry and the view decorator that feeds it
+
+The face system records detection and matching itself; views mark the
+stages around it (payload decode, image decode, frame filter, database)
+in the same face_stage_seconds histogram, and instrumented() adds
+end-to-end latency and request counts. Everything is exposed at /metrics.
+"""
+import functools
+import os
+import sys
+import time
+
+# Add src directory to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from metrics import MetricsRegistry
+
+metrics = MetricsRegistry()
+metrics.histogram('face_request_seconds', 'End-to-end latency of face endpoints')
+metrics.counter('face_requests_total', 'Face endpoint requests by HTTP status')
+metrics.histogram('face_stage_seconds', 'Time spent in each frame processing stage')
+
+
+def instrumented(endpoint):
+    """Time a view and count its responses under the given endpoint label"""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            start = time.perf_counter()
+            status = 500
+            try:
+                response = view(request, *args, **kwargs)
+                status = response.status_code
+                return response
+            finally:
+                metrics.observe('face_request_seconds', time.perf_counter() - start, endpoint=endpoint)
+                metrics.inc('face_requests_total', endpoint=endpoint, status=str(status))
+        return wrapper
+    return decorator
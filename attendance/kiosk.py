@@ -0,0 +1,118 @@
+"""
+Kiosk frame processing, shared by the HTTP endpoint and the WebSocket stream
+
+Both take one encoded frame and return the same JSON-ready result: frames
+rejected by the pre-filter are reported as skipped, recognized teachers get
+today's attendance marked (see presence.py), and unknown faces are listed
+for debugging.
+"""
+from django.conf import settings
+
+from .face_service import get_face_system
+from .presence import present_today
+from face_tracking import TrackerRegistry
+from frame_filter import FrameFilter
+
+# Per-kiosk face tracks, so a teacher standing at the camera is not re-recognized every frame
+kiosk_trackers = TrackerRegistry(
+    reverify_interval=getattr(settings, 'FACE_TRACK_REVERIFY_SECONDS', 10.0),
+    iou_threshold=getattr(settings, 'FACE_TRACK_IOU', 0.3),
+    max_gap=getattr(settings, 'FACE_TRACK_MAX_GAP_SECONDS', 1.0),
+    max_jump=getattr(settings, 'FACE_TRACK_MAX_JUMP', 0.25),
+    appearance_threshold=getattr(settings, 'FACE_TRACK_APPEARANCE_THRESHOLD', 0.25),
+)
+
+# Rejects dark, blurry and (per kiosk) unchanged frames before detection
+frame_filter = FrameFilter(
+    min_brightness=getattr(settings, 'FRAME_MIN_BRIGHTNESS', 40.0),
+    max_brightness=getattr(settings, 'FRAME_MAX_BRIGHTNESS', 220.0),
+    min_sharpness=getattr(settings, 'FRAME_MIN_SHARPNESS', 15.0),
+    min_change=getattr(settings, 'FRAME_MIN_CHANGE', 2.0),
+)
+
+
+def process_kiosk_frame(image_bytes, kiosk_id=None, timer=None) -> dict:
+    """
+    Recognize the faces in one encoded kiosk frame and mark their attendance
+
+    timer is an optional StageTimer; the decode, filter and database stages
+    are marked on it. Returns the response body as a dict.
+    """
+    face_system = get_face_system()
+
+    # Decode in the detector's colour format, at reduced size for large frames
+    try:
+        frame, decode_factor = face_system.decode(
+            image_bytes, max_width=getattr(settings, 'FRAME_DECODE_MAX_WIDTH', None))
+        if timer:
+            timer.mark('imdecode')
+
+        if frame is None:
+            return {'success': False, 'message': 'Failed to decode image'}
+
+    except Exception as img_error:
+        return {'success': False, 'message': f'Image decode error: {str(img_error)}'}
+
+    # Skip frames that cannot give a new result before running detection
+    skip_reason = frame_filter.check(frame, key=kiosk_id)
+    if timer:
+        timer.mark('filter')
+    if skip_reason:
+        return {'success': True, 'skipped': True, 'reason': skip_reason, 'faces': []}
+
+    # Recognize faces (tracked per kiosk when the page sends its id)
+    tracker = kiosk_trackers.get(kiosk_id) if kiosk_id else None
+    try:
+        recognized_faces = face_system.recognize_faces(frame, tracker=tracker, camera=kiosk_id,
+                                                      frame_scale=decode_factor)
+    except Exception as rec_error:
+        return {'success': False, 'message': f'Recognition error: {str(rec_error)}'}
+    # Detection and matching are recorded by the face system itself
+    if timer:
+        timer.reset()
+
+    # One lookup for everyone recognized; teachers already marked today cost no queries
+    known = [face_info["name"] for face_info in recognized_faces if face_info["name"] != "Unknown"]
+    marks = present_today.mark(known) if known else {}
+    topup_confidence = getattr(settings, 'FACE_TOPUP_CONFIDENCE', None)
+
+    results = []
+    for face_info in recognized_faces:
+        name = face_info["name"]
+        confidence = face_info["confidence"]
+        location = face_info["location"]
+
+        # Convert numpy int32 to Python int for JSON serialization, in
+        # the coordinates of the uploaded (not the reduced) frame
+        location_tuple = tuple(int(x) * decode_factor for x in location)
+
+        if name != "Unknown":
+            if name not in marks:
+                print(f"User {name} not found in database")
+                continue
+            user_name, created = marks[name]
+
+            # A confident first match of the day may top up the user's samples
+            if created and topup_confidence is not None and confidence >= topup_confidence:
+                face_system.add_face_sample(name, frame, location)
+
+            results.append({
+                'user_id': name,
+                'name': user_name,
+                'confidence': round(confidence * 100, 1),
+                'attendance_marked': created,
+                'location': location_tuple
+            })
+        else:
+            # Also return unknown faces for debugging
+            results.append({
+                'user_id': 'unknown',
+                'name': 'Unknown',
+                'confidence': round(confidence * 100, 1),
+                'attendance_marked': False,
+                'location': location_tuple
+            })
+
+    if timer:
+        timer.mark('db')
+    return {'success': True, 'faces': results}
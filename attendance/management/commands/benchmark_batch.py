@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from attendance.face_service import SimpleFaceRecognitionSystem
+from .benchmark_recognition import _identity, _render
+
+
+class Command(BaseCommand):
+    help = ('Measure recognize_faces_batch() throughput against the number of worker processes, '
+            'checking every result against serial recognize_faces()')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20,
+                            help='Synthetic identities enrolled in the gallery (default: 20)')
+        parser.add_argument('--frames', type=int, default=200,
+                            help='Frames recognized per run (default: 200)')
+        parser.add_argument('--workers', type=int, nargs='+',
+                            default=sorted({1, 2, 4, os.cpu_count() or 1}),
+                            help='Worker counts to time (default: 1 2 4 and one per core)')
+        parser.add_argument('--chunksize', type=int, default=4,
+                            help='Frames sent to a worker per round trip')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Seed for the synthetic identities and their frames')
+
+    def handle(self, *args, **options):
+        seed = options['seed']
+        workdir = tempfile.mkdtemp(prefix='face-batch-')
+        system = SimpleFaceRecognitionSystem(
+            encodings_dir=os.path.join(workdir, 'encodings'),
+            models_dir=os.path.join(workdir, 'models'),
+            recognizer_backend=getattr(settings, 'FACE_RECOGNIZER', 'lbph'),
+            embedding_model=getattr(settings, 'FACE_EMBEDDING_MODEL', None),
+        )
+        try:
+            for index in range(options['users']):
+                rng = np.random.default_rng([seed, index, 0])
+                frames = [_render(_identity(seed, index), rng) for _ in range(3)]
+                system.register_face(f"user{index:05d}", frames=frames)
+
+            rng = np.random.default_rng([seed, 1])
+            frames = [_render(_identity(seed, int(i)), rng)
+                      for i in rng.integers(0, options['users'], options['frames'])]
+
+            # Serial reference, in this process
+            system.recognize_faces(frames[0])
+            start = time.perf_counter()
+            expected = [system.recognize_faces(frame) for frame in frames]
+            serial = len(frames) / (time.perf_counter() - start)
+            known = sum(face['name'] != 'Unknown' for faces in expected for face in faces)
+            self.stdout.write(f"Gallery:      {options['users']} users, model version {system.version}")
+            self.stdout.write(f"Frames:       {len(frames)} ({known} faces recognized)")
+            self.stdout.write(f"Serial:       {serial:8.1f} frames/s")
+
+            for workers in options['workers']:
+                # The first map starts the pool and loads the model in every worker
+                system.recognize_faces_batch(frames[:workers * options['chunksize']], workers=workers,
+                                             chunksize=options['chunksize'])
+                start = time.perf_counter()
+                results = system.recognize_faces_batch(frames, workers=workers, chunksize=options['chunksize'])
+                rate = len(frames) / (time.perf_counter() - start)
+
+                mismatches = sum(got != want for got, want in zip(results, expected))
+                style = self.style.SUCCESS if mismatches == 0 else self.style.ERROR
+                self.stdout.write(style(f"{workers:>2} workers:  {rate:8.1f} frames/s "
+                                        f"({rate / serial:.2f}x serial), {mismatches} frames differ"))
+            self.stdout.write(f"Model version after the runs: {system.snapshots.current_version()}")
+        finally:
+            system.close()
+            shutil.rmtree(workdir, ignore_errors=True)
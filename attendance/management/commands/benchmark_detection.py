@@ -0,0 +1,107 @@
+import glob
+import os
+import time
+
+import cv2
+from django.core.management.base import BaseCommand
+
+import attendance.face_service  # noqa: F401 (puts src/ on sys.path)
+from face_detectors import DETECTORS, create_detector
+from frame_decoding import decode_frame
+
+
+def _iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union else 0.0
+
+
+class Command(BaseCommand):
+    help = 'Compare a face detector backend against full-resolution Haar detection for speed and recall'
+
+    def add_arguments(self, parser):
+        parser.add_argument('images', nargs='?', default='data/images',
+                            help='Directory of test frames (default: data/images)')
+        parser.add_argument('--detector', choices=list(DETECTORS), default='haar',
+                            help='Backend to compare against the full-resolution Haar cascade')
+        parser.add_argument('--scale', type=float, default=0.5,
+                            help='Downscale factor for the candidate detector')
+        parser.add_argument('--coarse-step', type=float, default=1.2,
+                            help='Cascade scale step for the downscaled pass (fine pass uses 1.05)')
+        parser.add_argument('--no-refine', action='store_true',
+                            help='Skip the full-resolution refinement step')
+        parser.add_argument('--max-width', type=int, default=None,
+                            help='Give the candidate each frame as a JPEG decoded at reduced size, '
+                                 'as kiosk frames are with FRAME_DECODE_MAX_WIDTH')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Times to run each frame through each path')
+
+    def handle(self, *args, **options):
+        paths = sorted(glob.glob(os.path.join(options['images'], '*.jpg')) +
+                       glob.glob(os.path.join(options['images'], '*.png')))
+        frames = [f for f in (cv2.imread(p) for p in paths) if f is not None]
+        if not frames:
+            self.stdout.write(self.style.ERROR(f"No images found in {options['images']}"))
+            return
+
+        baseline_detector = create_detector('haar', detection_scale=1.0)
+        extra = {}
+        if options['detector'] in ('haar', 'lbp'):
+            extra['coarse_scale_factor'] = options['coarse_step']
+        candidate_detector = create_detector(
+            options['detector'],
+            detection_scale=options['scale'],
+            refine_detections=not options['no_refine'],
+            **extra
+        )
+
+        # Both backends see the same preprocessing as the live detect_faces()
+        inputs = []
+        reduced = []
+        for frame in frames:
+            if options['max_width']:
+                # The baseline gets the same JPEG, decoded at full size
+                data = cv2.imencode('.jpg', frame)[1].tobytes()
+                frame = decode_frame(data)[0]
+                small, factor = decode_frame(data, max_width=options['max_width'])
+                reduced.append((small, cv2.equalizeHist(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)), factor))
+            gray = cv2.equalizeHist(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+            inputs.append((frame, gray, 1))
+
+        baseline, baseline_time = self._run(baseline_detector, inputs, options['repeat'])
+        candidate, candidate_time = self._run(candidate_detector, reduced or inputs, options['repeat'])
+
+        # The full-resolution Haar detections are the reference for recall
+        expected = sum(len(faces) for faces in baseline)
+        found = 0
+        for reference, boxes in zip(baseline, candidate):
+            found += sum(1 for box in reference
+                         if any(_iou(box, other) >= 0.5 for other in boxes))
+        recall = found / expected if expected else 1.0
+
+        count = len(frames) * options['repeat']
+        self.stdout.write(f"Frames:       {len(frames)} x {options['repeat']}")
+        for label, detector, elapsed, results in (
+            ('Haar 1.0', baseline_detector, baseline_time, baseline),
+            (f"{options['detector']} {options['scale']}", candidate_detector, candidate_time, candidate),
+        ):
+            stats = detector.latency_stats()
+            self.stdout.write(f"{label:<13} {count / elapsed:.1f} fps, mean {stats['mean_ms']} ms/frame "
+                              f"over {stats['calls']} calls, {sum(len(faces) for faces in results)} faces")
+        self.stdout.write(self.style.SUCCESS(
+            f"Speedup {baseline_time / candidate_time:.2f}x, recall {recall:.1%} "
+            f"(detector={options['detector']}, scale={options['scale']}, refine={not options['no_refine']}, "
+            f"max_width={options['max_width']})"))
+
+    def _run(self, detector, inputs, repeat):
+        """Detect on every (frame, gray, decode factor); boxes are in original-image coordinates"""
+        results = []
+        start = time.perf_counter()
+        for _ in range(repeat):
+            results = [detector.detect(frame, gray, frame_scale=factor) * factor
+                       for frame, gray, factor in inputs]
+        return results, time.perf_counter() - start
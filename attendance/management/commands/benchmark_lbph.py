@@ -0,0 +1,76 @@
+import time
+
+import cv2
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from attendance.face_service import get_face_system
+from lbph_matcher import LBPHMatcher
+
+
+class Command(BaseCommand):
+    help = 'Compare OpenCV LBPH predict() with the batched NumPy matcher for speed and agreement'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--faces', type=int, default=16,
+                            help='Faces per simulated frame (default: 16)')
+        parser.add_argument('--frames', type=int, default=5,
+                            help='Number of frames to time')
+        parser.add_argument('--k', type=int, default=3,
+                            help='Candidate labels returned per face by the matcher')
+
+    def handle(self, *args, **options):
+        face_system = get_face_system()
+        recognizer = face_system.recognizer
+        samples = [sample for name in face_system.known_face_names
+                   for sample in face_system.face_samples.get(name, [])]
+        if not samples:
+            self.stdout.write(self.style.ERROR('No enrolled faces to benchmark against'))
+            return
+        if recognizer is None:
+            # The live model was extended without retraining, so it has no
+            # OpenCV recognizer: train one on the same gallery to compare with
+            labels = [label for label, name in enumerate(face_system.known_face_names)
+                      for _ in face_system.face_samples.get(name, [])]
+            recognizer = cv2.face.LBPHFaceRecognizer_create()
+            recognizer.train(samples, np.array(labels))
+
+        # Probes are gallery samples with a little noise, so both paths have real matches
+        rng = np.random.default_rng(0)
+        frames = []
+        for _ in range(options['frames']):
+            picks = rng.integers(0, len(samples), options['faces'])
+            frames.append([
+                np.clip(samples[i].astype(np.int16) + rng.integers(-8, 9, samples[i].shape), 0, 255).astype(np.uint8)
+                for i in picks
+            ])
+
+        start = time.perf_counter()
+        matcher = LBPHMatcher.from_recognizer(recognizer)
+        build_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        expected = [[recognizer.predict(face) for face in faces] for faces in frames]
+        opencv_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        results = [matcher.predict(faces, k=options['k']) for faces in frames]
+        numpy_time = time.perf_counter() - start
+
+        agree = 0
+        max_diff = 0.0
+        total = 0
+        for reference, (labels, dists) in zip(expected, results):
+            for (label, dist), got_label, got_dist in zip(reference, labels[:, 0], dists[:, 0]):
+                total += 1
+                agree += int(label == got_label)
+                max_diff = max(max_diff, abs(dist - got_dist))
+
+        self.stdout.write(f"Gallery:      {len(matcher)} histograms, {len(face_system.known_face_names)} users "
+                          f"(matcher built in {build_time * 1000:.1f} ms)")
+        self.stdout.write(f"Frames:       {options['frames']} x {options['faces']} faces")
+        self.stdout.write(f"OpenCV:       {opencv_time / options['frames'] * 1000:.1f} ms/frame")
+        self.stdout.write(f"NumPy batch:  {numpy_time / options['frames'] * 1000:.1f} ms/frame (top-{options['k']})")
+        self.stdout.write(self.style.SUCCESS(
+            f"Speedup {opencv_time / numpy_time:.2f}x, top-1 agreement {agree}/{total}, "
+            f"max distance difference {max_diff:.2e}"))
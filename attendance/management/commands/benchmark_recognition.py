@@ -0,0 +1,266 @@
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import cv2
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from attendance.face_service import SimpleFaceRecognitionSystem
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+FRAME_SIZE = (320, 240)
+BACKGROUND = (90, 90, 90)
+
+
+def _identity(seed: int, index: int) -> dict:
+    """Face geometry, skin tone and freckle pattern of one synthetic identity"""
+    rng = np.random.default_rng([seed, index])
+    return {
+        'width': rng.uniform(48, 60), 'height': rng.uniform(64, 76),
+        'eye_gap': rng.uniform(18, 26), 'eye_height': rng.uniform(12, 20),
+        'brow_tilt': rng.uniform(-4, 4),
+        'mouth_width': rng.uniform(14, 24), 'mouth_height': rng.uniform(28, 36),
+        'skin': tuple(float(v) for v in rng.uniform(120, 210, 3)),
+        'freckles': [(int(x), int(y)) for x, y in zip(rng.integers(-40, 41, 12), rng.integers(-50, 51, 12))],
+    }
+
+
+def _render(identity: dict, rng) -> np.ndarray:
+    """One webcam-like frame of an identity: random position, tilt, lighting and sensor noise"""
+    frame = np.full((FRAME_SIZE[1], FRAME_SIZE[0], 3), BACKGROUND[0], np.uint8)
+    cx = FRAME_SIZE[0] // 2 + int(rng.integers(-20, 21))
+    cy = FRAME_SIZE[1] // 2 + int(rng.integers(-10, 11))
+    skin = identity['skin']
+
+    cv2.ellipse(frame, (cx, cy), (int(identity['width']), int(identity['height'])), 0, 0, 360, skin, -1)
+    for x, y in identity['freckles']:
+        cv2.circle(frame, (cx + x, cy + y), 2, tuple(v * 0.7 for v in skin), -1)
+    for side in (-1, 1):
+        ex, ey = cx + int(side * identity['eye_gap']), cy - int(identity['eye_height'])
+        cv2.ellipse(frame, (ex, ey), (11, 6), 0, 0, 360, (255, 255, 255), -1)
+        cv2.circle(frame, (ex, ey), 5, (30, 30, 30), -1)
+        cv2.line(frame, (ex - 13, ey - 15), (ex + 13, ey - 15 - int(side * identity['brow_tilt'])), (40, 40, 60), 4)
+    cv2.line(frame, (cx, cy - 8), (cx - 4, cy + 15), (110, 120, 150), 3)
+    cv2.ellipse(frame, (cx, cy + int(identity['mouth_height'])), (int(identity['mouth_width']), 7),
+                0, 0, 360, (60, 60, 140), -1)
+
+    tilt = cv2.getRotationMatrix2D((cx, cy), float(rng.uniform(-6, 6)), 1.0)
+    frame = cv2.warpAffine(frame, tilt, FRAME_SIZE, borderValue=BACKGROUND)
+    frame = cv2.convertScaleAbs(frame, alpha=float(rng.uniform(0.85, 1.15)), beta=float(rng.uniform(-15, 15)))
+    return cv2.add(frame, rng.integers(0, 8, frame.shape, dtype=np.uint8))
+
+
+def _summary(seconds) -> dict:
+    """Latency percentiles in milliseconds"""
+    ms = np.asarray(seconds) * 1000
+    return {
+        'n': len(ms),
+        'mean_ms': round(float(ms.mean()), 3),
+        'p50_ms': round(float(np.percentile(ms, 50)), 3),
+        'p90_ms': round(float(np.percentile(ms, 90)), 3),
+        'p99_ms': round(float(np.percentile(ms, 99)), 3),
+        'max_ms': round(float(ms.max()), 3),
+    }
+
+
+def _traced_peak(run) -> float:
+    """Peak Python/NumPy memory allocated by one call, in KiB (OpenCV's own heap is not traced)"""
+    tracemalloc.start()
+    try:
+        run()
+        return round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+    finally:
+        tracemalloc.stop()
+
+
+def _max_rss_kib():
+    """High-water mark of this process's resident memory, in KiB"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux kilobytes
+    return peak // 1024 if platform.system() == 'Darwin' else peak
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=settings.BASE_DIR, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ('Benchmark enrollment, training, loading, detection and recognition against '
+            'synthetic galleries of increasing size; writes JSON results for comparing commits')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 10000],
+                            help='Gallery sizes in identities (default: 10 100 1000 10000)')
+        parser.add_argument('--samples', type=int, default=2,
+                            help='Stored samples per identity (default: 2)')
+        parser.add_argument('--registrations', type=int, default=20,
+                            help='register_face() calls timed per gallery size')
+        parser.add_argument('--probes', type=int, default=50,
+                            help='Frames timed through detect_faces() and recognize_faces()')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Runs of _train_recognizer() and load_encodings() per gallery size')
+        parser.add_argument('--recognizer', default=getattr(settings, 'FACE_RECOGNIZER', 'lbph'),
+                            help='Recognizer backend (default: FACE_RECOGNIZER)')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Seed for the synthetic identities and their frames')
+        parser.add_argument('--output', default='benchmark_recognition.json',
+                            help='Where to write the JSON results')
+        parser.add_argument('--compare', metavar='BASELINE',
+                            help='Earlier results file to print p50 changes against')
+
+    def handle(self, *args, **options):
+        results = {
+            'meta': {
+                'commit': _git_commit(),
+                'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'opencv': cv2.__version__,
+                'numpy': np.__version__,
+                'machine': platform.machine(),
+                'cpus': os.cpu_count(),
+                'options': {key: options[key] for key in
+                            ('sizes', 'samples', 'registrations', 'probes', 'repeat', 'recognizer', 'seed')},
+            },
+            'results': [],
+        }
+
+        for size in sorted(options['sizes']):
+            workdir = tempfile.mkdtemp(prefix='face-bench-')
+            try:
+                for operation, entry in self._run_size(size, workdir, options):
+                    entry = dict(size=size, operation=operation, **entry)
+                    results['results'].append(entry)
+                    self.stdout.write(f"{size:>6} {operation:<18} p50 {entry['p50_ms']:>10.2f} ms  "
+                                      f"p99 {entry['p99_ms']:>10.2f} ms  "
+                                      f"traced peak {entry['traced_peak_kib']:>10.1f} KiB")
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+        with open(options['output'], 'w') as f:
+            json.dump(results, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+        if options['compare']:
+            self._compare(options['compare'], results)
+
+    def _system(self, workdir, options) -> SimpleFaceRecognitionSystem:
+        # Background training with a long delay: register_face() is timed as
+        # the views see it (gallery update only), and the model update it
+        # queues is run and timed on its own
+        return SimpleFaceRecognitionSystem(
+            encodings_dir=os.path.join(workdir, 'encodings'),
+            models_dir=os.path.join(workdir, 'models'),
+            recognizer_backend=options['recognizer'],
+            embedding_model=getattr(settings, 'FACE_EMBEDDING_MODEL', None),
+            background_training=True,
+            training_delay=24 * 3600,
+        )
+
+    def _run_size(self, size, workdir, options):
+        """Yield (operation, stats) for one gallery size"""
+        seed = options['seed']
+        system = self._system(workdir, options)
+
+        # Identities 0..size-1 are the gallery; later ones are enrolled and probed
+        start = time.perf_counter()
+        gallery = {}
+        for index in range(size):
+            rng = np.random.default_rng([seed, index, 0])
+            identity = _identity(seed, index)
+            rois = []
+            while len(rois) < options['samples']:
+                faces, gray = system.detect_faces(_render(identity, rng))
+                if len(faces) == 1:
+                    rois.append(system.preprocessor.face(gray, faces[0]))
+            gallery[f"user{index:05d}"] = rois
+        system.sample_store.extend(gallery)
+        del gallery
+        system.rebuild()
+        self.stdout.write(f"{size:>6} gallery of {size * options['samples']} samples "
+                          f"built in {time.perf_counter() - start:.1f} s")
+
+        # register_face: new identities enrolled on top of the gallery, with
+        # their frames rendered before timing starts
+        def register(index):
+            rng = np.random.default_rng([seed, index, 1])
+            identity = _identity(seed, index)
+            frames = [_render(identity, rng) for _ in range(options['samples'])]
+            return lambda: system.register_face(f"user{index:05d}", frames=frames)
+
+        # model_update: the incremental retrain and snapshot publish that
+        # makes each enrollment recognizable, run synchronously after it
+        calls = [register(size + i) for i in range(options['registrations'] + 1)]
+        register_times, update_times = [], []
+        for call in calls[:-1]:
+            register_times.append(self._time(call, 1)[0])
+            update_times.append(self._time(system._rebuild_model, 1)[0])
+        yield 'register_face', self._entry(register_times, calls[-1])
+        yield 'model_update', self._entry(update_times, system._rebuild_model)
+
+        # _train_recognizer over the whole gallery, including the enrollments
+        names, samples = system.sample_store.load()
+        run = lambda: system._train_recognizer(names, samples)
+        yield '_train_recognizer', self._entry(self._time(run, options['repeat']), run)
+        del names, samples
+        system.rebuild()
+
+        # load_encodings: every call reads the published snapshot in full
+        loader = self._system(workdir, options)
+        yield 'load_encodings', self._entry(self._time(loader.load_encodings, options['repeat']),
+                                            loader.load_encodings)
+
+        # detect_faces / recognize_faces on frames of enrolled identities
+        rng = np.random.default_rng([seed, size, 2])
+        frames = [_render(_identity(seed, int(i)), rng)
+                  for i in rng.integers(0, size + options['registrations'], options['probes'])]
+        system.recognize_faces(frames[0])
+        for operation, method in (('detect_faces', system.detect_faces),
+                                  ('recognize_faces', system.recognize_faces)):
+            times = [self._time(lambda: method(frame), 1)[0] for frame in frames]
+            yield operation, self._entry(times, lambda: method(frames[0]))
+
+    def _time(self, run, repeat):
+        times = []
+        for _ in range(repeat):
+            begin = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - begin)
+        return times
+
+    def _entry(self, times, traced_run) -> dict:
+        """Latency summary plus traced peak allocation of one more run and the process RSS peak"""
+        entry = _summary(times)
+        entry['traced_peak_kib'] = _traced_peak(traced_run)
+        entry['max_rss_kib'] = _max_rss_kib()
+        return entry
+
+    def _compare(self, path, results):
+        with open(path) as f:
+            baseline = {(r['size'], r['operation']): r for r in json.load(f)['results']}
+        self.stdout.write(f"p50 change against {path}:")
+        for entry in results['results']:
+            before = baseline.get((entry['size'], entry['operation']))
+            if before is None or not before['p50_ms']:
+                continue
+            change = (entry['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100
+            style = self.style.ERROR if change > 10 else self.style.SUCCESS if change < -10 else str
+            self.stdout.write(style(f"{entry['size']:>6} {entry['operation']:<18} "
+                                    f"{before['p50_ms']:>10.2f} -> {entry['p50_ms']:>10.2f} ms ({change:+.1f}%)"))
@@ -0,0 +1,50 @@
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from attendance.face_service import get_face_system
+from face_embeddings import FaceEmbedder, calibrated_threshold, calibration_scores
+
+
+class Command(BaseCommand):
+    help = ('Measure SFace similarities between the enrolled samples and the embedding match '
+            'threshold that keeps false accepts at a target rate')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--false-accept-rate', type=float, default=0.001,
+                            help='Share of samples allowed to match another user (default: 0.001)')
+
+    def handle(self, *args, **options):
+        face_system = get_face_system()
+        try:
+            embedder = face_system.embedder or FaceEmbedder(getattr(settings, 'FACE_EMBEDDING_MODEL', None))
+        except FileNotFoundError as e:
+            raise CommandError(str(e))
+        vectors, labels = [], []
+        for label, name in enumerate(face_system.known_face_names):
+            samples = face_system.face_samples.get(name, [])
+            if samples:
+                vectors.append(embedder.embed(samples))
+                labels.append(np.full(len(samples), label, dtype=np.int32))
+        if len(vectors) < 2:
+            raise CommandError('Calibration needs at least two enrolled users')
+
+        # Every stored sample probes the rest of the gallery, as a live face would
+        genuine, impostor = calibration_scores(np.vstack(vectors), np.concatenate(labels))
+        genuine = genuine[~np.isnan(genuine)]
+        rate = options['false_accept_rate']
+        threshold = calibrated_threshold(impostor, rate)
+        current = face_system.embedding_threshold
+
+        self.stdout.write(f"Samples:      {len(impostor)} of {len(vectors)} users")
+        for label, scores in (('Same user', genuine), ('Other users', impostor)):
+            if len(scores):
+                p5, p50, p95 = np.percentile(scores, (5, 50, 95))
+                self.stdout.write(f"{label + ':':<13} p5 {p5:.3f}, median {p50:.3f}, p95 {p95:.3f}")
+        for name, value in (('Current', current), ('Calibrated', threshold)):
+            accepted = np.mean(genuine >= value) if len(genuine) else float('nan')
+            false = np.mean(impostor >= value)
+            self.stdout.write(f"{name + ':':<13} {value:.3f}: {accepted:.1%} of samples match their user, "
+                              f"{false:.2%} match another")
+        self.stdout.write(self.style.SUCCESS(
+            f"FACE_EMBEDDING_THRESHOLD = {threshold:.3f}  (false accept rate {rate:g})"))
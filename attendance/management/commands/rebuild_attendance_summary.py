@@ -0,0 +1,24 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from attendance import counters, trends
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily attendance summary used by the statistics trends from attendance records'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', metavar='YYYY-MM-DD',
+                            help='Only rebuild days from this date on (default: all days)')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = datetime.strptime(options['since'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('--since must be a date in YYYY-MM-DD form')
+        days = trends.rebuild(since)
+        counters.invalidate()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt the attendance summary for {days} days'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from attendance.face_service import get_face_system
+
+
+class Command(BaseCommand):
+    help = 'Retrain the LBPH face recognizer from every stored face sample'
+
+    def handle(self, *args, **options):
+        face_system = get_face_system()
+        face_system.rebuild()
+        users = face_system.get_registered_users()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt face model for {len(users)} registered users'))
@@ -0,0 +1,37 @@
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def build_summary(apps, schema_editor):
+    Attendance = apps.get_model('attendance', 'Attendance')
+    DailyAttendanceSummary = apps.get_model('attendance', 'DailyAttendanceSummary')
+    DailyAttendanceSummary.objects.bulk_create([
+        DailyAttendanceSummary(date=row['date'], present=row['present'])
+        for row in Attendance.objects.order_by().values('date').annotate(present=Count('id'))
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0003_lecturesession'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['date'], name='attendance_record_date_idx'),
+        ),
+        migrations.CreateModel(
+            name='DailyAttendanceSummary',
+            fields=[
+                ('date', models.DateField(primary_key=True, serialize=False)),
+                ('present', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'attendance_daily_summary',
+                'ordering': ['date'],
+            },
+        ),
+        migrations.RunPython(build_summary, migrations.RunPython.noop),
+    ]
@@ -28,10 +28,23 @@ class Attendance(models.Model):
         db_table = 'attendance_record'
         ordering = ['-timestamp']
         unique_together = ['user', 'date']  # One attendance per user per day
+        indexes = [models.Index(fields=['date'], name='attendance_record_date_idx')]
     
     def __str__(self):
         return f"{self.user.name} - {self.date}"
 
+class DailyAttendanceSummary(models.Model):
+    """Number of teachers present per day, kept up to date as attendance is marked"""
+    date = models.DateField(primary_key=True)
+    present = models.IntegerField(default=0)
+    
+    class Meta:
+        db_table = 'attendance_daily_summary'
+        ordering = ['date']
+    
+    def __str__(self):
+        return f"{self.date}: {self.present} present"
+
 class Timetable(models.Model):
     DAYS_OF_WEEK = (
         (0, 'Monday'),
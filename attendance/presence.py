@@ -0,0 +1,145 @@
+"""
+Today's attendance, kept in memory for the kiosk write path
+
+A teacher standing at a kiosk is recognized on every poll, but only the
+first sighting of the day writes anything. PresentToday remembers who has
+been marked today (and their names, for the response), so later sightings
+cost no queries. New faces in a frame are looked up with one query, which
+also says whether each was already marked today (by another worker), and
+only the unmarked ones are inserted, with one bulk_create.
+
+Other workers mark attendance too, and records can be deleted, so the set
+is reloaded from the database (one query) at the start of each day and
+every ATTENDANCE_PRESENCE_REFRESH seconds. Deletions in this worker are
+applied at once through signals. A teacher marked by another worker
+since the last refresh is reported as already marked, and so is one
+another worker inserted between this worker's lookup and its insert (the
+unique constraint drops the second insert, and only rows carrying this
+call's timestamp count as its own).
+"""
+import threading
+import time
+from datetime import date
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import counters, trends
+from .models import User, Attendance
+
+
+class PresentToday:
+    """user_id -> name of everyone marked today, shared by the threads of a worker"""
+
+    def __init__(self, refresh: float = 30.0):
+        self.refresh = refresh
+        self._day = None
+        self._loaded_at = 0.0
+        self._names = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.marked = 0
+        self.reloads = 0
+
+    def mark(self, user_ids):
+        """
+        Mark attendance for today for the given user ids
+
+        Returns {user_id: (name, created)} for the ids that are registered
+        users; created is True for the ones whose record this call inserted.
+        """
+        today = date.today()
+        result = {}
+        with self._lock:
+            names = self._current(today)
+            new_ids = []
+            for user_id in dict.fromkeys(user_ids):
+                if user_id in names:
+                    result[user_id] = (names[user_id], False)
+                else:
+                    new_ids.append(user_id)
+            self.hits += len(result)
+        if not new_ids:
+            return result
+
+        # Registered users among the new ids, and whether another worker marked them today
+        users = list(User.objects.filter(user_id__in=new_ids).annotate(
+            marked=Exists(Attendance.objects.filter(user=OuterRef('pk'), date=today))
+        ).only('user_id', 'name'))
+        unmarked = [user for user in users if not user.marked]
+        inserted = set()
+        if unmarked:
+            now = timezone.now()
+            Attendance.objects.bulk_create(
+                [Attendance(user=user, date=today, time=now.time(), timestamp=now) for user in unmarked],
+                ignore_conflicts=True,
+            )
+            # Conflicting rows were skipped without telling which; ours carry this timestamp
+            inserted = set(Attendance.objects.filter(
+                user__in=unmarked, date=today, timestamp=now).order_by().values_list('user_id', flat=True))
+            # bulk_create sends no post_save
+            trends.refresh_day(today)
+            counters.invalidate()
+        if users:
+            with self._lock:
+                if self._day == today:
+                    for user in users:
+                        self._names[user.user_id] = user.name
+                self.marked += len(inserted)
+        for user in users:
+            result[user.user_id] = (user.name, user.user_id in inserted)
+        return result
+
+    def discard(self, user_id, day=None):
+        """Forget a mark (for today, or only if day is today)"""
+        with self._lock:
+            if day is None or day == self._day:
+                self._names.pop(user_id, None)
+
+    def rename(self, user_id, name):
+        with self._lock:
+            if user_id in self._names:
+                self._names[user_id] = name
+
+    def stats(self):
+        with self._lock:
+            return {
+                'day': self._day.isoformat() if self._day else None,
+                'present': len(self._names),
+                'hits': self.hits,
+                'marked': self.marked,
+                'reloads': self.reloads,
+            }
+
+    def _current(self, today):
+        """Today's names, reloaded on a new day or when the copy is stale (lock held)"""
+        now = time.monotonic()
+        if self._day != today or now - self._loaded_at >= self.refresh:
+            self._names = dict(
+                Attendance.objects.filter(date=today).values_list('user_id', 'user__name')
+            )
+            self._day = today
+            self._loaded_at = now
+            self.reloads += 1
+        return self._names
+
+
+present_today = PresentToday(refresh=getattr(settings, 'ATTENDANCE_PRESENCE_REFRESH', 30.0))
+
+
+@receiver(post_delete, sender=Attendance)
+def _attendance_deleted(sender, instance, **kwargs):
+    present_today.discard(instance.user_id, instance.date)
+
+
+@receiver(post_delete, sender=User)
+def _user_deleted(sender, instance, **kwargs):
+    present_today.discard(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def _user_saved(sender, instance, **kwargs):
+    present_today.rename(instance.user_id, instance.name)
@@ -0,0 +1,152 @@
+"""
+WebSocket kiosk stream, served next to Django by the ASGI application
+
+A kiosk page connects to /ws/kiosk/?kiosk_id=... and sends each camera
+frame as one binary message (JPEG bytes). Every processed frame gets a
+text message back with the same body as /mark-attendance/process/, plus:
+
+    type        "result"
+    seq         number of the frame this result is for (1 = first sent)
+    dropped     frames of this connection skipped as stale so far
+    latency_ms  time from receiving the frame to sending its result
+
+Stream frames share the admission controller's in-flight limit with the
+HTTP recognition views (see admission.py), but never wait for a slot: a
+frame arriving when all are taken is answered at once with the busy body
+of a 429 ('busy', 'reason', 'retry_after'), and the kiosk pauses for
+retry_after. The per-kiosk rate limit does not apply, since a connection
+has only one frame in flight anyway.
+
+Recognition runs on a shared thread pool, off the event loop. Each
+connection holds at most one waiting frame: a frame that arrives while
+the previous one is still being processed replaces any frame still
+waiting, so a kiosk that sends faster than the server can keep up gets
+results for its newest frames instead of a growing backlog.
+"""
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .admission import admission
+from .instrumentation import metrics
+from .kiosk import process_kiosk_frame
+
+STREAM_PATH = '/ws/kiosk/'
+
+metrics.counter('face_stream_frames_total', 'Kiosk stream frames by outcome (processed, busy or dropped)')
+
+_executor = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        workers = getattr(settings, 'FACE_STREAM_WORKERS', None) or os.cpu_count() or 1
+        _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='kiosk-stream')
+    return _executor
+
+
+def _process(image_bytes, kiosk_id) -> dict:
+    """One frame on a pool thread, if admitted, with the connection handling of a Django request"""
+    rejection = admission.acquire(None, wait=False)
+    if rejection is not None:
+        reason, retry_after = rejection
+        metrics.inc('face_admission_rejected_total', endpoint='kiosk_stream', reason=reason)
+        return {
+            'success': False,
+            'busy': True,
+            'reason': reason,
+            'retry_after': round(retry_after, 2),
+            'message': 'Server busy, please try again shortly.',
+        }
+
+    admitted = time.perf_counter()
+    close_old_connections()
+    try:
+        return process_kiosk_frame(image_bytes, kiosk_id, metrics.stages('face_stage_seconds'))
+    except Exception as e:
+        return {'success': False, 'message': f'Server error: {str(e)}'}
+    finally:
+        close_old_connections()
+        admission.release(time.perf_counter() - admitted)
+
+
+class KioskStream:
+    """Processes the newest frame of one kiosk connection at a time"""
+
+    def __init__(self, kiosk_id, send):
+        self.kiosk_id = kiosk_id
+        self.send = send
+        self.received = 0
+        self.dropped = 0
+        self._pending = None
+        self._ready = asyncio.Event()
+
+    def push(self, image_bytes):
+        """Queue a frame, replacing one that is still waiting"""
+        self.received += 1
+        if self._pending is not None:
+            self.dropped += 1
+            metrics.inc('face_stream_frames_total', result='dropped')
+        self._pending = (self.received, image_bytes, time.perf_counter())
+        self._ready.set()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            seq, image_bytes, received_at = self._pending
+            self._pending = None
+
+            body = await loop.run_in_executor(_get_executor(), _process, image_bytes, self.kiosk_id)
+            elapsed = time.perf_counter() - received_at
+            metrics.inc('face_stream_frames_total', result='busy' if body.get('busy') else 'processed')
+            metrics.observe('face_request_seconds', elapsed, endpoint='kiosk_stream')
+
+            body.update(type='result', seq=seq, dropped=self.dropped, latency_ms=round(elapsed * 1000, 1))
+            await self.send({'type': 'websocket.send', 'text': json.dumps(body)})
+
+
+async def kiosk_stream(scope, receive, send):
+    """ASGI WebSocket handler for one kiosk connection"""
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+    query = parse_qs(scope.get('query_string', b'').decode())
+    kiosk_id = query.get('kiosk_id', [None])[0]
+    await send({'type': 'websocket.accept'})
+
+    stream = KioskStream(kiosk_id, send)
+    worker = asyncio.ensure_future(stream.run())
+    try:
+        while True:
+            message = await receive()
+            if message['type'] == 'websocket.disconnect':
+                break
+            if message.get('bytes'):
+                stream.push(message['bytes'])
+            if worker.done():
+                # The result could not be sent; the client has gone
+                break
+    finally:
+        worker.cancel()
+
+
+def with_kiosk_stream(django_application):
+    """ASGI application serving kiosk streams at STREAM_PATH and everything else with Django"""
+    async def application(scope, receive, send):
+        if scope['type'] == 'websocket':
+            if scope['path'] == STREAM_PATH:
+                return await kiosk_stream(scope, receive, send)
+            # Reject other WebSocket paths before accepting them
+            await receive()
+            return await send({'type': 'websocket.close', 'code': 4404})
+        return await django_application(scope, receive, send)
+    return application
@@ -1,3 +1,844 @@
-from django.test import TestCase
+import importlib
+import json
+import os
+from datetime import date, time, timedelta
+import pickle
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+import cv2
+import numpy as np
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.db.models import Count
+from django.http import JsonResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from . import admission as admission_module
+from . import face_service, trends
+from .face_service import SimpleFaceRecognitionSystem  # noqa: F401 (puts src/ on sys.path)
+from .management.commands.benchmark_recognition import _identity, _render
+from .models import Attendance, DailyAttendanceSummary, LectureAttendance, Timetable, User
+from .presence import PresentToday
+import simple_face_recognition
+from detection_tuning import DetectionTuner
+from face_detectors import create_detector
+from face_embeddings import EmbeddingIndex, calibrated_threshold, calibration_scores
+from face_gallery import SampleStore
+from face_tracking import FaceTracker
+from frame_filter import FrameFilter
+from lbph_matcher import LBPHMatcher
+from frame_decoding import decode_frame
+from load_shedding import AdmissionController
+from model_snapshot import SnapshotStore
+from preprocessing import FramePreprocessor
+from sample_selection import select_samples
+from training_queue import TrainingQueue
+from .views import _kiosk_id, face_readiness
+
+
+def _face(index: int, seed: int) -> np.ndarray:
+    """A preprocessed 200x200 face of a synthetic identity, as stored in the gallery"""
+    frame = _render(_identity(1, index), np.random.default_rng(seed))
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return FramePreprocessor().face(gray, (90, 40, 140, 160))
+
+
+class SampleSelectionTests(SimpleTestCase):
+    def test_near_duplicate_burst_keeps_one_sample(self):
+        # A still face: the same frame with a little sensor noise each time
+        face = _face(0, 0)
+        rng = np.random.default_rng(1)
+        burst = [np.clip(face.astype(int) + rng.integers(-1, 2, face.shape), 0, 255).astype(np.uint8)
+                 for _ in range(8)]
+
+        self.assertEqual(len(select_samples(burst, budget=10)), 1)
+
+    def test_distinct_samples_under_budget_are_kept(self):
+        samples = [_face(0, seed) for seed in range(6)]
+
+        self.assertEqual(select_samples(samples, budget=10), list(range(6)))
+
+    def test_budget_still_applies(self):
+        samples = [_face(0, seed) for seed in range(6)]
+
+        self.assertEqual(len(select_samples(samples, budget=4)), 4)
+
+    def test_redundancy_zero_keeps_every_sample_under_budget(self):
+        face = _face(0, 0)
+
+        self.assertEqual(select_samples([face] * 3, budget=10, redundancy=0.0), [0, 1, 2])
+
+
+class TempDirTestCase(SimpleTestCase):
+    """Gives each test a scratch directory, removed afterwards"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, True)
+
+
+def _samples(seed: int, count: int):
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 256, (200, 200), dtype=np.uint8) for _ in range(count)]
+
+
+class SampleStoreTests(TempDirTestCase):
+    def assertSamplesEqual(self, actual, expected):
+        self.assertEqual(len(actual), len(expected))
+        for a, b in zip(actual, expected):
+            np.testing.assert_array_equal(a, b)
+
+    def test_append_round_trips_through_a_new_store(self):
+        alice, bob = _samples(1, 3), _samples(2, 2)
+        store = SampleStore(self.tmp)
+        store.load()
+        store.append('alice', alice)
+        store.extend({'bob': bob, 'alice': alice[:1]})
+
+        names, samples = SampleStore(self.tmp).load()
+
+        self.assertEqual(names, ['alice', 'bob'])
+        self.assertSamplesEqual(samples['alice'], alice + alice[:1])
+        self.assertSamplesEqual(samples['bob'], bob)
+
+    def test_every_change_bumps_the_revision(self):
+        store = SampleStore(self.tmp)
+        store.load()
+        store.append('alice', _samples(1, 1))
+        store.append('bob', _samples(2, 1))
+        store.remove('alice')
+
+        self.assertEqual(store.revision, 3)
+        self.assertEqual(SampleStore(self.tmp).read_revision(), 3)
+
+    def test_compact_reclaims_dead_rows_and_keeps_samples(self):
+        alice, bob = _samples(1, 3), _samples(2, 2)
+        store = SampleStore(self.tmp)
+        store.load()
+        store.extend({'alice': alice, 'bob': bob, 'carol': _samples(3, 2)})
+        store.replace('alice', [0, 2], [])
+        store.remove('carol')
+        self.assertEqual(store.dead_rows(), 3)
+        old_path = store.samples_path
+
+        store.compact()
+
+        self.assertEqual(store.dead_rows(), 0)
+        self.assertEqual(store.count, 4)
+        # Published models may still map the old file; snapshot pruning removes it
+        self.assertTrue(os.path.exists(old_path))
+        names, samples = SampleStore(self.tmp).load()
+        self.assertEqual(names, ['alice', 'bob'])
+        self.assertSamplesEqual(samples['alice'], [alice[0], alice[2]])
+        self.assertSamplesEqual(samples['bob'], bob)
+
+    def test_pickled_gallery_is_migrated_once(self):
+        alice = _samples(1, 2)
+        names_file = os.path.join(self.tmp, 'names.pkl')
+        samples_file = os.path.join(self.tmp, 'samples.pkl')
+        with open(names_file, 'wb') as f:
+            pickle.dump(['alice', 'bob'], f)
+        with open(samples_file, 'wb') as f:
+            pickle.dump({'alice': alice}, f)
+        store = SampleStore(os.path.join(self.tmp, 'store'))
+
+        self.assertTrue(store.migrate_from_pickles(names_file, samples_file))
+        self.assertFalse(store.migrate_from_pickles(names_file, samples_file))
+
+        names, samples = SampleStore(store.directory).load()
+        self.assertEqual(names, ['alice', 'bob'])
+        self.assertSamplesEqual(samples['alice'], alice)
+        self.assertNotIn('bob', samples)
+        # The pickles stay behind as a backup
+        self.assertTrue(os.path.exists(names_file))
+
+
+class LBPHMatcherTests(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        # Three samples of each of six synthetic identities, and a new probe of each
+        self.gallery = {label: [_face(label, seed) for seed in range(3)] for label in range(6)}
+        self.probes = np.stack([_face(label, 10) for label in range(6)])
+
+    def _train(self, gallery):
+        recognizer = cv2.face.LBPHFaceRecognizer_create()
+        faces = [face for label in sorted(gallery) for face in gallery[label]]
+        labels = [label for label in sorted(gallery) for _ in gallery[label]]
+        recognizer.train(faces, np.array(labels, dtype=np.int32))
+        return recognizer
+
+    def assertMatchesOpenCV(self, matcher, recognizer):
+        labels, distances = matcher.predict(self.probes)
+        for probe, label, distance in zip(self.probes, labels[:, 0], distances[:, 0]):
+            expected_label, expected_distance = recognizer.predict(probe)
+            self.assertEqual(label, expected_label)
+            self.assertAlmostEqual(distance, expected_distance, delta=1e-4 * expected_distance)
+
+    def test_predict_matches_opencv(self):
+        recognizer = self._train(self.gallery)
+        matcher = LBPHMatcher.from_recognizer(recognizer)
+        self.assertMatchesOpenCV(matcher, recognizer)
+
+        # k nearest labels, each once, in ascending distance
+        labels, distances = matcher.predict(self.probes, k=3)
+        self.assertEqual(labels.shape, (6, 3))
+        self.assertTrue(all(len(set(row)) == 3 for row in labels))
+        self.assertTrue((np.diff(distances, axis=1) >= 0).all())
+
+    def test_with_labels_matches_a_retrained_model(self):
+        matcher = LBPHMatcher.from_recognizer(self._train(self.gallery))
+        extract = matcher.extract
+
+        # Replace one user's samples, add a user, then remove one
+        gallery = dict(self.gallery)
+        gallery[2] = [_face(2, seed) for seed in range(20, 23)]
+        gallery[6] = [_face(6, seed) for seed in range(3)]
+        updated = matcher.with_labels({2: extract(gallery[2]), 6: extract(gallery[6])})
+        self.probes = np.concatenate([self.probes, [_face(6, 10)]])
+        self.assertEqual(len(updated), 21)
+        self.assertMatchesOpenCV(updated, self._train(gallery))
+
+        del gallery[4]
+        removed = updated.with_labels({4: []})
+        self.assertEqual(len(removed), 18)
+        self.assertMatchesOpenCV(removed, self._train(gallery))
+        self.assertNotIn(4, removed.predict(self.probes, k=6)[0])
+
+        # Matchers are never modified by deriving new ones
+        self.assertEqual(len(matcher), 18)
+        self.assertEqual(len(updated), 21)
+
+    def test_save_load_round_trip(self):
+        recognizer = self._train(self.gallery)
+        matcher = LBPHMatcher.from_recognizer(recognizer)
+        segments_dir = os.path.join(self.tmp, 'segments')
+        first, second = os.path.join(self.tmp, '1'), os.path.join(self.tmp, '2')
+        os.makedirs(first)
+        os.makedirs(second)
+        self.assertIsNone(LBPHMatcher.load(first, segments_dir))
+
+        matcher.save(first, segments_dir)
+        loaded = LBPHMatcher.load(first, segments_dir)
+        self.assertMatchesOpenCV(loaded, recognizer)
+        np.testing.assert_array_equal(loaded.distances(loaded.extract(self.probes)),
+                                      matcher.distances(matcher.extract(self.probes)))
+
+        # A derived matcher only writes its new segment and shares the rest
+        updated = loaded.with_labels({0: loaded.extract([_face(0, 30)])})
+        updated.save(second, segments_dir)
+        names = LBPHMatcher.segment_names(second)
+        self.assertEqual(names[0], LBPHMatcher.segment_names(first)[0])
+        self.assertEqual(sorted(os.listdir(segments_dir)), sorted(names))
+        reloaded = LBPHMatcher.load(second, segments_dir)
+        for a, b in zip(reloaded.predict(self.probes, k=3), updated.predict(self.probes, k=3)):
+            np.testing.assert_array_equal(a, b)
+
+
+class FaceTrackerTests(SimpleTestCase):
+    def setUp(self):
+        self.tracker = FaceTracker(iou_threshold=0.3, reverify_interval=10.0, max_missed=1,
+                                   max_gap=1.0, max_jump=0.25, appearance_threshold=0.1)
+
+    def _start(self, boxes, now=0.0):
+        """Tracks for boxes, each recognized as user<i> by model version 1"""
+        return [self.tracker.remember(box, None, (f'user{i}', 0.9, []), 1, now)
+                for i, box in enumerate(boxes)]
+
+    def test_boxes_follow_the_track_they_overlap_most(self):
+        left, right = self._start([(0, 0, 100, 100), (200, 0, 100, 100)])
+        # Listed in the other order, each shifted by 10 px; the third overlaps nothing
+        tracks = self.tracker.associate([(210, 0, 100, 100), (10, 0, 100, 100), (500, 500, 100, 100)], 0.1)
+        self.assertEqual(tracks, [right, left, None])
+        self.assertEqual(left.box, (10, 0, 100, 100))
+        self.assertFalse(self.tracker.needs_recognition(left, 1, 0.1))
+        # Overlap below the IoU threshold (40 px of 100 shared: IoU 0.25) starts a new face
+        self.assertEqual(self.tracker.associate([(70, 0, 100, 100)], 0.2), [None])
+
+    def test_identity_is_reverified_when_due_or_changed(self):
+        track, = self._start([(0, 0, 100, 100)])
+        self.tracker.associate([(0, 0, 100, 100)], 0.5)
+        self.assertFalse(self.tracker.needs_recognition(track, 1, 0.5))
+        # Reverification interval, a new model, an unknown face
+        self.assertTrue(self.tracker.needs_recognition(track, 1, 10.0))
+        self.assertTrue(self.tracker.needs_recognition(track, 2, 0.5))
+        track.name = 'Unknown'
+        self.assertTrue(self.tracker.needs_recognition(track, 1, 0.5))
+
+    def test_identity_is_reverified_when_the_face_looks_different(self):
+        face = _face(0, 0)
+        verified, moved, other = self.tracker.describe([face, np.roll(face, 3, axis=1), face[::-1]])
+        track = self.tracker.remember((0, 0, 100, 100), None, ('user0', 0.9, []), 1, 0.0, verified)
+        self.tracker.associate([(0, 0, 100, 100)], 0.1)
+        self.assertFalse(self.tracker.needs_recognition(track, 1, 0.1, moved))
+        self.assertTrue(self.tracker.needs_recognition(track, 1, 0.1, other))
+
+    def test_tracks_expire_and_gaps_or_jumps_break_continuity(self):
+        track, = self._start([(0, 0, 100, 100)])
+        # Seen again after longer than max_gap
+        self.assertEqual(self.tracker.associate([(0, 0, 100, 100)], 2.0), [track])
+        self.assertTrue(self.tracker.needs_recognition(track, 1, 2.0))
+        # Resized by more than max_jump
+        self.assertEqual(self.tracker.associate([(0, 0, 130, 130)], 2.1), [track])
+        self.assertTrue(self.tracker.needs_recognition(track, 1, 2.1))
+        self.assertEqual(self.tracker.associate([(0, 0, 130, 130)], 2.2), [track])
+        self.assertFalse(self.tracker.needs_recognition(track, 1, 2.2))
+
+        # One missed frame is tolerated (not continuous), the second drops the track
+        self.tracker.associate([], 2.3)
+        self.assertEqual(self.tracker.associate([(0, 0, 130, 130)], 2.4), [track])
+        self.assertTrue(self.tracker.needs_recognition(track, 1, 2.4))
+        self.tracker.associate([], 2.5)
+        self.tracker.associate([], 2.6)
+        self.assertEqual(self.tracker.tracks, [])
+        self.assertEqual(self.tracker.associate([(0, 0, 130, 130)], 2.7), [None])
+
+
+class FrameFilterTests(SimpleTestCase):
+    def setUp(self):
+        self.filter = FrameFilter(min_brightness=40.0, max_brightness=220.0, min_sharpness=15.0,
+                                  min_change=2.0, analysis_width=320)
+        rng = np.random.default_rng(0)
+        self.scene = rng.integers(60, 200, (480, 640), dtype=np.uint8)
+        self.other = rng.integers(60, 200, (480, 640), dtype=np.uint8)
+
+    def test_brightness_and_sharpness_thresholds(self):
+        self.assertEqual(self.filter.check(np.full((480, 640), 30, np.uint8)), 'too_dark')
+        self.assertEqual(self.filter.check(np.full((480, 640), 230, np.uint8)), 'too_bright')
+        # Mid-grey with no detail at all
+        self.assertEqual(self.filter.check(np.full((480, 640), 128, np.uint8)), 'blurry')
+        self.assertIsNone(self.filter.check(self.scene))
+        self.assertIsNone(self.filter.check(cv2.cvtColor(self.scene, cv2.COLOR_GRAY2BGR)))
+
+    def test_unchanged_frames_of_a_camera_are_skipped(self):
+        self.assertIsNone(self.filter.check(self.scene, key='kiosk'))
+        # Same scene, one grey level brighter: below min_change
+        self.assertEqual(self.filter.check(cv2.add(self.scene, 1), key='kiosk'), 'unchanged')
+        self.assertIsNone(self.filter.check(self.scene, key='other kiosk'))
+        self.assertIsNone(self.filter.check(self.scene))
+        # Five grey levels brighter is a change, and becomes the new reference
+        self.assertIsNone(self.filter.check(cv2.add(self.scene, 5), key='kiosk'))
+        self.assertEqual(self.filter.check(cv2.add(self.scene, 5), key='kiosk'), 'unchanged')
+        self.assertIsNone(self.filter.check(self.other, key='kiosk'))
+
+        stats = self.filter.stats()
+        self.assertEqual((stats['checked'], stats['accepted']), (7, 5))
+        self.assertEqual(stats['rejected']['unchanged'], 2)
+
+
+class EmbeddingCalibrationTests(SimpleTestCase):
+    def test_scores_match_a_leave_one_out_search(self):
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(40, 128)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        labels = np.repeat(np.arange(10), 4)
+        labels[-1] = 10  # a user with a single sample
+        genuine, impostor = calibration_scores(vectors, labels, chunk_rows=7)
+
+        for row in range(len(labels)):
+            rest = np.arange(len(labels)) != row
+            found, scores = EmbeddingIndex(vectors[rest], labels[rest]).search(vectors[row], k=11)
+            own = scores[0][found[0] == labels[row]]
+            self.assertAlmostEqual(impostor[row], scores[0][found[0] != labels[row]][0], places=5)
+            if len(own):
+                self.assertAlmostEqual(genuine[row], own[0], places=5)
+            else:
+                self.assertTrue(np.isnan(genuine[row]))
+
+    def test_threshold_admits_at_most_the_target_share_of_impostors(self):
+        impostor = np.linspace(0.0, 0.99, 100)
+        self.assertEqual(np.sum(impostor >= calibrated_threshold(impostor, 0.05)), 5)
+        self.assertEqual(np.sum(impostor >= calibrated_threshold(impostor, 0.001)), 0)
+        self.assertLessEqual(calibrated_threshold(impostor, 0.05), 0.95)
+        with self.assertRaises(ValueError):
+            calibrated_threshold(np.array([np.nan]), 0.01)
+
+
+class SnapshotStoreTests(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.store = SampleStore(os.path.join(self.tmp, 'encodings'))
+        self.store.load()
+        self.store.append('alice', _samples(1, 2))
+        self.snapshots = SnapshotStore(os.path.join(self.tmp, 'models'))
+
+    def _trained(self):
+        recognizer = cv2.face.LBPHFaceRecognizer_create()
+        recognizer.train(_samples(1, 2), np.array([0, 0]))
+        return recognizer
+
+    def test_publish_hands_out_increasing_versions(self):
+        self.assertEqual(self.snapshots.current_version(), 0)
+
+        with self.snapshots.write_lock():
+            first = self.snapshots.publish(self._trained(), self.store.index_path)
+            second = self.snapshots.publish(None, self.store.index_path)
+
+        self.assertEqual((first, second), (1, 2))
+        self.assertEqual(self.snapshots.current_version(), 2)
+        self.assertEqual(SnapshotStore(self.snapshots.models_dir).current_version(), 2)
+
+    def test_snapshot_holds_model_and_index_copy(self):
+        with self.snapshots.write_lock():
+            version = self.snapshots.publish(self._trained(), self.store.index_path)
+            empty = self.snapshots.publish(None, self.store.index_path)
+        path = self.snapshots.path(version)
+
+        self.assertTrue(os.path.exists(os.path.join(path, SnapshotStore.MODEL_FILE)))
+        self.assertFalse(os.path.exists(os.path.join(self.snapshots.path(empty), SnapshotStore.MODEL_FILE)))
+        # The index copy keeps the gallery as it was, whatever happens to the live one
+        self.store.append('bob', _samples(2, 1))
+        names, _ = SampleStore(self.store.directory).load(os.path.join(path, SnapshotStore.INDEX_FILE))
+        self.assertEqual(names, ['alice'])
+
+    def test_old_snapshots_are_pruned(self):
+        with self.snapshots.write_lock():
+            for _ in range(5):
+                self.snapshots.publish(None, self.store.index_path)
+
+        kept = sorted(int(entry) for entry in os.listdir(self.snapshots.snapshots_dir) if entry.isdigit())
+        self.assertEqual(kept, [3, 4, 5])
+
+    def test_compacted_sample_file_outlives_the_snapshots_that_map_it(self):
+        with self.snapshots.write_lock():
+            self.snapshots.publish(None, self.store.index_path)
+            old_path = self.store.samples_path
+            self.store.append('bob', _samples(2, 1))
+            self.store.remove('alice')
+            self.store.compact()
+
+            for _ in range(self.snapshots.keep - 1):
+                self.snapshots.publish(None, self.store.index_path)
+                self.assertTrue(os.path.exists(old_path))
+            self.snapshots.publish(None, self.store.index_path)
+
+        self.assertFalse(os.path.exists(old_path))
+        self.assertTrue(os.path.exists(self.store.samples_path))
+
+
+class SnapshotReloadTests(TempDirTestCase):
+    """Two face systems sharing a gallery and models directory, like two worker processes"""
+
+    def _system(self, **options):
+        return SimpleFaceRecognitionSystem(
+            encodings_dir=os.path.join(self.tmp, 'encodings'),
+            models_dir=os.path.join(self.tmp, 'models'),
+            reload_interval=0, **options)
+
+    def _frames(self, index: int):
+        rng = np.random.default_rng([index, 1])
+        return [_render(_identity(1, index), rng) for _ in range(4)]
+
+    def test_reload_picks_up_another_workers_enrollment(self):
+        a, b = self._system(), self._system()
+        self.assertTrue(a.register_face('alice', frames=self._frames(0))[0])
+
+        b._reload_in_background(b.snapshots.current_version())
+
+        self.assertEqual(b.version, a.version)
+        self.assertEqual(b.known_face_names, ['alice'])
+        self.assertEqual([face['name'] for face in b.recognize_faces(self._frames(0)[0])], ['alice'])
+
+    def test_reload_during_enrollment_keeps_untrained_users(self):
+        a, b = self._system(), self._system()
+        self.assertTrue(a.register_face('alice', frames=self._frames(0))[0])
+
+        # A third worker stored a user whose retrain has not run yet, so no
+        # published snapshot (whose index copy b reloads from) includes them
+        with a.snapshots.write_lock():
+            a.sample_store.load()
+            a.sample_store.append('pending', _samples(3, 2))
+
+        # b picks up alice's snapshot between reading the live gallery and
+        # storing its own enrollment
+        load = b.sample_store.load
+        reloaded = []
+
+        def load_then_reload(*args):
+            result = load(*args)
+            if not reloaded:
+                reloaded.append(True)
+                b._apply_snapshot(b._read_snapshot(b.snapshots.current_version()))
+            return result
+
+        with mock.patch.object(b.sample_store, 'load', side_effect=load_then_reload):
+            self.assertTrue(b.register_face('bob', frames=self._frames(1))[0])
+
+        self.assertTrue(reloaded)
+        names, _ = SampleStore(os.path.join(self.tmp, 'encodings')).load()
+        self.assertEqual(names, ['alice', 'pending', 'bob'])
+        self.assertEqual(b.known_face_names, ['alice', 'pending', 'bob'])
+
+    def test_enrollment_extends_the_model_without_retraining(self):
+        a = self._system()
+        self.assertTrue(a.register_face('alice', frames=self._frames(0))[0])
+        a.rebuild()
+
+        with mock.patch.object(a, '_train_recognizer', side_effect=AssertionError('retrained')):
+            self.assertTrue(a.register_face('bob', frames=self._frames(1))[0])
+
+        # Only the retrain wrote an OpenCV model; the new snapshot extends its matcher
+        path = a.snapshots.path(a.version)
+        self.assertFalse(os.path.exists(os.path.join(path, SnapshotStore.MODEL_FILE)))
+        b = self._system()
+        for index, name in enumerate(['alice', 'bob']):
+            self.assertEqual([face['name'] for face in b.recognize_faces(self._frames(index)[0])], [name])
+
+    def test_worker_starting_after_compaction_loads_the_published_model(self):
+        a = self._system()
+        self.assertTrue(a.register_face('alice', frames=self._frames(0))[0])
+        self.assertTrue(a.register_face('bob', frames=self._frames(1))[0])
+        version = a.version
+
+        # Compacted, but the retrain has not published yet
+        with a.snapshots.write_lock():
+            a.sample_store.load()
+            a.sample_store.remove('bob')
+            a.sample_store.compact()
+
+        b = self._system()
+        self.assertEqual(b.version, version)
+        self.assertEqual(b.known_face_names, ['alice', 'bob'])
+
+    def test_legacy_model_is_only_trusted_before_the_first_snapshot(self):
+        a = self._system()
+        self.assertTrue(a.register_face('alice', frames=self._frames(0))[0])
+        a.rebuild()
+        legacy_path = os.path.join(self.tmp, 'models', SnapshotStore.MODEL_FILE)
+
+        # A deployment from before snapshots: gallery and model, no snapshot
+        a.recognizer.save(legacy_path)
+        shutil.rmtree(a.snapshots.snapshots_dir)
+        os.remove(a.snapshots.marker_path)
+        b = self._system()
+        self.assertEqual([face['name'] for face in b.recognize_faces(self._frames(0)[0])], ['alice'])
+        self.assertFalse(os.path.exists(legacy_path))
+
+        # A stale model file (here, of other faces) is ignored when the
+        # published snapshot cannot be read
+        stale = cv2.face.LBPHFaceRecognizer_create()
+        stale.train(_samples(5, 2), np.array([0, 0]))
+        stale.save(legacy_path)
+        shutil.rmtree(b.snapshots.path(b.version))
+        c = self._system()
+        self.assertEqual([face['name'] for face in c.recognize_faces(self._frames(0)[0])], ['alice'])
+
+    def test_batch_recognition_matches_serial(self):
+        a = self._system()
+        self.addCleanup(a.close)
+        self.assertTrue(a.register_face('alice', frames=self._frames(0))[0])
+        self.assertTrue(a.register_face('bob', frames=self._frames(1))[0])
+        frames = self._frames(0)[:2] + self._frames(1)[:2]
+
+        serial = [a.recognize_faces(frame) for frame in frames]
+
+        self.assertEqual([faces[0]['name'] for faces in serial], ['alice', 'alice', 'bob', 'bob'])
+        self.assertEqual(a.recognize_faces_batch(frames, workers=2, chunksize=1), serial)
+
+    def test_pool_workers_only_load_snapshots(self):
+        a = self._system()
+        self.assertTrue(a.register_face('alice', frames=self._frames(0))[0])
+        # Stored but not trained yet, so the gallery is ahead of the snapshot
+        with a.snapshots.write_lock():
+            a.sample_store.load()
+            a.sample_store.append('pending', _samples(3, 2))
+        self.addCleanup(cv2.setNumThreads, cv2.getNumThreads())
+        self.addCleanup(setattr, simple_face_recognition, '_worker_system', None)
+
+        with mock.patch.object(TrainingQueue, 'submit') as submit:
+            main = self._system(background_training=True)
+            self.assertEqual(submit.call_count, 1)
+            simple_face_recognition._init_worker(main._worker_kwargs)
+
+        self.assertEqual(submit.call_count, 1)
+        worker = simple_face_recognition._worker_system
+        self.assertIsNone(worker.trainer)
+        self.assertEqual(worker.version, a.version)
+        self.assertEqual(worker.snapshots.current_version(), a.version)
+
+
+class ReducedDecodeTests(SimpleTestCase):
+    def setUp(self):
+        frame = np.random.default_rng(0).integers(0, 256, (960, 1280), dtype=np.uint8)
+        self.data = cv2.imencode('.jpg', frame)[1].tobytes()
+
+    def test_wide_jpeg_is_decoded_at_reduced_size(self):
+        frame, factor = decode_frame(self.data, grayscale=True, max_width=640)
+        self.assertEqual(factor, 2)
+        self.assertEqual(frame.shape, (480, 640))
+        self.assertEqual(decode_frame(self.data, grayscale=True, max_width=1280)[1], 1)
+
+    def test_reduced_frame_is_searched_for_full_size_faces(self):
+        frame, factor = decode_frame(self.data, grayscale=True, max_width=640)
+        for scale in (1.0, 0.5):
+            detector = create_detector('haar', detection_scale=scale)
+            with mock.patch.object(detector, '_run_cascade', return_value=()) as run:
+                detector.detect(frame, frame, frame_scale=factor)
+            # minSize is 80 px of the original image: 40 px here, 20 on the downscaled copy
+            self.assertEqual(run.call_args.kwargs['min_size'], (int(40 * scale),) * 2)
+
+        params = DetectionTuner(0.03).begin('kiosk', frame.shape, factor)
+        self.assertEqual(params.min_size, 40)
+
+
+class ReadinessTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(face_service._status, loaded=False, warmed_up=False,
+                                  warming_up=False, error=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _probe(self):
+        return face_readiness(RequestFactory().get('/health/ready/')).status_code
+
+    @override_settings(FACE_WARM_UP_ON_START=False)
+    def test_ready_once_loaded_without_warm_up(self):
+        def load():
+            face_service._status['loaded'] = True
+        with mock.patch('attendance.views.get_face_system', side_effect=load) as get:
+            self.assertEqual(self._probe(), 200)
+        get.assert_called_once_with()
+
+    @override_settings(FACE_WARM_UP_ON_START=True)
+    def test_not_ready_while_warm_up_runs_or_after_it_failed(self):
+        face_service._status.update(loaded=True, warming_up=True)
+        self.assertEqual(self._probe(), 503)
+        face_service._status.update(warming_up=False, error='self-test failed')
+        self.assertEqual(self._probe(), 503)
+        face_service._status.update(error=None, warmed_up=True)
+        self.assertEqual(self._probe(), 200)
+
+
+class AdmissionControllerTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('load_shedding.time.monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_in_flight_limit(self):
+        controller = AdmissionController(max_in_flight=2)
+
+        self.assertIsNone(controller.acquire())
+        self.assertIsNone(controller.acquire())
+        reason, retry_after = controller.acquire()
+
+        self.assertEqual(reason, 'busy')
+        self.assertGreater(retry_after, 0)
+        controller.release(0.1)
+        self.assertIsNone(controller.acquire())
+        self.assertEqual(controller.stats()['rejected'], {'busy': 1, 'rate': 0})
+
+    def test_no_wait_is_turned_away_while_others_may_queue(self):
+        controller = AdmissionController(max_in_flight=1, max_waiting=1, wait_timeout=0)
+        controller.acquire()
+
+        self.assertEqual(controller.acquire(wait=False)[0], 'busy')
+        self.assertEqual(controller.stats()['waiting'], 0)
+
+    def test_rate_limit_refills_over_time(self):
+        controller = AdmissionController(max_in_flight=8, rate=2.0, burst=2)
+
+        self.assertIsNone(controller.acquire('kiosk-1'))
+        self.assertIsNone(controller.acquire('kiosk-1'))
+        reason, retry_after = controller.acquire('kiosk-1')
+        self.assertEqual(reason, 'rate')
+        self.assertAlmostEqual(retry_after, 0.5)
+        # Other kiosks have buckets of their own
+        self.assertIsNone(controller.acquire('kiosk-2'))
+
+        self.now += 0.5
+        self.assertIsNone(controller.acquire('kiosk-1'))
+        self.assertEqual(controller.acquire('kiosk-1')[0], 'rate')
+
+    def test_unkeyed_requests_only_meet_the_in_flight_limit(self):
+        controller = AdmissionController(max_in_flight=1, rate=1.0, burst=1)
+
+        for _ in range(5):
+            self.assertIsNone(controller.acquire(None))
+            controller.release(0.01)
+        self.assertEqual(controller.stats()['rejected'], {'busy': 0, 'rate': 0})
+
+
+class AdmissionControlledViewTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.controller = AdmissionController(max_in_flight=4, rate=1.0, burst=1)
+        patcher = mock.patch.object(admission_module, 'admission', self.controller)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _view(self, key=admission_module.client_key):
+        return admission_module.admission_controlled('test', key=key)(lambda request: JsonResponse({'success': True}))
+
+    def _post_json(self, body):
+        return self.factory.post('/attendance/process/', data=body, content_type='application/json',
+                                 REMOTE_ADDR='10.0.0.1')
+
+    def test_rate_limited_request_gets_429_with_retry_after(self):
+        view = self._view()
+        request = lambda: self.factory.post('/attendance/process/?kiosk_id=k1', data=b'jpeg',
+                                            content_type='image/jpeg')
+
+        self.assertEqual(view(request()).status_code, 200)
+        response = view(request())
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(json.loads(response.content)['reason'], 'rate')
+
+    def test_json_kiosks_behind_one_address_are_limited_separately(self):
+        view = self._view(key=_kiosk_id)
+
+        for kiosk in ('k1', 'k2', 'k3'):
+            response = view(self._post_json({'kiosk_id': kiosk, 'image': 'data:image/jpeg;base64,AA=='}))
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(view(self._post_json({'kiosk_id': 'k1', 'image': ''})).status_code, 429)
+
+    def test_frames_without_a_kiosk_id_are_not_rate_limited(self):
+        view = self._view(key=_kiosk_id)
+
+        for _ in range(3):
+            self.assertEqual(view(self._post_json({'image': ''})).status_code, 200)
+
+
+# The file-based cache is shared with the development server; tests get their own
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                             'LOCATION': 'attendance-tests'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TeacherDashboardTests(TestCase):
+    def _dashboard(self, slots, marked=0):
+        """Log in a new teacher with that many slots today, marked or not, and return their id"""
+        teacher = User.objects.create(user_id=f'T{slots}', name='Teacher')
+        for hour in range(slots):
+            slot = Timetable.objects.create(teacher=teacher, day_of_week=date.today().weekday(),
+                                            start_time=time(hour), end_time=time(hour, 50),
+                                            subject=f'Subject {hour}')
+            if hour < marked:
+                LectureAttendance.objects.create(teacher=teacher, timetable=slot)
+        session = self.client.session
+        session['teacher_id'] = teacher.user_id
+        session.save()
+        return teacher.user_id
+
+    def test_query_count_does_not_grow_with_the_number_of_slots(self):
+        for slots in (1, 12):
+            self._dashboard(slots, marked=slots // 2)
+            # Session, teacher name and the week's slots, today's marks
+            with self.assertNumQueries(4):
+                response = self.client.get('/portal/dashboard/')
+            self.assertEqual(len(response.context['timetable']), slots)
+            # Session and today's marks once the timetable is cached
+            with self.assertNumQueries(2):
+                response = self.client.get('/portal/dashboard/')
+            statuses = [slot['status'] for slot in response.context['timetable']]
+            self.assertEqual(statuses.count('Present'), slots // 2)
+
+    def test_timetable_change_drops_the_cached_week(self):
+        teacher_id = self._dashboard(2)
+        self.client.get('/portal/dashboard/')
+        Timetable.objects.filter(teacher_id=teacher_id).first().delete()
+        response = self.client.get('/portal/dashboard/')
+        self.assertEqual(len(response.context['timetable']), 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PresentTodayTests(TestCase):
+    def setUp(self):
+        for user_id in 'ABC':
+            User.objects.create(user_id=user_id, name=f'Teacher {user_id}')
+        self.present = PresentToday(refresh=30.0)
+
+    def test_first_mark_repeat_and_day_rollover(self):
+        # Today's marks, the new faces, the insert, which rows were ours, and the day's
+        # summary (count, then update_or_create: select and insert within savepoints)
+        with self.assertNumQueries(11):
+            marks = self.present.mark(['A', 'B', 'X'])
+        self.assertEqual(marks, {'A': ('Teacher A', True), 'B': ('Teacher B', True)})
+
+        # Everyone already marked is answered from memory
+        with self.assertNumQueries(0):
+            marks = self.present.mark(['A', 'B'])
+        self.assertEqual(marks, {'A': ('Teacher A', False), 'B': ('Teacher B', False)})
+
+        tomorrow = date.today() + timedelta(days=1)
+        with mock.patch('attendance.presence.date') as fake_date:
+            fake_date.today.return_value = tomorrow
+            # A new day reloads the (empty) set before marking
+            with self.assertNumQueries(11):
+                marks = self.present.mark(['A'])
+            self.assertEqual(marks, {'A': ('Teacher A', True)})
+        self.assertEqual(Attendance.objects.filter(date=tomorrow).count(), 1)
+        self.assertEqual(self.present.stats()['reloads'], 2)
+
+    def test_created_only_for_rows_this_call_inserted(self):
+        create = Attendance.objects.bulk_create
+
+        def race(rows, **kwargs):
+            # Another worker inserts C between this worker's lookup and its insert
+            Attendance.objects.create(user_id='C')
+            return create(rows, **kwargs)
+
+        # Load today's (empty) set, then another worker marks B
+        self.present.mark([])
+        Attendance.objects.create(user_id='B')
+        with mock.patch.object(Attendance.objects, 'bulk_create', side_effect=race):
+            marks = self.present.mark(['A', 'B', 'C'])
+        self.assertEqual(marks, {'A': ('Teacher A', True), 'B': ('Teacher B', False),
+                                 'C': ('Teacher C', False)})
+        self.assertEqual(Attendance.objects.filter(date=date.today()).count(), 3)
+        self.assertEqual(self.present.stats()['marked'], 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AttendanceTrendTests(TestCase):
+    def setUp(self):
+        self.today = date.today()
+        for index in range(4):
+            user = User.objects.create(user_id=f'U{index}', name=f'Teacher {index}')
+            # U0 came every day of the last 3 weeks, U1 every other day, ...
+            for days_ago in range(0, 21, index + 1):
+                Attendance.objects.create(user=user, date=self.today - timedelta(days=days_ago))
+
+    def _summary(self):
+        return dict(DailyAttendanceSummary.objects.exclude(present=0).values_list('date', 'present'))
+
+    def _counted(self):
+        return dict(Attendance.objects.order_by().values('date').annotate(n=Count('id')).values_list('date', 'n'))
+
+    def test_summary_follows_marks_and_deletions(self):
+        self.assertEqual(self._summary(), self._counted())
+
+        Attendance.objects.filter(user_id='U0', date=self.today).delete()
+        Attendance.objects.get(user_id='U1', date=self.today - timedelta(days=2)).delete()
+        User.objects.get(user_id='U3').delete()
+        self.assertEqual(self._summary(), self._counted())
+
+        # The kiosk path inserts with bulk_create and refreshes the day itself
+        PresentToday().mark(['U0', 'U1'])
+        self.assertEqual(self._summary(), self._counted())
+        self.assertEqual(self._summary()[self.today], 3)
+
+    def test_migration_backfill_matches_attendance(self):
+        migration = importlib.import_module('attendance.migrations.0004_dailyattendancesummary')
+        DailyAttendanceSummary.objects.all().delete()
+        migration.build_summary(apps, None)
+        self.assertEqual(self._summary(), self._counted())
+
+    def test_any_range_is_one_query(self):
+        with self.assertNumQueries(1):
+            trend = trends.daily_counts(self.today - timedelta(days=364), self.today)
+        self.assertEqual(len(trend), 365)
+        self.assertEqual(sum(day['count'] for day in trend), Attendance.objects.count())
+
+        self.client.force_login(get_user_model().objects.create_user('admin', password='x'))
+        for trend_range in ('week', 'year'):
+            # Session and user, the two headline counters (cached after the first
+            # page), and the trend
+            queries = 5 if trend_range == 'week' else 3
+            with self.assertNumQueries(queries):
+                response = self.client.get('/statistics/', {'range': trend_range})
+            self.assertEqual(len(response.context['attendance_trend']), trends.TREND_RANGES[trend_range])
@@ -0,0 +1,60 @@
+"""
+Cached weekly timetables for the teacher dashboard
+
+A teacher's dashboard is refreshed often but their timetable rarely
+changes, so each teacher's name and weekly slots are kept in the
+ATTENDANCE_CACHE cache. Saving or deleting a Timetable slot (from
+manage_timetable, delete_timetable_slot or the admin) or the teacher drops
+that teacher's entry. With the default file-based cache every worker sees
+that at once; a local-memory cache only drops it in the worker that made
+the change, and the others serve their copy until it expires
+(ATTENDANCE_CACHE_TIMEOUT).
+"""
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .counters import CACHE_ALIAS, TIMEOUT
+from .models import User, Timetable
+
+
+def _key(teacher_id):
+    return f'attendance:timetable:{teacher_id}'
+
+
+def weekly_timetable(teacher_id):
+    """
+    {'name', 'days'} for a teacher, or None if there is no such teacher
+
+    days maps day_of_week (0 = Monday) to that day's slots in start order,
+    each a dict with id, subject, start_time and end_time.
+    """
+    cache = caches[CACHE_ALIAS]
+    week = cache.get(_key(teacher_id))
+    if week is None:
+        name = User.objects.filter(user_id=teacher_id).values_list('name', flat=True).first()
+        if name is None:
+            return None
+        days = {}
+        slots = Timetable.objects.filter(teacher_id=teacher_id).order_by('day_of_week', 'start_time')
+        for slot in slots.values('id', 'day_of_week', 'subject', 'start_time', 'end_time'):
+            days.setdefault(slot.pop('day_of_week'), []).append(slot)
+        week = {'name': name, 'days': days}
+        cache.set(_key(teacher_id), week, TIMEOUT)
+    return week
+
+
+def invalidate_timetable(teacher_id):
+    caches[CACHE_ALIAS].delete(_key(teacher_id))
+
+
+@receiver(post_save, sender=Timetable)
+@receiver(post_delete, sender=Timetable)
+def _timetable_changed(sender, instance, **kwargs):
+    invalidate_timetable(instance.teacher_id)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def _teacher_changed(sender, instance, **kwargs):
+    invalidate_timetable(instance.user_id)
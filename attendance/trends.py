@@ -0,0 +1,82 @@
+"""
+Daily attendance totals for trend views
+
+DailyAttendanceSummary holds the number of teachers present on each day,
+so a trend over any range is one indexed range query instead of a count
+per day. It is maintained as attendance changes: a new Attendance row adds
+one to its day and a deleted row takes one away (through signals), and
+code inserting rows with bulk_create, which sends no signals, calls
+refresh_day() for the day it wrote. Anything else (edits to a record's
+date, raw SQL, restored backups) is fixed by the
+rebuild_attendance_summary command.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Attendance, DailyAttendanceSummary
+
+# Named ranges offered by the statistics page, in days ending today
+TREND_RANGES = {
+    'week': 7,
+    'month': 30,
+    'term': 120,
+    'year': 365,
+}
+# Longest custom range served
+MAX_TREND_DAYS = 3660
+
+
+def refresh_day(day):
+    """Recount one day's attendance into the summary"""
+    present = Attendance.objects.filter(date=day).count()
+    DailyAttendanceSummary.objects.update_or_create(date=day, defaults={'present': present})
+
+
+def rebuild(since=None) -> int:
+    """Recompute the summary from attendance records (from since on, or all); returns days written"""
+    records = Attendance.objects.order_by()
+    summaries = DailyAttendanceSummary.objects.all()
+    if since is not None:
+        records = records.filter(date__gte=since)
+        summaries = summaries.filter(date__gte=since)
+    rows = [
+        DailyAttendanceSummary(date=row['date'], present=row['present'])
+        for row in records.values('date').annotate(present=Count('id'))
+    ]
+    with transaction.atomic():
+        summaries.delete()
+        DailyAttendanceSummary.objects.bulk_create(rows)
+    return len(rows)
+
+
+def daily_counts(start, end) -> list:
+    """[{'date', 'count'}] for every day from start to end inclusive, from one query"""
+    counts = dict(
+        DailyAttendanceSummary.objects.filter(date__range=(start, end)).values_list('date', 'present')
+    )
+    days = (end - start).days + 1
+    return [
+        {'date': day.strftime("%Y-%m-%d"), 'count': counts.get(day, 0)}
+        for day in (start + timedelta(days=i) for i in range(days))
+    ]
+
+
+def _adjust(day, delta):
+    if not DailyAttendanceSummary.objects.filter(date=day).update(present=F('present') + delta):
+        # First record of the day (or no summary yet): count it outright
+        refresh_day(day)
+
+
+@receiver(post_save, sender=Attendance)
+def _attendance_saved(sender, instance, created, **kwargs):
+    if created:
+        _adjust(instance.date, 1)
+
+
+@receiver(post_delete, sender=Attendance)
+def _attendance_deleted(sender, instance, **kwargs):
+    _adjust(instance.date, -1)
@@ -11,9 +11,17 @@ urlpatterns = [
     path('attendance/', views.attendance_records, name='attendance_records'),
     path('register/', views.register_page, name='register_page'),
     path('register/submit/', views.register_user, name='register_user'),
+    path('register/status/<int:revision>/', views.training_status, name='training_status'),
     path('mark-attendance/', views.mark_attendance_page, name='mark_attendance_page'),
     path('mark-attendance/process/', views.process_attendance, name='process_attendance'),
+    path('mark-attendance/filter-stats/', views.frame_filter_stats, name='frame_filter_stats'),
+    path('mark-attendance/detection-stats/', views.detection_stats, name='detection_stats'),
+    path('mark-attendance/admission-stats/', views.admission_stats, name='admission_stats'),
+    path('mark-attendance/presence-stats/', views.presence_stats, name='presence_stats'),
     path('statistics/', views.statistics, name='statistics'),
+    path('statistics/gallery/', views.gallery_stats, name='gallery_stats'),
+    path('health/ready/', views.face_readiness, name='face_readiness'),
+    path('metrics/', views.metrics_view, name='metrics'),
     
     # Teacher Portal
     path('portal/login/', views.teacher_login, name='teacher_login'),
@@ -1,42 +1,91 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse, StreamingHttpResponse
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.contrib.auth.decorators import login_required
 from django.db import IntegrityError
-from django.utils import timezone
+from django.conf import settings
 from django.db.models import Count, Q
 import json
 import os
-import sys
 import cv2
 from datetime import datetime, date, timedelta
 import base64
-import numpy as np
 
-# Add src directory to path
-sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
-
-from simple_face_recognition import SimpleFaceRecognitionSystem
+from .admission import admission, admission_controlled
+from .counters import cached, headline_counters
+from .face_service import get_face_system, readiness
+from .instrumentation import instrumented, metrics
+from .kiosk import frame_filter, process_kiosk_frame
+from .presence import present_today
+from .timetables import weekly_timetable
+from .trends import MAX_TREND_DAYS, TREND_RANGES, daily_counts
+from frame_decoding import decode_frame, jpeg_size
 from .models import User, Attendance, Timetable, LectureAttendance
 
-# Initialize face recognition system
-face_system = SimpleFaceRecognitionSystem()
+FRAME_SKIP_MESSAGES = {
+    'too_dark': 'Image too dark. Please improve the lighting.',
+    'too_bright': 'Image too bright. Please avoid direct light on the camera.',
+    'blurry': 'Image too blurry. Please hold still and try again.',
+    'unchanged': 'No change since the last frame.',
+}
+
+def _is_binary_upload(request):
+    """Whether the body is a raw encoded image rather than a form or JSON"""
+    content_type = request.content_type or ''
+    return content_type == 'application/octet-stream' or content_type.startswith('image/')
+
+def _is_face_login(request):
+    """Whether a login POST carries a face image rather than a password form"""
+    return _is_binary_upload(request) or (request.content_type or '').startswith('application/json')
+
+def _read_upload(request):
+    """
+    Fields and encoded images of a frame upload, in any accepted form
+    
+    - application/octet-stream or image/*: the body is one encoded image
+      (JPEG), fields come from the query string
+    - multipart/form-data: an 'image' file plus optional 'images' files
+    - application/json (original form): 'image' and optional 'images' as
+      base64 data URLs
+    
+    Returns (fields, list of image bytes) with the main image first. The
+    result is kept on the request, so the body is only parsed once.
+    """
+    if not hasattr(request, '_frame_upload'):
+        request._frame_upload = _parse_upload(request)
+    return request._frame_upload
+
+def _parse_upload(request):
+    if _is_binary_upload(request):
+        return request.GET, [request.body] if request.body else []
+    
+    if (request.content_type or '').startswith('multipart/'):
+        main = request.FILES.get('image')
+        if main is None:
+            return request.POST, []
+        return request.POST, [f.read() for f in [main] + request.FILES.getlist('images')]
+    
+    data = json.loads(request.body)
+    if not data.get('image'):
+        return data, []
+    urls = [data['image']] + list(data.get('images') or [])
+    return data, [base64.b64decode(url.split(',')[-1]) for url in urls]
+
+def _kiosk_id(request):
+    """The kiosk id a frame upload was posted with, in whichever form it came (None without one)"""
+    try:
+        data, _ = _read_upload(request)
+    except Exception:
+        # The view reports the unreadable upload itself
+        return None
+    return str(data['kiosk_id']) if data.get('kiosk_id') else None
 
 @login_required
 def index(request):
     """College Admin Dashboard"""
-    total_teachers = User.objects.count()
-    today = date.today()
-    present_today = Attendance.objects.filter(date=today).count()
-    absent_today = total_teachers - present_today
-    
-    context = {
-        'total_teachers': total_teachers,
-        'present_today': present_today,
-        'absent_today': absent_today,
-        'today_date': today.strftime("%B %d, %Y")
-    }
+    context = headline_counters()
+    context['today_date'] = date.today().strftime("%B %d, %Y")
     return render(request, 'attendance/index.html', context)
 
 @login_required
@@ -98,15 +147,18 @@ def register_page(request):
 def register_user(request):
     """Register a new teacher"""
     try:
-        data = json.loads(request.body)
+        # Multipart form with image files, or the original JSON with data URLs
+        try:
+            data, images = _read_upload(request)
+        except Exception as e:
+            return JsonResponse({'success': False, 'message': f'Image processing error: {str(e)}'})
         user_id = data.get('user_id')
         name = data.get('name')
         email = data.get('email', '')
         phone = data.get('phone', '')
         password = data.get('password')
-        image_data = data.get('image')
         
-        if not all([user_id, name, password, image_data]):
+        if not all([user_id, name, password, images]):
             return JsonResponse({'success': False, 'message': 'Missing required fields'})
         
         # Check if user already exists
@@ -114,24 +166,36 @@ def register_user(request):
             return JsonResponse({'success': False, 'message': f'Teacher ID {user_id} already registered'})
         
         # Decode and save image
+        face_system = get_face_system()
         try:
-            image_bytes = base64.b64decode(image_data.split(',')[1])
-            nparr = np.frombuffer(image_bytes, np.uint8)
-            frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            # Full resolution: enrollment samples should be as sharp as possible
+            frame, _ = face_system.decode(images[0])
             
             if frame is None:
                 return JsonResponse({'success': False, 'message': 'Invalid image data'})
             
-            # Save image
+            # Extra frames captured in a burst give the gallery more samples
+            frames = [frame]
+            for extra in images[1:1 + getattr(settings, 'FACE_ENROLL_MAX_FRAMES', 10)]:
+                extra_frame, _ = face_system.decode(extra)
+                if extra_frame is not None:
+                    frames.append(extra_frame)
+            
+            # Save image (a JPEG upload as it is, without re-encoding)
             os.makedirs('data/images', exist_ok=True)
             image_path = f'data/images/{user_id}.jpg'
-            cv2.imwrite(image_path, frame)
+            if jpeg_size(images[0]) is not None:
+                with open(image_path, 'wb') as f:
+                    f.write(images[0])
+            else:
+                # frame may be grayscale (cascade detectors); the photo keeps its colour
+                cv2.imwrite(image_path, decode_frame(images[0])[0])
             
         except Exception as e:
             return JsonResponse({'success': False, 'message': f'Image processing error: {str(e)}'})
         
-        # Register face
-        success, message = face_system.register_face(user_id, frame=frame)
+        # Register face (the model is retrained in the background)
+        success, message = face_system.register_face(user_id, frames=frames)
         
         if not success:
             # Clean up image if face registration failed
@@ -149,14 +213,16 @@ def register_user(request):
                 password=password
             )
             
+            # The page polls training_status until the new face is recognized
             return JsonResponse({
                 'success': True,
-                'message': f'Successfully registered Teacher {name}!'
+                'message': f'Successfully registered Teacher {name}!',
+                'revision': face_system.gallery_revision()
             })
             
         except IntegrityError:
             # Clean up if database save fails
-            face_system.delete_user(user_id)
+            get_face_system().delete_user(user_id)
             if os.path.exists(image_path):
                 os.remove(image_path)
             return JsonResponse({'success': False, 'message': 'Teacher already exists'})
@@ -168,96 +234,80 @@ def register_user(request):
 
 def mark_attendance_page(request):
     """Kiosk Mode: Attendance marking page (Public access)"""
-    total_registered = User.objects.count()
-    today = date.today()
-    marked_today = Attendance.objects.filter(date=today).count()
-    
-    context = {
-        'total_registered': total_registered,
-        'marked_today': marked_today,
-    }
+    context = headline_counters()
+    context['total_registered'] = context['total_teachers']
+    context['marked_today'] = context['present_today']
     return render(request, 'attendance/mark_attendance.html', context)
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@instrumented('process_attendance')
+@admission_controlled('process_attendance', key=_kiosk_id)
 def process_attendance(request):
     """Process attendance from webcam frame (Public access)"""
+    timer = metrics.stages('face_stage_seconds')
     try:
-        data = json.loads(request.body)
-        image_data = data.get('image')
-        
-        if not image_data:
-            return JsonResponse({'success': False, 'message': 'No image data provided'})
-        
-        # Decode base64 image
+        # Raw JPEG body (kiosk_id in the query string), multipart, or the original JSON
         try:
-            image_bytes = base64.b64decode(image_data.split(',')[1])
-            nparr = np.frombuffer(image_bytes, np.uint8)
-            frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            
-            if frame is None:
-                return JsonResponse({'success': False, 'message': 'Failed to decode image'})
-            
+            data, images = _read_upload(request)
         except Exception as img_error:
             return JsonResponse({'success': False, 'message': f'Image decode error: {str(img_error)}'})
         
-        # Recognize faces
-        try:
-            recognized_faces = face_system.recognize_faces(frame)
-        except Exception as rec_error:
-            return JsonResponse({'success': False, 'message': f'Recognition error: {str(rec_error)}'})
-        
-        results = []
-        today = date.today()
-        
-        for face_info in recognized_faces:
-            name = face_info["name"]
-            confidence = face_info["confidence"]
-            location = face_info["location"]
-            
-            # Convert numpy int32 to Python int for JSON serialization
-            location_tuple = tuple(int(x) for x in location)
-            
-            if name != "Unknown":
-                try:
-                    user = User.objects.get(user_id=name)
-                    
-                    # Try to mark attendance
-                    attendance, created = Attendance.objects.get_or_create(
-                        user=user,
-                        date=today,
-                        defaults={
-                            'time': timezone.now().time(),
-                            'timestamp': timezone.now()
-                        }
-                    )
-                    
-                    results.append({
-                        'user_id': name,
-                        'name': user.name,
-                        'confidence': round(confidence * 100, 1),
-                        'attendance_marked': created,
-                        'location': location_tuple
-                    })
-                    
-                except User.DoesNotExist:
-                    print(f"User {name} not found in database")
-            else:
-                # Also return unknown faces for debugging
-                results.append({
-                    'user_id': 'unknown',
-                    'name': 'Unknown',
-                    'confidence': round(confidence * 100, 1),
-                    'attendance_marked': False,
-                    'location': location_tuple
-                })
+        if not images:
+            return JsonResponse({'success': False, 'message': 'No image data provided'})
+        timer.mark('decode')
         
-        return JsonResponse({'success': True, 'faces': results})
+        return JsonResponse(process_kiosk_frame(images[0], _kiosk_id(request), timer))
         
     except Exception as e:
         import traceback
         return JsonResponse({'success': False, 'message': f'Server error: {str(e)}'})
 
+@login_required
+def frame_filter_stats(request):
+    """Frame pre-filter counters, for tuning its thresholds"""
+    return JsonResponse(frame_filter.stats())
+
+def metrics_view(request):
+    """Per-stage latency and throughput of this worker, in the Prometheus text format"""
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def face_readiness(request):
+    """Readiness probe: 200 once the face model is loaded (and warmed up, if it is at start), else 503"""
+    if not getattr(settings, 'FACE_WARM_UP_ON_START', True):
+        # Nothing loads the model before traffic arrives, so the probe is its first use
+        try:
+            get_face_system()
+        except Exception as e:
+            print(f"Face system load failed: {e}")
+    status = readiness()
+    return JsonResponse(status, status=200 if status['ready'] else 503)
+
+@login_required
+def presence_stats(request):
+    """The in-memory set of teachers marked today and how often it saved a query"""
+    return JsonResponse(present_today.stats())
+
+@login_required
+def admission_stats(request):
+    """In-flight recognition requests and how many were turned away"""
+    return JsonResponse(admission.stats())
+
+@login_required
+def detection_stats(request):
+    """Detector latency and the adaptive detection parameters chosen per kiosk"""
+    return JsonResponse(get_face_system().detection_stats())
+
+@login_required
+def training_status(request, revision):
+    """Whether a gallery change (by revision) has been trained into the live model"""
+    return JsonResponse(get_face_system().training_status(revision))
+
+@login_required
+def gallery_stats(request):
+    """Face gallery size statistics"""
+    return JsonResponse(get_face_system().gallery_stats())
+
 @login_required
 def user_detail(request, user_id):
     """View individual teacher details and history"""
@@ -289,28 +339,32 @@ def user_detail(request, user_id):
 @login_required
 def statistics(request):
     """College Stats"""
-    total_teachers = User.objects.count()
     today = date.today()
-    present_today = Attendance.objects.filter(date=today).count()
-    absent_today = total_teachers - present_today
+    context = headline_counters()
     
-    # Get attendance for last 7 days
-    attendance_trend = []
-    for i in range(6, -1, -1):
-        check_date = today - timedelta(days=i)
-        count = Attendance.objects.filter(date=check_date).count()
-        attendance_trend.append({
-            'date': check_date.strftime("%Y-%m-%d"),
-            'count': count
-        })
+    # Trend over a named range (?range=week|month|term|year) or ?start=&end= dates
+    trend_range = request.GET.get('range', 'week')
+    if trend_range not in TREND_RANGES:
+        trend_range = 'week'
+    end = today
+    start = today - timedelta(days=TREND_RANGES[trend_range] - 1)
+    try:
+        if request.GET.get('start'):
+            start = datetime.strptime(request.GET['start'], "%Y-%m-%d").date()
+            end = datetime.strptime(request.GET['end'], "%Y-%m-%d").date() if request.GET.get('end') else today
+            trend_range = 'custom'
+    except ValueError:
+        pass
+    start, end = min(start, end), max(start, end)
+    start = max(start, end - timedelta(days=MAX_TREND_DAYS - 1))
     
-    context = {
-        'total_teachers': total_teachers,
-        'present_today': present_today,
-        'absent_today': absent_today,
-        'attendance_trend': attendance_trend,
-        'today_date': today.strftime("%Y-%m-%d")
-    }
+    context['attendance_trend'] = cached(
+        f'trend:{start}:{end}', lambda: daily_counts(start, end), context['cache_version'])
+    context['trend_range'] = trend_range
+    context['trend_ranges'] = list(TREND_RANGES)
+    context['trend_start'] = start.strftime("%Y-%m-%d")
+    context['trend_end'] = end.strftime("%Y-%m-%d")
+    context['today_date'] = today.strftime("%Y-%m-%d")
     return render(request, 'attendance/statistics.html', context)
 
 @csrf_exempt
@@ -324,7 +378,7 @@ def delete_user(request, user_id):
         user_name = user.name
         
         # Delete from face recognition system
-        face_deleted = face_system.delete_user(user_id)
+        face_deleted = get_face_system().delete_user(user_id)
         
         # Delete user image if exists
         image_path = f'data/images/{user_id}.jpg'
@@ -387,28 +441,40 @@ def delete_timetable_slot(request, slot_id):
 
 # Teacher Portal Views
 
+@instrumented('teacher_login')
+@admission_controlled('teacher_login', key=None, when=_is_face_login)
 def teacher_login(request):
     """Teacher Login Page"""
     if request.method == 'POST':
-        # Check if it's a JSON request (Face Login)
-        if request.content_type and request.content_type.startswith('application/json'):
+        # Face Login: a raw JPEG body, or the original JSON with a data URL
+        if _is_face_login(request):
+            timer = metrics.stages('face_stage_seconds')
             try:
-                data = json.loads(request.body)
-                image_data = data.get('image')
+                try:
+                    _, images = _read_upload(request)
+                except Exception as e:
+                    return JsonResponse({'success': False, 'message': 'Image decode failed'})
                 
-                if not image_data:
+                if not images:
                     return JsonResponse({'success': False, 'message': 'No image provided'})
+                timer.mark('decode')
                 
                 # Decode image
-                try:
-                    image_bytes = base64.b64decode(image_data.split(',')[1])
-                    nparr = np.frombuffer(image_bytes, np.uint8)
-                    frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-                except Exception as e:
+                frame, decode_factor = get_face_system().decode(
+                    images[0], max_width=getattr(settings, 'FRAME_DECODE_MAX_WIDTH', None))
+                timer.mark('imdecode')
+                if frame is None:
                     return JsonResponse({'success': False, 'message': 'Image decode failed'})
 
+                # Reject unusable frames before running detection
+                skip_reason = frame_filter.check(frame)
+                timer.mark('filter')
+                if skip_reason:
+                    return JsonResponse({'success': False, 'message': FRAME_SKIP_MESSAGES[skip_reason]})
+
                 # Recognize face
-                recognized_faces = face_system.recognize_faces(frame)
+                recognized_faces = get_face_system().recognize_faces(frame, frame_scale=decode_factor)
+                timer.reset()
                 
                 # Debug logging
                 print(f"DEBUG: Login Attempt - Found {len(recognized_faces)} faces")
@@ -431,6 +497,7 @@ def teacher_login(request):
                 if best_match:
                     try:
                         teacher = User.objects.get(user_id=best_match)
+                        timer.mark('db')
                         request.session['teacher_id'] = teacher.user_id
                         from django.urls import reverse
                         print(f"DEBUG: Login Successful for {best_match}")
@@ -475,41 +542,34 @@ def teacher_dashboard(request):
     if not teacher_id:
         return redirect('teacher_login')
     
-    teacher = get_object_or_404(User, user_id=teacher_id)
+    # Name and weekly timetable come from the cache; only today's marks are queried
+    teacher = weekly_timetable(teacher_id)
+    if teacher is None:
+        raise Http404('No teacher matches the session')
     today = date.today()
     day_index = today.weekday()  # 0 = Monday
     
-    # Get today's timetable
-    timetable = Timetable.objects.filter(teacher=teacher, day_of_week=day_index).order_by('start_time')
+    marked_slots = set(LectureAttendance.objects.filter(
+        teacher_id=teacher_id,
+        date=today
+    ).values_list('timetable_id', flat=True))
     
     timetable_data = []
     current_time = datetime.now().time()
     
-    for slot in timetable:
-        # Check if attendance marked
-        is_marked = LectureAttendance.objects.filter(
-            teacher=teacher, 
-            timetable=slot, 
-            date=today
-        ).exists()
+    for slot in teacher['days'].get(day_index, []):
+        is_marked = slot['id'] in marked_slots
         
         # Determine status
         status = 'Upcoming'
         if is_marked:
             status = 'Present'
-        elif current_time > slot.end_time:
+        elif current_time > slot['end_time']:
             status = 'Missed'
-        elif current_time >= slot.start_time:
+        elif current_time >= slot['start_time']:
             status = 'Active'
             
-        timetable_data.append({
-            'id': slot.id,
-            'subject': slot.subject,
-            'start_time': slot.start_time,
-            'end_time': slot.end_time,
-            'is_marked': is_marked,
-            'status': status
-        })
+        timetable_data.append(dict(slot, is_marked=is_marked, status=status))
         
     context = {
         'teacher': teacher,
@@ -2,6 +2,9 @@
 ASGI config for attendance_web project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Besides Django's HTTP views it serves the WebSocket kiosk stream at
+/ws/kiosk/ (see attendance/streaming.py); run it with an ASGI server that
+supports WebSockets, e.g. ``uvicorn attendance_web.asgi:application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
@@ -13,4 +16,15 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'attendance_web.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from attendance.streaming import with_kiosk_stream
+
+application = with_kiosk_stream(django_application)
+
+# Load the face model and run its self-test now rather than on the first request
+from django.conf import settings
+
+if getattr(settings, 'FACE_WARM_UP_ON_START', True):
+    from attendance.face_service import warm_up_in_background
+    warm_up_in_background()
@@ -82,6 +82,26 @@ DATABASES = {
     }
 }
 
+# Caches: dashboard counters, the page fragments showing them and teachers'
+# weekly timetables live in ATTENDANCE_CACHE, invalidated when users,
+# attendance or timetables change. 'file' (default) is shared by all workers
+# on a host, so a change is seen by every worker at once. 'locmem' avoids the
+# file reads but is private to each worker: the others keep serving their
+# copy for up to ATTENDANCE_CACHE_TIMEOUT seconds after a change.
+ATTENDANCE_CACHE_BACKEND = 'file'
+ATTENDANCE_CACHE = 'default'
+ATTENDANCE_CACHE_TIMEOUT = 300
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'attendance',
+    } if ATTENDANCE_CACHE_BACKEND == 'locmem' else {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'data' / 'cache',
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -132,3 +152,118 @@ MEDIA_ROOT = BASE_DIR / 'media'
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Face recognition
+# The face system loads on first use. WSGI/ASGI servers warm it up in the
+# background at start when FACE_WARM_UP_ON_START is set; /health/ready/
+# returns 503 until that has finished. Without it, /health/ready/ loads the
+# system itself (no self-test) and is ready once that is done.
+FACE_WARM_UP_ON_START = True
+
+# Detector backend: 'haar' (default), 'lbp', 'yunet' or 'ssd'. The LBP and
+# DNN backends need their model files in data/models (see src/face_detectors.py);
+# FACE_DETECTOR_OPTIONS is passed to the backend (model paths, thresholds)
+FACE_DETECTOR = 'haar'
+FACE_DETECTOR_OPTIONS = {}
+
+# Set below 1.0 (e.g. 0.5) to run detection on a downscaled copy of each
+# frame with a coarser cascade step, then refine each candidate box on a
+# full-resolution crop. About 4x faster than full resolution on 512-1280 px
+# frames, but it can miss faces the full-resolution search finds: measure
+# recall on your own kiosk frames with manage.py benchmark_detection first.
+# Faces smaller than the backend's min_size (FACE_DETECTOR_OPTIONS, default
+# 80 px) are never reported.
+FACE_DETECTION_SCALE = 1.0
+FACE_DETECTION_REFINE = True
+
+# Adaptive detection (cascade backends): set a per-frame budget in seconds
+# (e.g. 0.03) to tune the scale step and face size range per kiosk from its
+# observed face sizes and timings. With more than FACE_DETECTION_MAX_IN_FLIGHT
+# detections running (default: one per CPU), frames use the cheapest
+# parameters instead of queueing.
+# Chosen parameters and latency: /mark-attendance/detection-stats/
+FACE_DETECTION_BUDGET = None
+FACE_DETECTION_MAX_IN_FLIGHT = None
+
+# Recognizer backend: 'lbph' (default, OpenCV predict per face),
+# 'lbph_numpy' (same model, all faces of a frame matched in one batch) or
+# 'embedding', which matches SFace embeddings
+# (data/models/face_recognition_sface_2021dec.onnx, or FACE_EMBEDDING_MODEL)
+# with a vectorized similarity search. Scales to thousands of enrolled users.
+FACE_RECOGNIZER = 'lbph'
+FACE_EMBEDDING_MODEL = None
+# Cosine similarity a face needs to match with 'embedding'. SFace's published
+# 0.363 is for landmark-aligned colour crops; this backend embeds the stored
+# equalized grayscale samples, so set the figure manage.py
+# calibrate_embeddings measures on your gallery before enabling it.
+FACE_EMBEDDING_THRESHOLD = 0.363
+# Candidate identities reported per face by the batched backends
+FACE_TOP_K = 3
+
+# Gallery: at most FACE_MAX_SAMPLES_PER_USER samples per user, keeping the most
+# distinct and sharpest ones; a sample closer than FACE_SAMPLE_REDUNDANCY (LBPH
+# chi-square, a third of the match cut-off of 60) to a kept one is dropped even
+# under budget. Registration accepts a burst of up to FACE_ENROLL_MAX_FRAMES
+# extra frames. Set FACE_TOPUP_CONFIDENCE (0-1) to offer a user's first kiosk
+# match of the day at or above it as an extra sample.
+# Sizes: /statistics/gallery/
+FACE_MAX_SAMPLES_PER_USER = 10
+FACE_SAMPLE_REDUNDANCY = 20.0
+FACE_ENROLL_MAX_FRAMES = 10
+FACE_TOPUP_CONFIDENCE = None
+
+# Enrollments and deletions update the gallery and return; a background thread
+# retrains once per burst, FACE_TRAINING_DELAY seconds after the last change.
+# The register page polls /register/status/<revision>/ until the face is live.
+FACE_BACKGROUND_TRAINING = True
+FACE_TRAINING_DELAY = 0.5
+
+# Kiosk face tracking: faces overlapping a known track by at least
+# FACE_TRACK_IOU keep its identity, re-verified every FACE_TRACK_REVERIFY_SECONDS.
+# A face is recognized again instead when its track was not seen in the
+# previous frame within FACE_TRACK_MAX_GAP_SECONDS, when its box moved or
+# resized by more than FACE_TRACK_MAX_JUMP of its size, or when its LBP
+# histogram is further than FACE_TRACK_APPEARANCE_THRESHOLD (chi-square per
+# cell) from the verified face; consecutive frames of one face measure about 0.1
+FACE_TRACK_IOU = 0.3
+FACE_TRACK_REVERIFY_SECONDS = 10.0
+FACE_TRACK_MAX_GAP_SECONDS = 1.0
+FACE_TRACK_MAX_JUMP = 0.25
+FACE_TRACK_APPEARANCE_THRESHOLD = 0.25
+
+# Frame pre-filter: frames darker/brighter than these mean levels (0-255),
+# with a Laplacian variance below FRAME_MIN_SHARPNESS, or differing from the
+# kiosk's last processed frame by less than FRAME_MIN_CHANGE (mean absolute
+# difference) are skipped before detection. Counters: /mark-attendance/filter-stats/
+FRAME_MIN_BRIGHTNESS = 40.0
+FRAME_MAX_BRIGHTNESS = 220.0
+FRAME_MIN_SHARPNESS = 15.0
+FRAME_MIN_CHANGE = 2.0
+
+# Threads running recognition for WebSocket kiosk streams (/ws/kiosk/ under
+# ASGI); defaults to one per CPU
+FACE_STREAM_WORKERS = None
+
+# Uploaded JPEG frames at least twice this wide are decoded at 1/2, 1/4 or 1/8
+# size by the JPEG decoder itself (registration always decodes at full size).
+# The detector's minimum face size is scaled down with the frame, so the same
+# faces are found as at full size.
+FRAME_DECODE_MAX_WIDTH = 640
+
+# Admission control for kiosk frames and face logins: at most FACE_MAX_IN_FLIGHT
+# recognitions at once (default: one per CPU), up to FACE_MAX_WAITING more wait
+# FACE_ADMISSION_WAIT seconds for a slot, and each kiosk may send
+# FACE_KIOSK_MAX_FPS frames per second (bursts of FACE_KIOSK_BURST). Anything
+# else gets 429 with Retry-After. WebSocket stream frames count against
+# FACE_MAX_IN_FLIGHT too, without waiting or the per-kiosk rate.
+# Counters: /mark-attendance/admission-stats/
+FACE_MAX_IN_FLIGHT = None
+FACE_MAX_WAITING = 4
+FACE_ADMISSION_WAIT = 1.0
+FACE_KIOSK_MAX_FPS = 1.0
+FACE_KIOSK_BURST = 2
+
+# Kiosks keep today's marked teachers in memory so repeat sightings cost no
+# queries; the set is reloaded from the database (picking up marks and
+# deletions made by other workers) every ATTENDANCE_PRESENCE_REFRESH seconds
+ATTENDANCE_PRESENCE_REFRESH = 30.0
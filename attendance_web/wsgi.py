@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'attendance_web.settings')
 
 application = get_wsgi_application()
+
+# Load the face model and run its self-test now rather than on the first request
+from django.conf import settings
+
+if getattr(settings, 'FACE_WARM_UP_ON_START', True):
+    from attendance.face_service import warm_up_in_background
+    warm_up_in_background()
@@ -0,0 +1,165 @@
+import math
+import os
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+
+class DetectionParams:
+    """Cascade search parameters chosen for one frame"""
+
+    __slots__ = ("scale_factor", "min_size", "max_size", "mode")
+
+    def __init__(self, scale_factor: float, min_size: int, max_size: Optional[int], mode: str):
+        self.scale_factor = scale_factor
+        self.min_size = min_size
+        self.max_size = max_size
+        # "tuned", "explore" (full size range) or "degraded" (overloaded)
+        self.mode = mode
+
+
+class _CameraState:
+    __slots__ = ("scale_factor", "face_sizes", "latency", "frames", "explored", "degraded", "last")
+
+    def __init__(self, scale_factor: float, window: int):
+        self.scale_factor = scale_factor
+        self.face_sizes = deque(maxlen=window)
+        self.latency = None  # EWMA of tuned frames, seconds
+        self.frames = 0
+        self.explored = 0
+        self.degraded = 0
+        self.last = None  # Most recent tuned params
+
+
+class DetectionTuner:
+    """
+    Picks cascade parameters per camera to keep detection within a latency budget
+
+    Each camera (kiosk) keeps a window of the face sizes it has seen and a
+    moving average of its detection time. The search is limited to face
+    sizes around that distribution (minSize/maxSize), and the pyramid step
+    (scaleFactor) is steered so the average meets budget: the number of
+    pyramid levels goes with 1 / ln(scaleFactor), so the step's log is
+    scaled by observed / budget, a bounded amount per frame, between
+    min_scale_factor and max_scale_factor. Every explore_every-th frame
+    searches the full size range so faces of new sizes are still found.
+
+    When more than max_in_flight detections (default: one per CPU) are
+    already running, frames get the cheapest parameters (largest step)
+    instead of waiting for a slot, so overload costs accuracy rather than
+    queueing delay.
+    """
+
+    MIN_OBSERVATIONS = 20
+
+    def __init__(self, budget: float, min_scale_factor: float = 1.05, max_scale_factor: float = 1.3,
+                 min_face_size: int = 80, window: int = 200, explore_every: int = 30,
+                 max_in_flight: int = None, smoothing: float = 0.2, max_keys: int = 64):
+        if budget <= 0:
+            raise ValueError("Detection latency budget must be positive")
+        self.budget = budget
+        self.min_scale_factor = min_scale_factor
+        self.max_scale_factor = max_scale_factor
+        self.min_face_size = min_face_size
+        self.window = window
+        self.explore_every = explore_every
+        self.max_in_flight = max_in_flight or os.cpu_count() or 1
+        self.smoothing = smoothing
+        self.max_keys = max_keys
+
+        self.in_flight = 0
+        self._cameras: "OrderedDict[str, _CameraState]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def begin(self, camera: Optional[str], frame_shape: Tuple[int, int],
+              frame_scale: int = 1) -> DetectionParams:
+        """
+        Parameters for the next frame of a camera; pair every call with end()
+
+        frame_scale is the frame's reduction from the original image (see
+        FaceDetector.detect()); min_face_size is divided by it.
+        """
+        with self._lock:
+            self.in_flight += 1
+            state = self._state(camera)
+            state.frames += 1
+            largest = min(frame_shape[:2])
+            smallest = max(1, int(round(self.min_face_size / frame_scale)))
+
+            if self.in_flight > self.max_in_flight:
+                state.degraded += 1
+                min_size, max_size = self._size_range(state, largest, smallest)
+                params = DetectionParams(self.max_scale_factor, min_size, max_size, "degraded")
+            elif self.explore_every and state.frames % self.explore_every == 0:
+                state.explored += 1
+                params = DetectionParams(state.scale_factor, smallest, None, "explore")
+            else:
+                min_size, max_size = self._size_range(state, largest, smallest)
+                params = state.last = DetectionParams(state.scale_factor, min_size, max_size, "tuned")
+            return params
+
+    def end(self, camera: Optional[str], params: DetectionParams, faces, elapsed: float):
+        """Record the faces found and the time taken with params from begin()"""
+        with self._lock:
+            self.in_flight -= 1
+            state = self._state(camera)
+            for (_, _, w, h) in faces:
+                state.face_sizes.append(int(min(w, h)))
+
+            # Exploration and overload frames do not reflect the tuned cost
+            if params.mode != "tuned":
+                return
+            if state.latency is None:
+                state.latency = elapsed
+            else:
+                state.latency += self.smoothing * (elapsed - state.latency)
+
+            # Bounded step of ln(scale_factor) towards latency == budget
+            ratio = min(1.25, max(0.8, state.latency / self.budget))
+            step = math.log(state.scale_factor) * ratio
+            state.scale_factor = min(self.max_scale_factor,
+                                     max(self.min_scale_factor, round(math.exp(step), 4)))
+
+    def stats(self) -> Dict:
+        """Budget, detections in flight and each camera's current parameters and latency"""
+        with self._lock:
+            cameras = {}
+            for camera, state in self._cameras.items():
+                sizes = np.array(state.face_sizes) if state.face_sizes else None
+                cameras[camera or "default"] = {
+                    "scale_factor": state.scale_factor,
+                    "min_size": state.last.min_size if state.last else None,
+                    "max_size": state.last.max_size if state.last else None,
+                    "latency_ms": None if state.latency is None else round(state.latency * 1000, 2),
+                    "frames": state.frames,
+                    "explored": state.explored,
+                    "degraded": state.degraded,
+                    "face_size_p10": None if sizes is None else int(np.percentile(sizes, 10)),
+                    "face_size_p90": None if sizes is None else int(np.percentile(sizes, 90)),
+                }
+            return {
+                "budget_ms": round(self.budget * 1000, 2),
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "cameras": cameras,
+            }
+
+    def _size_range(self, state: _CameraState, largest: int, smallest: int) -> Tuple[int, Optional[int]]:
+        """minSize / maxSize around the camera's observed face sizes, never below smallest"""
+        if len(state.face_sizes) < self.MIN_OBSERVATIONS:
+            return smallest, None
+        low, high = np.percentile(state.face_sizes, (5, 95))
+        min_size = max(smallest, int(low * 0.8))
+        max_size = max(int(high * 1.25), int(min_size * 1.5))
+        return min_size, (max_size if max_size < largest else None)
+
+    def _state(self, camera: Optional[str]) -> _CameraState:
+        state = self._cameras.pop(camera, None)
+        if state is None:
+            state = _CameraState(self.min_scale_factor, self.window)
+        self._cameras[camera] = state
+        while len(self._cameras) > self.max_keys:
+            self._cameras.popitem(last=False)
+        return state
@@ -0,0 +1,352 @@
+import os
+import threading
+import time
+from typing import Dict
+
+import cv2
+import numpy as np
+
+
+class FaceDetector:
+    """
+    Base class for face detection backends
+
+    Subclasses implement _detect(frame, gray, params, min_size) and return
+    an (N, 4) int32 array of (x, y, w, h) boxes in full-frame coordinates,
+    none smaller than min_size. detect()
+    wraps it and records per-call latency so backends can be compared in
+    production. params is an optional DetectionParams from a DetectionTuner;
+    only the cascade backends use it.
+
+    OpenCV models keep per-call state, so concurrent calls on one instance
+    can return wrong boxes. Subclasses implement _load_model() and use
+    model(), which gives every thread its own copy.
+    """
+
+    name = "base"
+    # Whether _detect() reads the histogram-equalized grayscale frame
+    needs_equalized_gray = False
+
+    def __init__(self, detection_scale: float = 1.0, min_size: int = 80):
+        self.detection_scale = detection_scale
+        # Smallest face side, in pixels, that is searched for or reported
+        self.min_size = min_size
+        self.calls = 0
+        self.total_time = 0.0
+        self.last_latency = 0.0
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+
+    def detect(self, frame, gray, params=None, frame_scale: int = 1) -> np.ndarray:
+        """
+        Detect faces given the BGR frame and its grayscale copy (see needs_equalized_gray)
+
+        frame_scale is how many pixels of the original image one pixel of
+        frame covers (the factor decode_frame() returned for a reduced
+        decode); min_size is divided by it, so the same faces are found as
+        in the full-size image.
+        """
+        min_size = max(1, int(round(self.min_size / frame_scale)))
+        start = time.perf_counter()
+        faces = self._detect(frame, gray, params, min_size)
+        elapsed = time.perf_counter() - start
+
+        with self._stats_lock:
+            self.calls += 1
+            self.total_time += elapsed
+            self.last_latency = elapsed
+        return faces
+
+    def model(self):
+        """This thread's copy of the backend model, loaded on first use"""
+        model = getattr(self._local, "model", None)
+        if model is None:
+            model = self._local.model = self._load_model()
+        return model
+
+    def latency_stats(self) -> Dict:
+        """Call count and last / mean latency in milliseconds"""
+        return {
+            "backend": self.name,
+            "calls": self.calls,
+            "last_ms": round(self.last_latency * 1000, 2),
+            "mean_ms": round(self.total_time / self.calls * 1000, 2) if self.calls else 0.0,
+        }
+
+    def _load_model(self):
+        raise NotImplementedError
+
+    def _detect(self, frame, gray, params, min_size) -> np.ndarray:
+        raise NotImplementedError
+
+
+class CascadeDetector(FaceDetector):
+    """
+    OpenCV cascade classifier (Haar or LBP)
+
+    With detection_scale < 1 the cascade first runs on a downscaled copy
+    with a coarser scale step (coarse_scale_factor); if refine_detections is
+    set, each candidate is re-detected on a full-resolution crop padded by
+    refine_margin (a fraction of the box size). min_size is the cascade's
+    minSize at full resolution.
+    """
+
+    name = "cascade"
+    needs_equalized_gray = True
+    DEFAULT_CASCADE = None
+
+    def __init__(self, cascade_path: str = None, detection_scale: float = 1.0,
+                 refine_detections: bool = True, refine_margin: float = 0.25,
+                 coarse_scale_factor: float = 1.2, min_size: int = 80):
+        super().__init__(detection_scale, min_size)
+        self.refine_detections = refine_detections
+        self.refine_margin = refine_margin
+        self.coarse_scale_factor = coarse_scale_factor
+
+        self.cascade_path = cascade_path or self.DEFAULT_CASCADE
+        # Load once here so a bad path fails at startup
+        self.model()
+
+    def _load_model(self):
+        cascade = cv2.CascadeClassifier(self.cascade_path)
+        if cascade.empty():
+            raise ValueError(f"Could not load cascade from {self.cascade_path}")
+        return cascade
+
+    def _detect(self, frame, gray, params, min_size):
+        if self.detection_scale < 1.0:
+            return self._detect_two_stage(gray, params, min_size)
+        if params is not None:
+            max_size = (params.max_size, params.max_size) if params.max_size else None
+            return self._run_cascade(gray, min_size=(params.min_size, params.min_size),
+                                     max_size=max_size, scale_factor=params.scale_factor)
+        return self._run_cascade(gray, min_size=(min_size, min_size))
+
+    def _run_cascade(self, gray, min_size=None, max_size=None, scale_factor=1.05):
+        """Run the cascade with the tuned detection parameters"""
+        min_size = min_size or (self.min_size, self.min_size)
+        extra = {'maxSize': max_size} if max_size else {}
+        return self.model().detectMultiScale(
+            gray,
+            scaleFactor=scale_factor,  # 1.05: more sensitive to face sizes
+            minNeighbors=4,     # Slightly less strict
+            minSize=min_size,   # Allow slightly smaller faces
+            flags=cv2.CASCADE_SCALE_IMAGE,
+            **extra
+        )
+
+    def _detect_two_stage(self, gray, params=None, min_size=None):
+        """
+        Find candidates on a downscaled copy, then refine them at full resolution
+
+        The cascade's pyramid depends on window size relative to the image,
+        so downscaling alone saves little; the saving comes from the coarse
+        pass stepping through fewer scales. The refinement then only searches
+        small crops around each candidate at sizes close to it, with the
+        fine step, so boxes keep full-resolution accuracy. A candidate that
+        the refinement cannot confirm keeps its mapped-back coarse box.
+        Tuned params narrow the coarse pass's size range and can only make
+        its step coarser.
+        """
+        scale = self.detection_scale
+        min_size = min_size or self.min_size
+        img_h, img_w = gray.shape[:2]
+        small = self._scratch((max(1, int(round(img_h * scale))), max(1, int(round(img_w * scale)))))
+        cv2.resize(gray, (small.shape[1], small.shape[0]), dst=small, interpolation=cv2.INTER_AREA)
+        min_side = max(1, int(round((params.min_size if params else min_size) * scale)))
+        max_size = None
+        scale_factor = self.coarse_scale_factor
+        if params is not None:
+            if params.max_size:
+                max_side = max(min_side, int(round(params.max_size * scale)))
+                max_size = (max_side, max_side)
+            scale_factor = max(scale_factor, params.scale_factor)
+        candidates = self._run_cascade(small, min_size=(min_side, min_side), max_size=max_size,
+                                       scale_factor=scale_factor)
+
+        faces = []
+        for (cx, cy, cw, ch) in candidates:
+            x, y, w, h = (int(round(v / scale)) for v in (cx, cy, cw, ch))
+            if not self.refine_detections:
+                faces.append((x, y, w, h))
+                continue
+
+            margin = int(max(w, h) * self.refine_margin)
+            x0, y0 = max(0, x - margin), max(0, y - margin)
+            x1, y1 = min(img_w, x + w + margin), min(img_h, y + h + margin)
+            # Sizes close to the candidate, but never below the configured minimum
+            min_side = max(min_size, int(min(w, h) * 0.7))
+            refined = self._run_cascade(gray[y0:y1, x0:x1],
+                                        min_size=(min_side, min_side),
+                                        max_size=(x1 - x0, y1 - y0))
+
+            if len(refined) > 0:
+                # Keep the largest hit; smaller ones are usually parts of the same face
+                rx, ry, rw, rh = max(refined, key=lambda r: r[2] * r[3])
+                faces.append((x0 + rx, y0 + ry, rw, rh))
+            else:
+                faces.append((x, y, w, h))
+
+        return np.array(faces, dtype=np.int32).reshape(-1, 4)
+
+    def _scratch(self, shape) -> np.ndarray:
+        """This thread's buffer for the downscaled frame, reused across frames"""
+        small = getattr(self._local, "small", None)
+        if small is None or small.shape != shape:
+            small = self._local.small = np.empty(shape, dtype=np.uint8)
+        return small
+
+
+class HaarCascadeDetector(CascadeDetector):
+    """Haar cascade shipped with opencv-python (the original detector)"""
+
+    name = "haar"
+    DEFAULT_CASCADE = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+
+
+class LBPCascadeDetector(CascadeDetector):
+    """
+    LBP cascade: faster than Haar at some cost in recall
+
+    opencv-python does not ship the LBP cascades; copy
+    lbpcascade_frontalface_improved.xml from OpenCV's data/lbpcascades
+    into data/models or pass cascade_path.
+    """
+
+    name = "lbp"
+    DEFAULT_CASCADE = "data/models/lbpcascade_frontalface_improved.xml"
+
+
+class YuNetDetector(FaceDetector):
+    """
+    OpenCV's YuNet CNN detector (cv2.FaceDetectorYN) on the CPU DNN backend
+
+    Needs face_detection_yunet_2023mar.onnx from the OpenCV model zoo in
+    data/models (or pass model_path). detection_scale shrinks the network
+    input; boxes are mapped back to full-frame coordinates.
+    """
+
+    name = "yunet"
+    DEFAULT_MODEL = "data/models/face_detection_yunet_2023mar.onnx"
+
+    def __init__(self, model_path: str = None, detection_scale: float = 1.0,
+                 score_threshold: float = 0.7, nms_threshold: float = 0.3,
+                 top_k: int = 50, min_size: int = 80):
+        super().__init__(detection_scale, min_size)
+
+        self.score_threshold = score_threshold
+        self.nms_threshold = nms_threshold
+        self.top_k = top_k
+
+        self.model_path = model_path or self.DEFAULT_MODEL
+        if not os.path.exists(self.model_path):
+            raise FileNotFoundError(f"YuNet model not found at {self.model_path}")
+        self.model()
+
+    def _load_model(self):
+        self._local.input_size = (320, 320)
+        return cv2.FaceDetectorYN.create(
+            self.model_path, "", (320, 320), self.score_threshold, self.nms_threshold,
+            self.top_k, cv2.dnn.DNN_BACKEND_OPENCV, cv2.dnn.DNN_TARGET_CPU
+        )
+
+    def _detect(self, frame, gray, params, min_size):
+        image = frame
+        scale = self.detection_scale
+        if scale < 1.0:
+            image = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+        model = self.model()
+        h, w = image.shape[:2]
+        if (w, h) != self._local.input_size:
+            model.setInputSize((w, h))
+            self._local.input_size = (w, h)
+
+        _, detections = model.detect(image)
+        if detections is None:
+            return np.empty((0, 4), dtype=np.int32)
+        return _clip_boxes(detections[:, :4] / scale, frame.shape, min_size)
+
+
+class ResNetSSDDetector(FaceDetector):
+    """
+    OpenCV's ResNet-10 SSD face detector via cv2.dnn on the CPU
+
+    Needs deploy.prototxt and res10_300x300_ssd_iter_140000.caffemodel in
+    data/models (or pass config_path / model_path). The network always
+    sees a 300x300 input, so detection_scale has no effect.
+    """
+
+    name = "ssd"
+    DEFAULT_CONFIG = "data/models/deploy.prototxt"
+    DEFAULT_MODEL = "data/models/res10_300x300_ssd_iter_140000.caffemodel"
+
+    def __init__(self, model_path: str = None, config_path: str = None,
+                 detection_scale: float = 1.0, score_threshold: float = 0.6,
+                 min_size: int = 80):
+        super().__init__(detection_scale, min_size)
+        self.score_threshold = score_threshold
+
+        self.model_path = model_path or self.DEFAULT_MODEL
+        self.config_path = config_path or self.DEFAULT_CONFIG
+        for path in (self.model_path, self.config_path):
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"SSD face model file not found at {path}")
+        self.model()
+
+    def _load_model(self):
+        net = cv2.dnn.readNetFromCaffe(self.config_path, self.model_path)
+        net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        return net
+
+    def _detect(self, frame, gray, params, min_size):
+        h, w = frame.shape[:2]
+        blob = cv2.dnn.blobFromImage(cv2.resize(frame, (300, 300)), 1.0, (300, 300),
+                                     (104.0, 177.0, 123.0))
+        net = self.model()
+        net.setInput(blob)
+        detections = net.forward()[0, 0]
+        detections = detections[detections[:, 2] >= self.score_threshold]
+
+        # Corners are normalized to [0, 1]; convert to pixel (x, y, w, h)
+        corners = detections[:, 3:7] * np.array([w, h, w, h], dtype=np.float32)
+        boxes = np.column_stack([corners[:, :2], corners[:, 2:] - corners[:, :2]])
+        return _clip_boxes(boxes, frame.shape, min_size)
+
+
+def _clip_boxes(boxes, shape, min_size) -> np.ndarray:
+    """Round float (x, y, w, h) boxes, clip them to the frame and drop tiny ones"""
+    img_h, img_w = shape[:2]
+    boxes = np.round(np.asarray(boxes, dtype=np.float32)).astype(np.int32).reshape(-1, 4)
+    x0 = np.clip(boxes[:, 0], 0, img_w)
+    y0 = np.clip(boxes[:, 1], 0, img_h)
+    x1 = np.clip(boxes[:, 0] + boxes[:, 2], 0, img_w)
+    y1 = np.clip(boxes[:, 1] + boxes[:, 3], 0, img_h)
+    boxes = np.column_stack([x0, y0, x1 - x0, y1 - y0]).astype(np.int32)
+    return boxes[(boxes[:, 2] >= min_size) & (boxes[:, 3] >= min_size)]
+
+
+DETECTORS = {
+    cls.name: cls
+    for cls in (HaarCascadeDetector, LBPCascadeDetector, YuNetDetector, ResNetSSDDetector)
+}
+
+
+def create_detector(name: str = "haar", detection_scale: float = 1.0,
+                    refine_detections: bool = True, refine_margin: float = 0.25,
+                    **options) -> FaceDetector:
+    """
+    Build a detector backend by name ('haar', 'lbp', 'yunet' or 'ssd')
+
+    The refinement settings only apply to the cascade backends; any other
+    keyword options (model paths, thresholds) go to the backend as-is.
+    """
+    if name not in DETECTORS:
+        raise ValueError(f"Unknown face detector '{name}'. Choose from: {', '.join(DETECTORS)}")
+
+    cls = DETECTORS[name]
+    if issubclass(cls, CascadeDetector):
+        options.setdefault('refine_detections', refine_detections)
+        options.setdefault('refine_margin', refine_margin)
+    return cls(detection_scale=detection_scale, **options)
@@ -0,0 +1,241 @@
+import os
+import threading
+from typing import Tuple
+
+import cv2
+import numpy as np
+
+
+class FaceEmbedder:
+    """
+    Fixed-length face embeddings from OpenCV's SFace model (cv2.FaceRecognizerSF)
+
+    Needs face_recognition_sface_2021dec.onnx from the OpenCV model zoo in
+    data/models (or pass model_path). Runs on the CPU DNN backend. Faces are
+    the same preprocessed grayscale ROIs the LBPH path uses, so embeddings
+    can be rebuilt from the stored gallery at any time. Those are not the
+    landmark-aligned colour crops SFace was trained on, so its published
+    cut-off (cosine 0.363) does not carry over: the match threshold has to
+    be calibrated on the gallery (see calibration_scores()). Each thread
+    gets its own copy of the network, since a DNN model is not safe to share.
+    """
+
+    DEFAULT_MODEL = "data/models/face_recognition_sface_2021dec.onnx"
+    INPUT_SIZE = (112, 112)
+    DIM = 128
+
+    def __init__(self, model_path: str = None):
+        self.model_path = model_path or self.DEFAULT_MODEL
+        if not os.path.exists(self.model_path):
+            raise FileNotFoundError(f"SFace model not found at {self.model_path}")
+        self._local = threading.local()
+
+    @property
+    def model(self):
+        """This thread's copy of the SFace network"""
+        model = getattr(self._local, "model", None)
+        if model is None:
+            model = self._local.model = cv2.FaceRecognizerSF.create(
+                self.model_path, "", cv2.dnn.DNN_BACKEND_OPENCV, cv2.dnn.DNN_TARGET_CPU
+            )
+        return model
+
+    def embed(self, faces) -> np.ndarray:
+        """Return an (N, DIM) float32 matrix of L2-normalized embeddings"""
+        model = self.model
+        vectors = np.empty((len(faces), self.DIM), dtype=np.float32)
+        for i, face in enumerate(faces):
+            image = cv2.resize(face, self.INPUT_SIZE, interpolation=cv2.INTER_AREA)
+            if image.ndim == 2:
+                image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+            vectors[i] = model.feature(image).ravel()
+        return _normalize(vectors)
+
+
+class EmbeddingIndex:
+    """
+    Contiguous float32 embedding matrix with vectorized top-k cosine search
+
+    Rows are L2-normalized, so a single matrix product scores every probe
+    against the whole gallery. A label (user) may own several rows; searches
+    score each label by its best row and return the k best labels, as
+    LBPHMatcher.predict does, so one user's samples never crowd the others
+    out of the top k. Galleries of coarse_threshold rows or more also get a
+    coarse inverted-file index (spherical k-means centroids); a search then
+    only scores the rows in the n_probe closest lists.
+
+    Instances are never modified in place: add() returns a new index, so a
+    search running on another thread always sees one consistent gallery.
+    """
+
+    VECTORS_FILE = "embeddings.npy"
+    LABELS_FILE = "embedding_labels.npy"
+
+    def __init__(self, vectors=None, labels=None, dim: int = FaceEmbedder.DIM,
+                 coarse_threshold: int = 20000, n_probe: int = 8):
+        if vectors is None:
+            vectors = np.empty((0, dim), dtype=np.float32)
+            labels = np.empty(0, dtype=np.int32)
+        labels = np.asarray(labels, dtype=np.int32).ravel()
+        if np.any(labels[1:] < labels[:-1]):
+            # Rows sorted by label so per-label maximums are one reduceat
+            # (saved indexes are already sorted and stay memory-mapped)
+            order = np.argsort(labels, kind='stable')
+            vectors, labels = np.asarray(vectors)[order], labels[order]
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.labels = np.ascontiguousarray(labels, dtype=np.int32)
+        self.dim = self.vectors.shape[1]
+        self.coarse_threshold = coarse_threshold
+        self.n_probe = n_probe
+
+        self.centroids = None
+        self.lists = None
+        if len(self) >= coarse_threshold:
+            self._build_coarse_index()
+
+    def __len__(self):
+        return len(self.labels)
+
+    def add(self, vectors: np.ndarray, label: int) -> "EmbeddingIndex":
+        """Return a new index with the given rows appended under one label"""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        return EmbeddingIndex(
+            np.vstack([self.vectors, vectors]),
+            np.concatenate([self.labels, np.full(len(vectors), label, dtype=np.int32)]),
+            coarse_threshold=self.coarse_threshold,
+            n_probe=self.n_probe,
+        )
+
+    def search(self, queries: np.ndarray, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the k most similar labels for every query
+
+        A label's score is the cosine similarity of its best row. Returns
+        (labels, scores), both shaped (len(queries), k) and sorted by
+        descending score. Missing neighbours get label -1.
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        labels = np.full((len(queries), k), -1, dtype=np.int32)
+        scores = np.full((len(queries), k), -1.0, dtype=np.float32)
+        if len(self) == 0 or len(queries) == 0:
+            return labels, scores
+
+        if self.centroids is None:
+            found_labels, found_scores = _top_k_labels(queries @ self.vectors.T, self.labels, k)
+            found = found_labels.shape[1]
+            labels[:, :found] = found_labels
+            scores[:, :found] = found_scores
+            return labels, scores
+
+        # Coarse index: score only the rows of the closest lists per query
+        probe = min(self.n_probe, len(self.centroids))
+        nearest_lists, _ = _top_k(queries @ self.centroids.T, probe)
+        for i, query in enumerate(queries):
+            # Sorted rows keep each label's candidates together
+            candidates = np.sort(np.concatenate([self.lists[c] for c in nearest_lists[i]]))
+            found_labels, found_scores = _top_k_labels(
+                query[None, :] @ self.vectors[candidates].T, self.labels[candidates], k)
+            found = found_labels.shape[1]
+            labels[i, :found] = found_labels[0]
+            scores[i, :found] = found_scores[0]
+        return labels, scores
+
+    def save(self, directory: str) -> dict:
+        """Write the matrix and labels as .npy files; returns {file: path}"""
+        paths = {
+            self.VECTORS_FILE: os.path.join(directory, self.VECTORS_FILE),
+            self.LABELS_FILE: os.path.join(directory, self.LABELS_FILE),
+        }
+        np.save(paths[self.VECTORS_FILE], self.vectors)
+        np.save(paths[self.LABELS_FILE], self.labels)
+        return paths
+
+    @classmethod
+    def load(cls, directory: str, **kwargs) -> "EmbeddingIndex":
+        """Memory-map a saved index, or return an empty one if there is none"""
+        vectors_path = os.path.join(directory, cls.VECTORS_FILE)
+        labels_path = os.path.join(directory, cls.LABELS_FILE)
+        if not (os.path.exists(vectors_path) and os.path.exists(labels_path)):
+            return cls(**kwargs)
+        return cls(np.load(vectors_path, mmap_mode='r'), np.load(labels_path), **kwargs)
+
+    def _build_coarse_index(self, iterations: int = 10):
+        """Cluster the gallery with spherical k-means into ~sqrt(N) lists"""
+        n_lists = max(1, int(np.sqrt(len(self))))
+        rng = np.random.default_rng(0)
+        centroids = self.vectors[rng.choice(len(self), n_lists, replace=False)].copy()
+
+        for _ in range(iterations):
+            assignments = np.argmax(self.vectors @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, self.vectors)
+            # Empty clusters keep their previous centroid
+            empty = ~np.any(sums, axis=1)
+            sums[empty] = centroids[empty]
+            centroids = _normalize(sums)
+
+        assignments = np.argmax(self.vectors @ centroids.T, axis=1)
+        self.centroids = centroids
+        self.lists = [np.flatnonzero(assignments == c) for c in range(n_lists)]
+
+
+def calibration_scores(vectors: np.ndarray, labels: np.ndarray,
+                       chunk_rows: int = 1024) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Leave-one-out match scores of every gallery row, for choosing a threshold
+
+    Each row is searched as a probe against all other rows, scoring labels
+    by their best row as EmbeddingIndex.search does. Returns (genuine,
+    impostor): the row's score for its own label (NaN when the label has no
+    other row) and for the best other label (NaN with a single label).
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    labels = np.asarray(labels).ravel()
+    genuine = np.full(len(labels), np.nan, dtype=np.float32)
+    impostor = np.full(len(labels), np.nan, dtype=np.float32)
+    for start in range(0, len(labels), chunk_rows):
+        stop = min(start + chunk_rows, len(labels))
+        scores = vectors[start:stop] @ vectors.T
+        scores[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+        same = labels[start:stop, None] == labels[None, :]
+        own = np.where(same, scores, -np.inf).max(axis=1)
+        other = np.where(same, -np.inf, scores).max(axis=1)
+        genuine[start:stop] = np.where(np.isfinite(own), own, np.nan)
+        impostor[start:stop] = np.where(np.isfinite(other), other, np.nan)
+    return genuine, impostor
+
+
+def calibrated_threshold(impostor: np.ndarray, false_accept_rate: float) -> float:
+    """Lowest threshold at which at most false_accept_rate of the impostor scores match (score >= threshold)"""
+    impostor = np.sort(np.asarray(impostor, dtype=np.float64)[~np.isnan(impostor)])
+    if len(impostor) == 0:
+        raise ValueError("Calibration needs at least two enrolled users")
+    allowed = int(np.floor(false_accept_rate * len(impostor)))
+    if allowed == 0:
+        return float(np.nextafter(impostor[-1], np.inf))
+    return float(np.nextafter(impostor[-allowed - 1], np.inf))
+
+
+def _top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Column indices and values of the k largest scores per row, best first"""
+    k = min(k, scores.shape[1])
+    if k < scores.shape[1]:
+        idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        idx = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    top = np.take_along_axis(scores, idx, axis=1)
+    order = np.argsort(-top, axis=1)
+    return np.take_along_axis(idx, order, axis=1), np.take_along_axis(top, order, axis=1)
+
+
+def _top_k_labels(scores: np.ndarray, row_labels: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """The k best labels per query by their best row's score; row_labels must be sorted"""
+    unique_labels, starts = np.unique(row_labels, return_index=True)
+    per_label = np.maximum.reduceat(scores, starts, axis=1)
+    idx, top = _top_k(per_label, k)
+    return unique_labels[idx], top
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
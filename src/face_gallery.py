@@ -0,0 +1,246 @@
+import json
+import os
+import pickle
+import re
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+
+class SampleStore:
+    """
+    Append-only, memory-mapped store for preprocessed face samples
+
+    Samples live in one flat file of fixed-stride uint8 rows (one 200x200
+    ROI per row) that is opened with np.memmap, so loading is zero-copy and
+    every worker process shares the same pages through the OS page cache.
+    A small JSON index maps each user to their row numbers; its revision
+    counter goes up with every change, so a model can record which state of
+    the gallery it was trained from.
+    """
+
+    SAMPLES_FILE = "samples.bin"
+    INDEX_FILE = "index.json"
+    # Enough of the index file to cover every field before the rows
+    HEADER_BYTES = 512
+
+    def __init__(self, directory: str, face_size: Tuple[int, int] = (200, 200)):
+        self.directory = directory
+        self.face_size = tuple(face_size)
+        self.stride = self.face_size[0] * self.face_size[1]
+        self.samples_path = os.path.join(directory, self.SAMPLES_FILE)
+        self.index_path = os.path.join(directory, self.INDEX_FILE)
+
+        # Committed rows and user -> row numbers, in enrollment order
+        self.count = 0
+        self.generation = 0
+        self.revision = 0
+        self.rows: Dict[str, List[int]] = {}
+
+        os.makedirs(directory, exist_ok=True)
+
+    def exists(self) -> bool:
+        """Whether a store has been written to this directory"""
+        return os.path.exists(self.index_path)
+
+    def load(self, index_path: str = None) -> Tuple[List[str], Dict[str, List[np.ndarray]]]:
+        """
+        Map the sample file and return (names, samples)
+
+        The returned samples are read-only views into the memory map, so
+        nothing is copied into the process heap. index_path can point at a
+        copy of the index (e.g. inside a model snapshot) to load the gallery
+        as it was when that copy was taken.
+        """
+        self.count = 0
+        self.generation = 0
+        self.revision = 0
+        self.samples_path = os.path.join(self.directory, self.SAMPLES_FILE)
+        self.rows = {}
+
+        index_path = index_path or self.index_path
+        if not os.path.exists(index_path):
+            return [], {}
+
+        with open(index_path, 'r') as f:
+            index = json.load(f)
+
+        if tuple(index.get("face_size", self.face_size)) != self.face_size:
+            raise ValueError(f"Sample store face size {index['face_size']} does not match {self.face_size}")
+
+        self.count = index["count"]
+        self.generation = index.get("generation", 0)
+        self.revision = index.get("revision", 0)
+        self.samples_path = os.path.join(self.directory, index.get("samples_file", self.SAMPLES_FILE))
+        self.rows = {name: list(rows) for name, rows in index["rows"]}
+
+        data = self._map()
+        names = list(self.rows)
+        samples = {name: [data[row] for row in rows] for name, rows in self.rows.items() if rows}
+        return names, samples
+
+    def append(self, name: str, samples: List[np.ndarray]):
+        """Write a user's new samples to the end of the store"""
+        self.extend({name: samples})
+
+    def extend(self, users: Dict[str, List[np.ndarray]]):
+        """Write new samples of several users with one sync and one index update"""
+        with open(self.samples_path, 'r+b' if os.path.exists(self.samples_path) else 'wb') as f:
+            # Anything past the committed count is a torn write and is overwritten
+            f.seek(self.count * self.stride)
+            for name, samples in users.items():
+                rows = self.rows.setdefault(name, [])
+                for sample in samples:
+                    sample = np.ascontiguousarray(sample, dtype=np.uint8)
+                    if sample.shape != self.face_size:
+                        raise ValueError(f"Expected a {self.face_size} sample, got {sample.shape}")
+                    f.write(sample.tobytes())
+                    rows.append(self.count)
+                    self.count += 1
+            f.flush()
+            os.fsync(f.fileno())
+
+        self._write_index()
+
+    def replace(self, name: str, keep: List[int], samples: List[np.ndarray]):
+        """
+        Keep only some of a user's samples and append new ones
+
+        keep lists positions in the user's current samples. Dropped rows
+        stay in the file until compact().
+        """
+        rows = self.rows.get(name, [])
+        self.rows[name] = [rows[i] for i in keep]
+        self.append(name, samples)
+
+    def dead_rows(self) -> int:
+        """Rows in the sample file that no user references any more"""
+        return self.count - sum(len(rows) for rows in self.rows.values())
+
+    def remove(self, name: str):
+        """Drop a user from the index; their rows are reclaimed by compact()"""
+        if self.rows.pop(name, None) is not None:
+            self._write_index()
+
+    def compact(self):
+        """Rewrite the sample file without rows of deleted users or evicted samples"""
+        if self.dead_rows() == 0:
+            return
+
+        data = self._map()
+        # Compacted rows go to a new file so readers of an older index never
+        # map a file that is shorter than the rows it names
+        generation = self.generation + 1
+        new_path = os.path.join(self.directory, f"samples-{generation}.bin")
+        rows = {}
+        count = 0
+        with open(new_path, 'wb') as f:
+            for name, old_rows in self.rows.items():
+                rows[name] = []
+                for row in old_rows:
+                    f.write(data[row].tobytes())
+                    rows[name].append(count)
+                    count += 1
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.samples_path = new_path
+        self.generation = generation
+        self.rows = rows
+        self.count = count
+        self._write_index()
+        # The old file stays until no published model needs it (see remove_unused)
+
+    def migrate_from_pickles(self, names_file: str, samples_file: str) -> bool:
+        """
+        One-time import of the legacy names.pkl / samples.pkl gallery
+
+        The pickles are left in place as a backup. Returns True if anything
+        was migrated.
+        """
+        if self.exists() or not os.path.exists(names_file):
+            return False
+
+        with open(names_file, 'rb') as f:
+            names = pickle.load(f)
+
+        samples = {}
+        if os.path.exists(samples_file):
+            with open(samples_file, 'rb') as f:
+                samples = pickle.load(f)
+
+        self.count = 0
+        self.rows = {}
+        self.extend({name: samples.get(name) or [] for name in names})
+        return True
+
+    def read_revision(self, index_path: str = None) -> int:
+        """Revision recorded in an index file, without loading the store"""
+        return self._read_header(index_path).get("revision", 0)
+
+    def read_samples_file(self, index_path: str = None) -> str:
+        """Name of the sample file an index file maps, or None without an index"""
+        header = self._read_header(index_path)
+        return header.get("samples_file", self.SAMPLES_FILE) if header else None
+
+    def remove_unused(self, in_use):
+        """
+        Delete sample files left behind by compaction that no index in use maps
+
+        in_use holds the file names mapped by the indexes of published models
+        (which workers may still load); the live index's file is always kept.
+        """
+        if not self.exists():
+            return
+        in_use = set(in_use) | {self.read_samples_file()}
+        for entry in os.listdir(self.directory):
+            if _SAMPLE_FILE.fullmatch(entry) and entry not in in_use:
+                try:
+                    # Workers that already mapped it keep their pages
+                    os.remove(os.path.join(self.directory, entry))
+                except OSError:
+                    pass
+
+    def _read_header(self, index_path: str = None) -> dict:
+        """The fields of an index file other than the rows ({} if there is none)"""
+        try:
+            with open(index_path or self.index_path, 'r') as f:
+                # The header fields are written before the (long) row lists
+                head = f.read(self.HEADER_BYTES).split('"rows"', 1)
+                if len(head) == 2:
+                    return json.loads(head[0] + '"rows": []}')
+                f.seek(0)
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _map(self) -> np.ndarray:
+        """Memory-map the committed rows of the sample file"""
+        if self.count == 0:
+            return np.empty((0,) + self.face_size, dtype=np.uint8)
+        # A plain ndarray view of the map: indexing a np.memmap row by row is
+        # several times slower, and the rows are still backed by the mapping
+        return np.asarray(np.memmap(self.samples_path, dtype=np.uint8, mode='r',
+                                    shape=(self.count,) + self.face_size))
+
+    def _write_index(self):
+        """Atomically replace the index file"""
+        self.revision += 1
+        index = {
+            "face_size": list(self.face_size),
+            "count": self.count,
+            "generation": self.generation,
+            "revision": self.revision,
+            "samples_file": os.path.basename(self.samples_path),
+            # A list of pairs keeps enrollment order, which defines the labels
+            "rows": [[name, rows] for name, rows in self.rows.items()],
+        }
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(json.dumps(index))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.index_path)
+
+
+_SAMPLE_FILE = re.compile(r"samples(-\d+)?\.bin")
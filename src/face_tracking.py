@@ -0,0 +1,205 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from lbph_matcher import LBPHMatcher
+
+
+class Track:
+    """A face followed across frames together with its last verified identity"""
+
+    __slots__ = ("track_id", "box", "name", "confidence", "candidates",
+                 "verified_at", "model_version", "missed", "seen_at", "continuous",
+                 "appearance")
+
+    def __init__(self, track_id: int, box, now: float = 0.0):
+        self.track_id = track_id
+        self.box = tuple(int(v) for v in box)
+        self.name = "Unknown"
+        self.confidence = 0.0
+        self.candidates = []
+        self.verified_at = 0.0
+        self.model_version = None
+        self.missed = 0
+        self.seen_at = now
+        # Whether the last match followed on from the previous frame smoothly
+        self.continuous = True
+        # LBP histogram of the face when its identity was last verified
+        self.appearance = None
+
+
+class FaceTracker:
+    """
+    Associates face boxes across consecutive frames of one camera
+
+    Boxes are matched to existing tracks greedily by IoU. A matched track
+    reuses its cached identity until it is due for re-verification, so full
+    recognition only runs for new faces, faces still unknown, tracks older
+    than reverify_interval seconds, and after the model changed. Tracks that
+    go unmatched for more than max_missed frames are dropped.
+
+    Overlap alone cannot tell one person from the next stepping into the
+    same spot, so an identity is only reused for a track matched in the
+    previous frame, at most max_gap seconds ago, whose box moved or resized
+    by less than max_jump of its size, and whose face still looks like the
+    one that was verified: the chi-square distance between small LBP
+    histograms (per grid cell) must stay below appearance_threshold.
+    """
+
+    # Appearance histograms: 64x64 faces, 4x4 cells of 16 LBP codes each
+    APPEARANCE_SIZE = (64, 64)
+
+    def __init__(self, iou_threshold: float = 0.3, reverify_interval: float = 10.0,
+                 max_missed: int = 1, max_gap: float = 1.0, max_jump: float = 0.25,
+                 appearance_threshold: float = 0.25):
+        self.iou_threshold = iou_threshold
+        self.reverify_interval = reverify_interval
+        self.max_missed = max_missed
+        self.max_gap = max_gap
+        self.max_jump = max_jump
+        self.appearance_threshold = appearance_threshold
+        self.tracks: List[Track] = []
+        self.last_seen = time.monotonic()
+        # Held for a whole associate/recognize/remember step
+        self.lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._lbp = LBPHMatcher(None, np.empty(0), neighbors=4, grid_x=4, grid_y=4)
+
+    def associate(self, boxes, now: float = None) -> List[Optional[Track]]:
+        """Match boxes to tracks; returns the matched track (or None) per box"""
+        now = time.monotonic() if now is None else now
+        self.last_seen = now
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        assigned: List[Optional[Track]] = [None] * len(boxes)
+        matched = set()
+
+        if len(boxes) and self.tracks:
+            ious = _iou_matrix(boxes, np.array([t.box for t in self.tracks], dtype=np.float64))
+            # Highest-overlap pairs first; each box and track is used once
+            for flat in np.argsort(-ious, axis=None):
+                i, j = np.unravel_index(flat, ious.shape)
+                if ious[i, j] < self.iou_threshold:
+                    break
+                if assigned[i] is not None or j in matched:
+                    continue
+                track = self.tracks[j]
+                box = tuple(int(v) for v in boxes[i])
+                track.continuous = (track.missed == 0 and now - track.seen_at <= self.max_gap
+                                    and not _jumped(track.box, box, self.max_jump))
+                track.box = box
+                track.missed = 0
+                track.seen_at = now
+                assigned[i] = track
+                matched.add(j)
+
+        survivors = []
+        for j, track in enumerate(self.tracks):
+            if j not in matched:
+                track.missed += 1
+            if track.missed <= self.max_missed:
+                survivors.append(track)
+        self.tracks = survivors
+        return assigned
+
+    def describe(self, faces) -> np.ndarray:
+        """Appearance histograms for a batch of preprocessed faces, one row per face"""
+        if len(faces) == 0:
+            return np.empty((0, self._lbp.width), dtype=np.float32)
+        small = np.stack([cv2.resize(face, self.APPEARANCE_SIZE, interpolation=cv2.INTER_AREA)
+                          for face in faces])
+        return self._lbp.extract(small)
+
+    def needs_recognition(self, track: Optional[Track], model_version, now: float,
+                          appearance: np.ndarray = None) -> bool:
+        """Whether a box's identity has to be (re)computed this frame"""
+        return (
+            track is None
+            or not track.continuous
+            or track.name == "Unknown"
+            or track.model_version != model_version
+            or now - track.verified_at >= self.reverify_interval
+            or (appearance is not None and track.appearance is not None
+                and self.appearance_distance(track.appearance, appearance) > self.appearance_threshold)
+        )
+
+    def appearance_distance(self, a: np.ndarray, b: np.ndarray) -> float:
+        """Chi-square distance between two appearance histograms, per grid cell"""
+        a = np.asarray(a, dtype=np.float64)
+        b = np.asarray(b, dtype=np.float64)
+        total = a + b
+        chi2 = 2.0 * np.sum(np.divide((a - b) ** 2, total, out=np.zeros_like(total), where=total > 0))
+        return float(chi2) / (self._lbp.grid_x * self._lbp.grid_y)
+
+    def remember(self, box, track: Optional[Track], identity: Tuple[str, float, list],
+                 model_version, now: float, appearance: np.ndarray = None) -> Track:
+        """Store a freshly recognized identity, starting a track if needed"""
+        if track is None:
+            track = Track(next(self._ids), box, now)
+            self.tracks.append(track)
+        track.name, track.confidence, track.candidates = identity
+        track.verified_at = now
+        track.model_version = model_version
+        track.appearance = appearance
+        return track
+
+
+class TrackerRegistry:
+    """
+    One FaceTracker per kiosk, created on first use
+
+    Trackers idle for longer than idle_timeout seconds are discarded, and at
+    most max_trackers are kept (least recently used first out), so clients
+    inventing kiosk ids cannot grow memory without bound. Trackers live in
+    process memory: with several workers each keeps its own.
+    """
+
+    def __init__(self, idle_timeout: float = 60.0, max_trackers: int = 64, **tracker_options):
+        self.idle_timeout = idle_timeout
+        self.max_trackers = max_trackers
+        self.tracker_options = tracker_options
+        self._trackers: "OrderedDict[str, FaceTracker]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, kiosk_id: str) -> FaceTracker:
+        now = time.monotonic()
+        with self._lock:
+            for key in [k for k, t in self._trackers.items() if now - t.last_seen > self.idle_timeout]:
+                del self._trackers[key]
+
+            tracker = self._trackers.pop(kiosk_id, None)
+            if tracker is None:
+                tracker = FaceTracker(**self.tracker_options)
+            self._trackers[kiosk_id] = tracker
+
+            while len(self._trackers) > self.max_trackers:
+                self._trackers.popitem(last=False)
+            return tracker
+
+
+def _jumped(old, new, max_jump: float) -> bool:
+    """Whether a box moved or changed size by more than max_jump of its size"""
+    ox, oy, ow, oh = old
+    nx, ny, nw, nh = new
+    shift = max(abs((nx + nw / 2) - (ox + ow / 2)), abs((ny + nh / 2) - (oy + oh / 2)))
+    return (shift > max_jump * max(ow, oh)
+            or abs(nw - ow) > max_jump * ow
+            or abs(nh - oh) > max_jump * oh)
+
+
+def _iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU between (N, 4) and (M, 4) arrays of (x, y, w, h) boxes"""
+    ax0, ay0 = a[:, 0:1], a[:, 1:2]
+    ax1, ay1 = ax0 + a[:, 2:3], ay0 + a[:, 3:4]
+    bx0, by0 = b[:, 0], b[:, 1]
+    bx1, by1 = bx0 + b[:, 2], by0 + b[:, 3]
+
+    iw = np.clip(np.minimum(ax1, bx1) - np.maximum(ax0, bx0), 0, None)
+    ih = np.clip(np.minimum(ay1, by1) - np.maximum(ay0, by0), 0, None)
+    inter = iw * ih
+    union = a[:, 2:3] * a[:, 3:4] + b[:, 2] * b[:, 3] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0)
@@ -0,0 +1,66 @@
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+# Start-of-frame markers carry the image size; C4, C8 and CC are other segments
+_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+_REDUCED_FLAGS = {
+    (False, 1): cv2.IMREAD_COLOR,
+    (False, 2): cv2.IMREAD_REDUCED_COLOR_2,
+    (False, 4): cv2.IMREAD_REDUCED_COLOR_4,
+    (False, 8): cv2.IMREAD_REDUCED_COLOR_8,
+    (True, 1): cv2.IMREAD_GRAYSCALE,
+    (True, 2): cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    (True, 4): cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    (True, 8): cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+
+def jpeg_size(data) -> Optional[Tuple[int, int]]:
+    """(width, height) from a JPEG's frame header, or None if data is not a readable JPEG"""
+    data = memoryview(data)
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    pos = 2
+    while pos + 9 <= len(data):
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            pos += 1
+            continue
+        if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:
+            # Markers without a length field
+            pos += 2
+            continue
+        if marker in _SOF_MARKERS:
+            height = (data[pos + 5] << 8) | data[pos + 6]
+            width = (data[pos + 7] << 8) | data[pos + 8]
+            return width, height
+        pos += 2 + ((data[pos + 2] << 8) | data[pos + 3])
+    return None
+
+
+def decode_frame(data, grayscale: bool = False, max_width: int = None) -> Tuple[Optional[np.ndarray], int]:
+    """
+    Decode encoded image bytes, skipping work the detector does not need
+
+    grayscale decodes straight to one channel (the JPEG luma plane, without
+    the colour conversion). With max_width, a JPEG wider than twice that is
+    decoded at 1/2, 1/4 or 1/8 size by the decoder itself (IMREAD_REDUCED_*),
+    keeping it at least max_width wide. Returns (image or None, factor);
+    multiply coordinates in the decoded image by factor to get coordinates
+    in the original.
+    """
+    factor = 1
+    if max_width:
+        size = jpeg_size(data)
+        if size is not None:
+            while factor < 8 and size[0] // (factor * 2) >= max_width:
+                factor *= 2
+
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    return cv2.imdecode(buffer, _REDUCED_FLAGS[(grayscale, factor)]), factor
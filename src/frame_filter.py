@@ -0,0 +1,93 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import cv2
+
+
+class FrameFilter:
+    """
+    Cheap checks that reject frames before face detection runs
+
+    Frames are rejected when they are too dark or too bright (mean
+    brightness), too blurry (variance of the Laplacian) or, for a given
+    camera key, practically identical to the last frame that was accepted
+    from that camera (mean absolute difference of small thumbnails). All
+    checks run on a copy downscaled to analysis_width, so they cost a small
+    fraction of a detection pass. Rejections are counted per reason so the
+    thresholds can be tuned from the stats.
+    """
+
+    REASONS = ("too_dark", "too_bright", "blurry", "unchanged")
+    THUMBNAIL_SIZE = (80, 60)
+
+    def __init__(self, min_brightness: float = 40.0, max_brightness: float = 220.0,
+                 min_sharpness: float = 15.0, min_change: float = 2.0,
+                 analysis_width: int = 320, max_keys: int = 64):
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+        self.min_sharpness = min_sharpness
+        self.min_change = min_change
+        self.analysis_width = analysis_width
+        self.max_keys = max_keys
+
+        self.checked = 0
+        self.rejected = {reason: 0 for reason in self.REASONS}
+        self._previous: "OrderedDict[str, object]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, frame, key: str = None) -> Optional[str]:
+        """
+        Return the reason to skip this frame, or None if it should be processed
+
+        Pass the camera's key (e.g. the kiosk id) to enable frame differencing.
+        """
+        gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if gray.shape[1] > self.analysis_width:
+            scale = self.analysis_width / gray.shape[1]
+            gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+        reason = None
+        thumbnail = None
+        brightness = float(gray.mean())
+        if brightness < self.min_brightness:
+            reason = "too_dark"
+        elif brightness > self.max_brightness:
+            reason = "too_bright"
+        elif cv2.Laplacian(gray, cv2.CV_64F).var() < self.min_sharpness:
+            reason = "blurry"
+        elif key is not None:
+            thumbnail = cv2.resize(gray, self.THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA)
+            with self._lock:
+                previous = self._previous.get(key)
+            if previous is not None and float(cv2.absdiff(thumbnail, previous).mean()) < self.min_change:
+                reason = "unchanged"
+
+        with self._lock:
+            self.checked += 1
+            if reason is not None:
+                self.rejected[reason] += 1
+            elif thumbnail is not None:
+                # Compare later frames against the last one that was actually processed
+                self._previous.pop(key, None)
+                self._previous[key] = thumbnail
+                while len(self._previous) > self.max_keys:
+                    self._previous.popitem(last=False)
+        return reason
+
+    def stats(self) -> Dict:
+        """Frames checked, accepted and rejected per reason, plus the thresholds"""
+        with self._lock:
+            rejected = dict(self.rejected)
+            checked = self.checked
+        return {
+            "checked": checked,
+            "accepted": checked - sum(rejected.values()),
+            "rejected": rejected,
+            "thresholds": {
+                "min_brightness": self.min_brightness,
+                "max_brightness": self.max_brightness,
+                "min_sharpness": self.min_sharpness,
+                "min_change": self.min_change,
+            },
+        }
@@ -0,0 +1,353 @@
+import copy
+import json
+import os
+import shutil
+import uuid
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+
+class LBPHMatcher:
+    """
+    NumPy re-implementation of OpenCV's LBPH prediction, batched over faces
+
+    Probe faces go through the same circular LBP operator and spatial
+    histogram as cv2.face.LBPHFaceRecognizer, and are compared against every
+    gallery histogram with the chi-square distance OpenCV uses
+    (HISTCMP_CHISQR_ALT). All faces of a frame are scored in one batched
+    operation, and the k nearest labels are returned for each.
+
+    The gallery matrix is normally taken straight from a trained OpenCV model
+    (from_recognizer), so predictions match recognizer.predict() up to
+    floating point rounding. It is held in immutable segments, and
+    with_labels() derives a new matcher that adds one segment with the
+    changed labels' rows, so adding users copies their rows only, never the
+    rest of the gallery. Instances are not modified after they are built.
+    """
+
+    MANIFEST_FILE = "lbph_matcher.json"
+
+    def __init__(self, histograms: np.ndarray, labels: np.ndarray, radius: int = 1,
+                 neighbors: int = 8, grid_x: int = 8, grid_y: int = 8,
+                 chunk_size: int = 1 << 24, segment_rows: int = 1024):
+        self.radius = radius
+        self.neighbors = neighbors
+        self.grid_x = grid_x
+        self.grid_y = grid_y
+        self.patterns = 1 << neighbors
+        self.width = grid_x * grid_y * self.patterns
+        # Upper bound on floats per intermediate (faces x rows x bins) block
+        self.chunk_size = chunk_size
+        # Small segments at the tail are merged up to this many rows
+        self.segment_rows = segment_rows
+
+        labels = np.asarray(labels, dtype=np.int32).ravel()
+        segments = ()
+        owner = np.empty(0, dtype=np.int32)
+        if len(labels):
+            segments = (_Segment.build(histograms, labels, self.width),)
+            owner = np.full(int(labels.max()) + 1, -1, dtype=np.int32)
+            owner[labels] = 0
+        self._assemble(segments, owner)
+
+        self._offsets = self._sampling_offsets()
+
+    @classmethod
+    def from_recognizer(cls, recognizer, **kwargs) -> "LBPHMatcher":
+        """Build a matcher from a trained cv2.face.LBPHFaceRecognizer"""
+        histograms = recognizer.getHistograms()
+        labels = recognizer.getLabels()
+        if not histograms or labels is None:
+            histograms, labels = None, np.empty(0, dtype=np.int32)
+        else:
+            histograms = np.vstack([h.reshape(1, -1) for h in histograms])
+        return cls(
+            histograms, labels,
+            radius=recognizer.getRadius(),
+            neighbors=recognizer.getNeighbors(),
+            grid_x=recognizer.getGridX(),
+            grid_y=recognizer.getGridY(),
+            **kwargs
+        )
+
+    def __len__(self):
+        return self._rows
+
+    def with_labels(self, histograms: Dict[int, np.ndarray]) -> "LBPHMatcher":
+        """
+        Return a new matcher whose rows for the given labels are replaced by {label: histograms}
+
+        The new rows go into a segment of their own, and the labels' older
+        rows stop counting. Tail segments are then merged like a binary
+        counter (the last two while the older one is no larger and both fit
+        in segment_rows), which drops rows that no longer count and keeps
+        the number of segments low at a bounded copy per update.
+        """
+        owner = np.full(max([len(self.owner)] + [label + 1 for label in histograms]), -1, dtype=np.int32)
+        owner[:len(self.owner)] = self.owner
+        owner[list(histograms)] = -1
+
+        rows, labels = [], []
+        for label, label_rows in histograms.items():
+            label_rows = np.asarray(label_rows, dtype=np.float32).reshape(-1, self.width)
+            if len(label_rows):
+                rows.append(label_rows)
+                labels.append(np.full(len(label_rows), label, dtype=np.int32))
+
+        segments = list(self.segments)
+        if rows:
+            labels = np.concatenate(labels)
+            segments.append(_Segment.build(np.vstack(rows), labels, self.width))
+            owner[labels] = len(segments) - 1
+
+        while len(segments) >= 2:
+            older = owner[segments[-2].labels] == len(segments) - 2
+            newer = owner[segments[-1].labels] == len(segments) - 1
+            if older.sum() > newer.sum() or older.sum() + newer.sum() > self.segment_rows:
+                break
+            merged = _Segment.build(
+                np.vstack([segments[-2].histograms[older], segments[-1].histograms[newer]]),
+                np.concatenate([segments[-2].labels[older], segments[-1].labels[newer]]),
+                self.width)
+            segments[-2:] = [merged]
+            owner[merged.unique_labels] = len(segments) - 1
+
+        matcher = copy.copy(self)
+        matcher._assemble(tuple(segments), owner)
+        return matcher
+
+    def save(self, directory: str, segments_dir: str):
+        """
+        Write the matcher's manifest to directory and its segments to segments_dir
+
+        Segments are named once and never change, so those already in
+        segments_dir (written for an earlier snapshot) are not written again.
+        """
+        os.makedirs(segments_dir, exist_ok=True)
+        for segment in self.segments:
+            segment.save(segments_dir)
+        manifest = {
+            "segments": [segment.name for segment in self.segments],
+            "owner": self.owner.tolist(),
+        }
+        with open(os.path.join(directory, self.MANIFEST_FILE), 'w') as f:
+            f.write(json.dumps(manifest))
+
+    @classmethod
+    def load(cls, directory: str, segments_dir: str, **kwargs) -> "LBPHMatcher":
+        """Load a saved matcher, memory-mapping its segments, or return None if there is none"""
+        manifest_path = os.path.join(directory, cls.MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+
+        matcher = cls(None, np.empty(0), **kwargs)
+        segments = tuple(_Segment.load(segments_dir, name) for name in manifest["segments"])
+        matcher._assemble(segments, np.array(manifest["owner"], dtype=np.int32))
+        return matcher
+
+    @classmethod
+    def segment_names(cls, directory: str) -> List[str]:
+        """Segments a saved matcher references (empty if there is none)"""
+        try:
+            with open(os.path.join(directory, cls.MANIFEST_FILE), 'r') as f:
+                return json.load(f)["segments"]
+        except (OSError, ValueError, KeyError):
+            return []
+
+    def extract(self, faces) -> np.ndarray:
+        """Spatial LBP histograms for a batch of equally sized grayscale faces"""
+        faces = np.asarray(faces)
+        if faces.ndim == 2:
+            faces = faces[None]
+        codes = self._lbp_codes(faces)
+
+        # Cells cover the top-left grid_y x grid_x blocks, as in OpenCV
+        count, rows, cols = codes.shape
+        cell_h, cell_w = rows // self.grid_y, cols // self.grid_x
+        codes = codes[:, :cell_h * self.grid_y, :cell_w * self.grid_x]
+        cells = codes.reshape(count, self.grid_y, cell_h, self.grid_x, cell_w)
+        cells = cells.transpose(0, 1, 3, 2, 4).reshape(count, self.grid_y * self.grid_x, -1)
+
+        # One bincount for every cell of every face
+        n_cells = self.grid_y * self.grid_x
+        bins = (np.arange(count * n_cells, dtype=np.int64) * self.patterns).reshape(count, n_cells, 1)
+        hist = np.bincount((cells + bins).ravel(), minlength=count * n_cells * self.patterns)
+        hist = hist.astype(np.float32) / np.float32(cell_h * cell_w)
+        return hist.reshape(count, n_cells * self.patterns)
+
+    def distances(self, probes: np.ndarray) -> np.ndarray:
+        """Chi-square distance of every probe histogram to every stored row, segment by segment"""
+        prepared = self._prepare(probes)
+        return np.hstack([np.empty((len(prepared[0]), 0))] +
+                         [self._segment_distances(segment, *prepared) for segment in self.segments])
+
+    def predict(self, faces, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Nearest k labels for each face
+
+        Returns (labels, distances), both shaped (len(faces), k) and sorted
+        by ascending distance. Missing neighbours get label -1 and an
+        infinite distance.
+        """
+        probes = self.extract(faces)
+        labels = np.full((len(probes), k), -1, dtype=np.int32)
+        dists = np.full((len(probes), k), np.inf, dtype=np.float64)
+        if len(self) == 0:
+            return labels, dists
+
+        # Best sample per label (each segment is sorted by label, so that is
+        # one reduceat per segment), then the k closest labels
+        prepared = self._prepare(probes)
+        per_label = np.full((len(probes), len(self.owner)), np.inf)
+        for segment, active in zip(self.segments, self._active):
+            segment_dists = self._segment_distances(segment, *prepared)
+            if active is not None:
+                segment_dists[:, ~active] = np.inf
+            best = np.minimum.reduceat(segment_dists, segment.label_starts, axis=1)
+            columns = segment.unique_labels
+            per_label[:, columns] = np.minimum(per_label[:, columns], best)
+        live_labels = np.flatnonzero(self.owner >= 0)
+        per_label = per_label[:, live_labels]
+
+        k_found = min(k, per_label.shape[1])
+        if k_found < per_label.shape[1]:
+            idx = np.argpartition(per_label, k_found - 1, axis=1)[:, :k_found]
+        else:
+            idx = np.broadcast_to(np.arange(per_label.shape[1]), per_label.shape)
+        top = np.take_along_axis(per_label, idx, axis=1)
+        order = np.argsort(top, axis=1, kind='stable')
+        labels[:, :k_found] = live_labels[np.take_along_axis(idx, order, axis=1)]
+        dists[:, :k_found] = np.take_along_axis(top, order, axis=1)
+        return labels, dists
+
+    def _assemble(self, segments, owner: np.ndarray):
+        """Take on the given segments and label owners, dropping segments with no live rows"""
+        live = [owner[segment.labels] == i for i, segment in enumerate(segments)]
+        keep = [i for i, rows in enumerate(live) if rows.any()]
+        # owner holds segment positions (-1: label has no rows); the extra
+        # last slot maps -1 to itself
+        remap = np.full(len(segments) + 1, -1, dtype=np.int32)
+        remap[keep] = np.arange(len(keep), dtype=np.int32)
+
+        self.segments = tuple(segments[i] for i in keep)
+        self.owner = remap[owner]
+        # Rows of labels since moved to a newer segment are masked out
+        self._active = [None if live[i].all() else live[i] for i in keep]
+        self._rows = sum(int(live[i].sum()) for i in keep)
+
+    def _prepare(self, probes):
+        """Non-zero bins of each probe, padded to a common length, and the probe sums"""
+        # chi2 = 2 * sum((p-g)^2 / (p+g)) = 2 * (sum(p) + sum(g) - 4 * sum(p*g / (p+g)))
+        # The last term is zero wherever the probe is, so each probe only
+        # gathers its own non-zero bins (about a quarter of them). Padding
+        # points at the gallery's extra column of ones (p*g/(p+g) = 0 there).
+        probes = np.asarray(probes, dtype=np.float32).reshape(-1, self.width)
+        nonzero = [np.flatnonzero(probe) for probe in probes]
+        width = max(1, max((len(bins) for bins in nonzero), default=0))
+        columns = np.full((len(probes), width), self.width, dtype=np.intp)
+        values = np.zeros((len(probes), width), dtype=np.float32)
+        for i, bins in enumerate(nonzero):
+            columns[i, :len(bins)] = bins
+            values[i, :len(bins)] = probes[i, bins]
+        return values, columns, probes.sum(axis=1, dtype=np.float64)
+
+    def _segment_distances(self, segment: "_Segment", values, columns, probe_sums) -> np.ndarray:
+        """Chi-square distance of prepared probes to every row of one segment"""
+        result = np.empty((len(values), len(segment.labels)), dtype=np.float64)
+        if len(values) == 0:
+            return result
+
+        step = max(1, self.chunk_size // (len(values) * values.shape[1]))
+        for start in range(0, len(segment.labels), step):
+            g = segment.padded[start:start + step][:, columns]
+            overlap = values * g / (values + g)
+            result[:, start:start + step] = overlap.sum(axis=2, dtype=np.float64).T
+
+        return 2.0 * (probe_sums[:, None] + segment.sums[None, :] - 4.0 * result)
+
+    def _sampling_offsets(self):
+        """Bilinear sampling offsets and weights for each LBP neighbour"""
+        offsets = []
+        for n in range(self.neighbors):
+            # Same float32 arithmetic as OpenCV's elbp_
+            x = np.float32(self.radius * np.cos(2.0 * np.pi * n / self.neighbors))
+            y = np.float32(-self.radius * np.sin(2.0 * np.pi * n / self.neighbors))
+            fx, fy = int(np.floor(x)), int(np.floor(y))
+            cx, cy = int(np.ceil(x)), int(np.ceil(y))
+            ty, tx = y - np.float32(fy), x - np.float32(fx)
+            one = np.float32(1)
+            weights = ((one - tx) * (one - ty), tx * (one - ty), (one - tx) * ty, tx * ty)
+            offsets.append((fx, fy, cx, cy, weights))
+        return offsets
+
+    def _lbp_codes(self, faces: np.ndarray) -> np.ndarray:
+        """Circular LBP codes for a (count, rows, cols) uint8 batch"""
+        r = self.radius
+        count, rows, cols = faces.shape
+        out_h, out_w = rows - 2 * r, cols - 2 * r
+        src = faces.astype(np.float32)
+        center = src[:, r:r + out_h, r:r + out_w]
+
+        def shifted(dy, dx):
+            return src[:, r + dy:r + dy + out_h, r + dx:r + dx + out_w]
+
+        codes = np.zeros((count, out_h, out_w), dtype=np.int64)
+        eps = np.finfo(np.float32).eps
+        for n, (fx, fy, cx, cy, (w1, w2, w3, w4)) in enumerate(self._offsets):
+            t = w1 * shifted(fy, fx) + w2 * shifted(fy, cx) + w3 * shifted(cy, fx) + w4 * shifted(cy, cx)
+            codes |= ((t > center) | (np.abs(t - center) < eps)).astype(np.int64) << n
+        return codes
+
+
+class _Segment:
+    """
+    An immutable block of gallery rows, sorted by label
+
+    Histograms carry an extra column of ones (the padding target of
+    LBPHMatcher._prepare). A segment is saved once, as a directory named
+    after it, and loaded memory-mapped so every worker shares its pages.
+    """
+
+    __slots__ = ("name", "padded", "histograms", "labels", "sums", "unique_labels", "label_starts")
+
+    HISTOGRAMS_FILE = "histograms.npy"
+    LABELS_FILE = "labels.npy"
+    SUMS_FILE = "sums.npy"
+
+    def __init__(self, name: str, padded: np.ndarray, labels: np.ndarray, sums: np.ndarray):
+        self.name = name
+        self.padded = padded
+        self.histograms = padded[:, :-1]
+        self.labels = labels
+        self.sums = sums
+        self.unique_labels, self.label_starts = np.unique(labels, return_index=True)
+
+    @classmethod
+    def build(cls, histograms, labels: np.ndarray, width: int) -> "_Segment":
+        order = np.argsort(labels, kind='stable')
+        histograms = np.asarray(histograms, dtype=np.float32).reshape(len(labels), width)[order]
+        padded = np.hstack([histograms, np.ones((len(labels), 1), dtype=np.float32)])
+        return cls(uuid.uuid4().hex, padded, labels[order], histograms.sum(axis=1, dtype=np.float64))
+
+    def save(self, segments_dir: str):
+        path = os.path.join(segments_dir, self.name)
+        if os.path.exists(path):
+            return
+        tmp_path = path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        np.save(os.path.join(tmp_path, self.HISTOGRAMS_FILE), self.padded)
+        np.save(os.path.join(tmp_path, self.LABELS_FILE), self.labels)
+        np.save(os.path.join(tmp_path, self.SUMS_FILE), self.sums)
+        os.rename(tmp_path, path)
+
+    @classmethod
+    def load(cls, segments_dir: str, name: str) -> "_Segment":
+        path = os.path.join(segments_dir, name)
+        return cls(name,
+                   np.load(os.path.join(path, cls.HISTOGRAMS_FILE), mmap_mode='r'),
+                   np.load(os.path.join(path, cls.LABELS_FILE)),
+                   np.load(os.path.join(path, cls.SUMS_FILE)))
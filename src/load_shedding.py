@@ -0,0 +1,118 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+
+class AdmissionController:
+    """
+    Bounded concurrency and per-client rate limiting for CPU-bound requests
+
+    At most max_in_flight requests run at once. Up to max_waiting more may
+    wait up to wait_timeout seconds for a slot; anything beyond that is
+    turned away at once, so overload costs a fast rejection rather than an
+    ever longer queue. With rate set, each key (e.g. a kiosk id) is also
+    limited to rate admissions per second with bursts of up to burst.
+
+    Rejections come with a retry-after estimate: for the rate limit, the
+    time until the key's next token; when busy, the recent mean service
+    time scaled by how many requests are ahead.
+    """
+
+    def __init__(self, max_in_flight: int, max_waiting: int = 0, wait_timeout: float = 1.0,
+                 rate: float = None, burst: float = 1.0, min_retry_after: float = 0.5,
+                 max_keys: int = 256):
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+        self.max_in_flight = max_in_flight
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.min_retry_after = min_retry_after
+        self.max_keys = max_keys
+
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = {"busy": 0, "rate": 0}
+        # Moving average of how long admitted requests take, seconds
+        self.service_time = min_retry_after
+
+        # key -> (tokens, last refill time)
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._cond = threading.Condition()
+
+    def acquire(self, key: str = None, wait: bool = True) -> Optional[Tuple[str, float]]:
+        """
+        Take a slot, waiting briefly if allowed
+
+        With wait=False a caller that finds every slot taken is turned away
+        at once instead of joining the wait queue. Returns None when
+        admitted (call release() afterwards), otherwise (reason, retry_after
+        seconds) with reason "rate" or "busy".
+        """
+        with self._cond:
+            now = time.monotonic()
+            tokens = self._tokens(key, now)
+            if tokens < 1.0:
+                self.rejected["rate"] += 1
+                return "rate", max(self.min_retry_after, (1.0 - tokens) / self.rate)
+
+            if self.in_flight >= self.max_in_flight:
+                if not wait or self.waiting >= self.max_waiting:
+                    return self._reject_busy()
+                self.waiting += 1
+                deadline = now + self.wait_timeout
+                try:
+                    while self.in_flight >= self.max_in_flight:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            return self._reject_busy()
+                        self._cond.wait(remaining)
+                finally:
+                    self.waiting -= 1
+
+            self.in_flight += 1
+            self.admitted += 1
+            if key is not None and self.rate:
+                self._buckets[key] = (tokens - 1.0, now)
+            return None
+
+    def release(self, elapsed: float):
+        """Free the slot of an admitted request that took elapsed seconds"""
+        with self._cond:
+            self.in_flight -= 1
+            self.service_time += 0.2 * (elapsed - self.service_time)
+            self._cond.notify()
+
+    def stats(self) -> Dict:
+        """Limits, current load, and admissions and rejections so far"""
+        with self._cond:
+            return {
+                "max_in_flight": self.max_in_flight,
+                "max_waiting": self.max_waiting,
+                "rate_per_key": self.rate,
+                "in_flight": self.in_flight,
+                "waiting": self.waiting,
+                "admitted": self.admitted,
+                "rejected": dict(self.rejected),
+                "service_ms": round(self.service_time * 1000, 2),
+            }
+
+    def _reject_busy(self) -> Tuple[str, float]:
+        self.rejected["busy"] += 1
+        ahead = self.in_flight + self.waiting + 1
+        return "busy", max(self.min_retry_after, self.service_time * ahead / self.max_in_flight)
+
+    def _tokens(self, key: Optional[str], now: float) -> float:
+        """Tokens a key has now (refilled since its last admission)"""
+        if key is None or not self.rate:
+            return self.burst
+        bucket = self._buckets.pop(key, None)
+        tokens = self.burst if bucket is None else min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        # Keep the key most recently used; the bucket is written back on admission
+        self._buckets[key] = (tokens, now)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return tokens
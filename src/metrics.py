@@ -0,0 +1,121 @@
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Tuple
+
+# Seconds; covers a fast cached frame up to a slow cold one
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size: int):
+        # One count per bucket plus the +Inf bucket, not cumulative
+        self.counts = [0] * (size + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+class MetricsRegistry:
+    """
+    In-process counters and histograms, rendered in the Prometheus text format
+
+    Recording is a dict lookup, a bisect and a few additions under one lock
+    (about a microsecond), so instrumentation can stay on in production.
+    Each worker process keeps its own registry; scrape every worker, or
+    sum them in Prometheus.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # name -> (type, help, buckets, {label pairs: value or _Histogram})
+        self._families: Dict[str, Tuple[str, str, tuple, dict]] = {}
+
+    def counter(self, name: str, help_text: str):
+        """Declare a counter (again declaring the same name is a no-op)"""
+        self._declare(name, "counter", help_text, ())
+
+    def histogram(self, name: str, help_text: str, buckets=LATENCY_BUCKETS):
+        """Declare a histogram with the given upper bucket bounds"""
+        self._declare(name, "histogram", help_text, tuple(sorted(buckets)))
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        """Add to a counter"""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._families[name][3]
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, **labels):
+        """Record one value in a histogram"""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            _, _, buckets, series = self._families[name]
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(len(buckets))
+            histogram.counts[bisect_left(buckets, value)] += 1
+            histogram.sum += value
+            histogram.count += 1
+
+    def stages(self, name: str, **labels) -> "StageTimer":
+        """Timer that records the time between successive mark() calls"""
+        return StageTimer(self, name, labels)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name, (kind, help_text, buckets, series) in self._families.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for key, value in series.items():
+                    if kind == "counter":
+                        lines.append(f"{name}{_labels(key)} {_number(value)}")
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(buckets + (float("inf"),), value.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else _number(bound)
+                        lines.append(f"{name}_bucket{_labels(key + (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(key)} {_number(value.sum)}")
+                    lines.append(f"{name}_count{_labels(key)} {value.count}")
+        return "\n".join(lines) + "\n"
+
+    def _declare(self, name, kind, help_text, buckets):
+        with self._lock:
+            self._families.setdefault(name, (kind, help_text, buckets, {}))
+
+
+class StageTimer:
+    """Records the duration of consecutive request stages in one histogram"""
+
+    __slots__ = ("registry", "name", "labels", "last")
+
+    def __init__(self, registry: MetricsRegistry, name: str, labels: Dict):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+        self.last = time.perf_counter()
+
+    def reset(self):
+        """Start timing the next stage now, without recording anything"""
+        self.last = time.perf_counter()
+
+    def mark(self, stage: str):
+        """Record the time since the previous mark (or creation) as stage"""
+        now = time.perf_counter()
+        self.registry.observe(self.name, now - self.last, stage=stage, **self.labels)
+        self.last = now
+
+
+def _labels(pairs) -> str:
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
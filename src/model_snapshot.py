@@ -0,0 +1,198 @@
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from types import MappingProxyType
+
+from face_gallery import SampleStore
+from lbph_matcher import LBPHMatcher
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class SnapshotStore:
+    """
+    Versioned, atomically published snapshots of the face model
+
+    Each snapshot is a directory models_dir/snapshots/<version> holding the
+    trained recognizer (if it was retrained), the LBPH matcher's manifest
+    and a copy of the sample store index it was built from. The matcher's
+    histograms live in models_dir/segments, shared by every snapshot that
+    references them, so a snapshot only adds the segments that are new.
+    Segments and old sample files are deleted once no retained snapshot
+    needs them. Snapshots are written under a temporary name and renamed into
+    place before the tiny CURRENT marker is replaced, so a reader never sees
+    a half-written model. Worker processes poll the marker to pick up
+    enrollments and deletions made by other workers.
+    """
+
+    MARKER_FILE = "CURRENT"
+    SNAPSHOTS_DIR = "snapshots"
+    SEGMENTS_DIR = "segments"
+    LOCK_FILE = "write.lock"
+    MODEL_FILE = "face_recognizer.yml"
+    INDEX_FILE = "index.json"
+
+    def __init__(self, models_dir: str, keep: int = 3):
+        self.models_dir = models_dir
+        self.keep = keep
+        self.snapshots_dir = os.path.join(models_dir, self.SNAPSHOTS_DIR)
+        self.segments_dir = os.path.join(models_dir, self.SEGMENTS_DIR)
+        self.marker_path = os.path.join(models_dir, self.MARKER_FILE)
+        self.lock_path = os.path.join(models_dir, self.LOCK_FILE)
+
+        # The file lock is per process; nested writers in one process share it
+        self._local_lock = threading.RLock()
+        self._lock_depth = 0
+        self._lock_file = None
+
+        os.makedirs(self.snapshots_dir, exist_ok=True)
+
+    def current_version(self) -> int:
+        """Version of the newest published snapshot, or 0 if there is none"""
+        try:
+            with open(self.marker_path, 'r') as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def path(self, version: int) -> str:
+        """Directory holding the given snapshot"""
+        return os.path.join(self.snapshots_dir, f"{version:08d}")
+
+    def publish(self, recognizer, index_path: str, embedding_index=None, lbph_matcher=None) -> int:
+        """
+        Write a new snapshot and make it current
+
+        Pass recognizer=None when there is nothing trained yet or the model
+        was extended without retraining, an EmbeddingIndex when the embedding
+        recognizer is in use, and the model's LBPHMatcher. Callers must
+        hold write_lock() so versions are handed out one at a time. Returns
+        the new version.
+        """
+        version = self.current_version() + 1
+        final_path = self.path(version)
+        tmp_path = os.path.join(self.snapshots_dir, f".tmp-{os.getpid()}-{version}")
+
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        if recognizer is not None:
+            recognizer.save(os.path.join(tmp_path, self.MODEL_FILE))
+        if os.path.exists(index_path):
+            shutil.copyfile(index_path, os.path.join(tmp_path, self.INDEX_FILE))
+        if embedding_index is not None:
+            embedding_index.save(tmp_path)
+        if lbph_matcher is not None:
+            lbph_matcher.save(tmp_path, self.segments_dir)
+
+        # Left over from a writer that died before updating the marker
+        shutil.rmtree(final_path, ignore_errors=True)
+        os.rename(tmp_path, final_path)
+
+        marker_tmp = self.marker_path + ".tmp"
+        with open(marker_tmp, 'w') as f:
+            f.write(str(version))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(marker_tmp, self.marker_path)
+
+        self._prune(version, index_path)
+        return version
+
+    @contextmanager
+    def write_lock(self):
+        """Serialize writers across threads and worker processes"""
+        with self._local_lock:
+            if self._lock_depth == 0:
+                self._lock_file = open(self.lock_path, 'a+')
+                _lock(self._lock_file)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0:
+                    _unlock(self._lock_file)
+                    self._lock_file.close()
+                    self._lock_file = None
+
+    def _prune(self, version: int, index_path: str):
+        """
+        Remove all but the newest few snapshots, and what none of those reference
+
+        That is matcher segments, and sample files that compaction of the
+        gallery whose index is at index_path replaced.
+        """
+        store = SampleStore(os.path.dirname(index_path))
+        retained = set()
+        samples_in_use = set()
+        for entry in os.listdir(self.snapshots_dir):
+            if not entry.isdigit():
+                continue
+            path = os.path.join(self.snapshots_dir, entry)
+            if int(entry) <= version - self.keep:
+                # Readers that already loaded an old snapshot hold it in memory
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                retained.update(LBPHMatcher.segment_names(path))
+                samples_in_use.add(store.read_samples_file(os.path.join(path, self.INDEX_FILE)))
+
+        if os.path.isdir(self.segments_dir):
+            for entry in os.listdir(self.segments_dir):
+                if entry not in retained:
+                    # Memory-mapped pages stay readable to workers still serving them
+                    shutil.rmtree(os.path.join(self.segments_dir, entry), ignore_errors=True)
+
+        store.remove_unused(samples_in_use)
+
+
+class ModelState:
+    """
+    One consistent, read-only version of the live face model
+
+    Names, samples, the trained recognizer and the search structures derived
+    from it always come from the same snapshot, so a label can never point
+    at the wrong name. A state is not modified after it is built: writers
+    build a new one off to the side and swap the reference, and readers take
+    the reference once per frame without locking.
+    """
+
+    __slots__ = ("version", "revision", "generation", "names", "samples", "rows", "recognizer",
+                 "embedding_index", "lbph_matcher")
+
+    def __init__(self, version: int = 0, names=(), samples=None, recognizer=None,
+                 embedding_index=None, lbph_matcher=None, revision: int = 0,
+                 rows=None, generation: int = 0):
+        self.version = version
+        # Sample store revision the model was trained from
+        self.revision = revision
+        self.names = tuple(names)
+        self.samples = MappingProxyType({name: tuple(rows) for name, rows in (samples or {}).items()})
+        # Sample store rows behind each user's samples, and the sample file
+        # generation they index; rows are never rewritten within a generation,
+        # so equal rows mean equal samples
+        self.rows = MappingProxyType({name: tuple(user_rows) for name, user_rows in (rows or {}).items()})
+        self.generation = generation
+        self.recognizer = recognizer
+        self.embedding_index = embedding_index
+        self.lbph_matcher = lbph_matcher
+
+
+def _lock(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+
+
+def _unlock(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
@@ -0,0 +1,90 @@
+import threading
+from collections import OrderedDict
+from typing import Tuple
+
+import cv2
+import numpy as np
+
+
+class FramePreprocessor:
+    """
+    Grayscale conversion and face normalization into reusable buffers
+
+    Every OpenCV step writes through dst= into arrays that are allocated
+    once per thread and reused for later frames of the same size, so the
+    steady state allocates no image memory. Face normalization (resize,
+    equalization, blur) runs in place on one buffer per face.
+
+    gray() and faces() return this thread's buffers: the contents are only
+    valid until the thread's next call. Use face() for a sample that has to
+    be kept, e.g. in the gallery.
+    """
+
+    MAX_BUFFERS = 4
+
+    def __init__(self, face_size: Tuple[int, int] = (200, 200)):
+        self.face_size = tuple(face_size)
+        # Array shape of one normalized face (rows, cols)
+        self.face_shape = (self.face_size[1], self.face_size[0])
+        self._local = threading.local()
+
+    def gray(self, frame, equalize: bool = True) -> np.ndarray:
+        """
+        Grayscale copy of a BGR frame, histogram-equalized if asked
+
+        A frame that was decoded as grayscale is used as it is when no
+        equalization is needed, and equalized into the buffer otherwise.
+        """
+        if frame.ndim == 2:
+            if not equalize:
+                return frame
+            gray = self._buffer("gray", frame.shape)
+            cv2.equalizeHist(frame, dst=gray)
+            return gray
+
+        gray = self._buffer("gray", frame.shape[:2])
+        cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=gray)
+        if equalize:
+            cv2.equalizeHist(gray, dst=gray)
+        return gray
+
+    def faces(self, gray, boxes) -> np.ndarray:
+        """Normalized (N, rows, cols) batch of the faces in boxes"""
+        batch = getattr(self._local, "batch", None)
+        if batch is None or len(batch) < len(boxes):
+            # Grow geometrically so a crowded frame does not reallocate every time
+            capacity = max(len(boxes), 2 * (0 if batch is None else len(batch)), 4)
+            batch = self._local.batch = np.empty((capacity,) + self.face_shape, dtype=np.uint8)
+
+        for i, box in enumerate(boxes):
+            self._normalize(gray, box, batch[i])
+        return batch[:len(boxes)]
+
+    def face(self, gray, box) -> np.ndarray:
+        """One normalized face in a new array that the caller owns"""
+        out = np.empty(self.face_shape, dtype=np.uint8)
+        self._normalize(gray, box, out)
+        return out
+
+    def _normalize(self, gray, box, out):
+        """Crop, resize, equalize and denoise a face into out"""
+        x, y, w, h = (int(v) for v in box)
+        # Slicing is a view; the resize is the only read of the full frame
+        cv2.resize(gray[y:y + h, x:x + w], self.face_size, dst=out)
+        cv2.equalizeHist(out, dst=out)  # Normalize lighting
+        cv2.GaussianBlur(out, (3, 3), 0, dst=out)  # Reduce noise
+
+    def _buffer(self, name: str, shape) -> np.ndarray:
+        """This thread's buffer of the given name and shape"""
+        # A few shapes per thread, for kiosks sending different resolutions
+        buffers = getattr(self._local, "buffers", None)
+        if buffers is None:
+            buffers = self._local.buffers = OrderedDict()
+        key = (name, tuple(shape))
+        buffer = buffers.pop(key, None)
+        if buffer is None:
+            buffer = np.empty(shape, dtype=np.uint8)
+        buffers[key] = buffer
+        while len(buffers) > self.MAX_BUFFERS:
+            buffers.popitem(last=False)
+        return buffer
@@ -0,0 +1,52 @@
+from typing import List
+
+import cv2
+import numpy as np
+
+from lbph_matcher import LBPHMatcher
+
+
+def sample_quality(face_roi) -> float:
+    """Sharpness of a preprocessed face (variance of the Laplacian)"""
+    return float(cv2.Laplacian(face_roi, cv2.CV_64F).var())
+
+
+def select_samples(samples, budget: int, quality_weight: float = 0.5,
+                   redundancy: float = 20.0) -> List[int]:
+    """
+    Pick up to budget mutually distinct, sharp samples of one user
+
+    Samples are compared by the chi-square distance between their LBP
+    histograms, the same measure the recognizer uses. Selection is greedy
+    farthest-point: start from the sharpest sample, then repeatedly add the
+    one whose distance to its nearest already selected sample is largest,
+    scaled down by up to quality_weight for blurrier samples. Near-duplicates
+    therefore go last, and samples closer than redundancy to a selected one
+    are not kept at all, even under budget (a burst of a still face adds
+    one sample, not one per frame). Returns the chosen positions in
+    ascending order.
+    """
+    count = len(samples)
+    if budget <= 0 or count == 0:
+        return []
+
+    quality = np.array([sample_quality(sample) for sample in samples])
+    weight = 1.0 - quality_weight + quality_weight * quality / max(quality.max(), 1e-9)
+
+    descriptors = LBPHMatcher(None, np.empty(0)).extract(np.stack(samples))
+    matcher = LBPHMatcher(descriptors, np.arange(count))
+    dist = np.maximum(matcher.distances(descriptors), 0.0)
+
+    selected = [int(np.argmax(quality))]
+    nearest = dist[selected[0]].copy()
+    while len(selected) < min(budget, count):
+        score = nearest * weight
+        score[selected] = -1.0
+        score[nearest < redundancy] = -1.0
+        best = int(np.argmax(score))
+        if score[best] < 0:
+            # Everything left is a near-duplicate of a selected sample
+            break
+        selected.append(best)
+        nearest = np.minimum(nearest, dist[best])
+    return sorted(selected)
@@ -1,49 +1,210 @@
 import cv2
 import numpy as np
 import os
-import pickle
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
 from typing import List, Tuple, Dict
 
+from detection_tuning import DetectionTuner
+from face_detectors import CascadeDetector, create_detector
+from face_embeddings import EmbeddingIndex, FaceEmbedder
+from frame_decoding import decode_frame
+from face_gallery import SampleStore
+from lbph_matcher import LBPHMatcher
+from metrics import MetricsRegistry
+from model_snapshot import ModelState, SnapshotStore
+from preprocessing import FramePreprocessor
+from sample_selection import select_samples
+from training_queue import TrainingQueue
+
 class SimpleFaceRecognitionSystem:
     """
     Simplified face recognition system using OpenCV's built-in face detection
     and LBPH (Local Binary Patterns Histograms) face recognizer
     """
     
-    def __init__(self, encodings_dir: str = "data/encodings", models_dir: str = "data/models"):
+    def __init__(self, encodings_dir: str = "data/encodings", models_dir: str = "data/models",
+                 reload_interval: float = 1.0, detector: str = "haar",
+                 detection_scale: float = 1.0, refine_detections: bool = True,
+                 refine_margin: float = 0.25, detector_options: Dict = None,
+                 recognizer_backend: str = "lbph", embedding_model: str = None,
+                 embedding_threshold: float = 0.363, top_k: int = 1,
+                 max_samples_per_user: int = 10, sample_redundancy: float = 20.0,
+                 background_training: bool = False,
+                 training_delay: float = 0.5, detection_budget: float = None,
+                 detection_max_in_flight: int = None, metrics: MetricsRegistry = None,
+                 read_only: bool = False):
         self.encodings_dir = encodings_dir
         self.models_dir = models_dir
-        self.known_face_names = []
-        self.face_samples = {}  # Store multiple samples per user
+        
+        # Everything a pool worker needs to build its own, read-only copy of
+        # this system (workers never train, so no training options)
+        self._worker_kwargs = {
+            'encodings_dir': encodings_dir,
+            'models_dir': models_dir,
+            'reload_interval': reload_interval,
+            'detector': detector,
+            'detection_scale': detection_scale,
+            'refine_detections': refine_detections,
+            'refine_margin': refine_margin,
+            'detector_options': detector_options,
+            'recognizer_backend': recognizer_backend,
+            'embedding_model': embedding_model,
+            'embedding_threshold': embedding_threshold,
+            'top_k': top_k,
+            'max_samples_per_user': max_samples_per_user,
+            'sample_redundancy': sample_redundancy,
+            'detection_budget': detection_budget,
+            'detection_max_in_flight': detection_max_in_flight,
+        }
+        self._pool = None
+        self._pool_workers = 0
+        
+        # The model this process is serving (names, samples, recognizer, ...).
+        # Replaced as a whole, never edited: readers just take the reference,
+        # and _swap_lock only orders writers and background reloads.
+        self._state = ModelState()
+        self._swap_lock = threading.Lock()
+        
+        # A read-only system only loads published snapshots: it never trains,
+        # queues a retrain or publishes (recognize_faces_batch() pool workers)
+        self.read_only = read_only
+        
+        # How often to look for snapshots published by other workers
+        self.reload_interval = reload_interval
+        self._last_poll = 0.0
+        self._reloading = False
         
         # Create directories
         os.makedirs(encodings_dir, exist_ok=True)
         os.makedirs(models_dir, exist_ok=True)
         
-        # Initialize face detector and recognizer
-        self.face_cascade = cv2.CascadeClassifier(
-            cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+        # Memory-mapped gallery of preprocessed face samples
+        self.sample_store = SampleStore(encodings_dir)
+        
+        # Published model versions shared by every worker process
+        self.snapshots = SnapshotStore(models_dir)
+        
+        # Initialize face detector and recognizer. detection_scale < 1 runs
+        # detection on a downscaled copy first; cascade backends then refine
+        # each candidate on a full-resolution crop padded by refine_margin
+        self.detector = create_detector(
+            detector,
+            detection_scale=detection_scale,
+            refine_detections=refine_detections,
+            refine_margin=refine_margin,
+            **(detector_options or {})
         )
-        self.recognizer = cv2.face.LBPHFaceRecognizer_create()
+        
+        # With a per-frame latency budget (seconds), recognition frames use
+        # cascade parameters tuned per camera instead of the fixed defaults
+        self.tuner = None
+        if detection_budget:
+            if not isinstance(self.detector, CascadeDetector):
+                raise ValueError(f"Adaptive detection needs a cascade detector, not '{detector}'")
+            self.tuner = DetectionTuner(detection_budget, max_in_flight=detection_max_in_flight)
+        
+        # Grayscale and face normalization into reused per-thread buffers
+        self.preprocessor = FramePreprocessor()
+        
+        # Optional per-stage latency and recognition outcome metrics
+        self.metrics = metrics
+        if metrics is not None:
+            metrics.histogram("face_stage_seconds", "Time spent in each frame processing stage")
+            metrics.histogram("face_faces_per_frame", "Faces detected per recognized frame",
+                              buckets=(0, 1, 2, 3, 4, 6, 8, 12, 16))
+            metrics.counter("face_recognitions_total", "Recognized faces by result (known or unknown)")
+            metrics.histogram("face_match_confidence", "Confidence of accepted matches",
+                              buckets=(0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0))
+        
+        # 'lbph_numpy' matches with the in-project batched LBPH matcher, built
+        # from the OpenCV model's histograms, instead of one predict() per face
+        if recognizer_backend not in ("lbph", "lbph_numpy", "embedding"):
+            raise ValueError(f"Unknown recognizer backend '{recognizer_backend}'")
+        self.recognizer_backend = recognizer_backend
+        
+        # Number of candidate identities reported per face
+        self.top_k = top_k
+        
+        # Sample budget per user; beyond it the most redundant samples are evicted.
+        # Samples within sample_redundancy (LBPH chi-square) of a kept one are
+        # never stored.
+        self.max_samples_per_user = max_samples_per_user
+        self.sample_redundancy = sample_redundancy
+        
+        # With background training, enrollments and deletions only update the
+        # gallery and return; a worker thread retrains once per burst of changes
+        self.trainer = None
+        if background_training and not read_only:
+            self.trainer = TrainingQueue(self._rebuild_model, training_delay)
+        
+        # Optional embedding recognizer: SFace embeddings searched by cosine
+        # similarity instead of LBPH's per-sample histogram comparison. The
+        # LBPH model is still maintained so the backend can be switched back.
+        self.embedder = FaceEmbedder(embedding_model) if recognizer_backend == "embedding" else None
+        self.embedding_threshold = embedding_threshold
         
         # Load existing data
         self.load_encodings()
     
-    def detect_faces(self, frame):
-        """Detect faces in the frame"""
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        # Apply histogram equalization for better lighting normalization
-        gray = cv2.equalizeHist(gray)
-        faces = self.face_cascade.detectMultiScale(
-            gray,
-            scaleFactor=1.05,  # More sensitive to face sizes
-            minNeighbors=4,     # Slightly less strict
-            minSize=(80, 80),   # Allow slightly smaller faces
-            flags=cv2.CASCADE_SCALE_IMAGE
-        )
+    @property
+    def version(self) -> int:
+        """Snapshot version of the live model"""
+        return self._state.version
+    
+    @property
+    def known_face_names(self) -> List[str]:
+        return list(self._state.names)
+    
+    @property
+    def face_samples(self):
+        """Read-only mapping of user name to stored samples"""
+        return self._state.samples
+    
+    @property
+    def recognizer(self):
+        return self._state.recognizer
+    
+    def decode(self, data, max_width: int = None) -> Tuple[np.ndarray, int]:
+        """
+        Decode an uploaded image in the form the detector needs
+        
+        Cascade backends only read grayscale, so their frames are decoded
+        straight to one channel; the DNN backends get BGR. See decode_frame()
+        for max_width and the returned (frame or None, scale factor).
+        """
+        return decode_frame(data, grayscale=self.detector.needs_equalized_gray, max_width=max_width)
+    
+    def detect_faces(self, frame, camera: str = None, tuned: bool = False, frame_scale: int = 1):
+        """
+        Detect faces in the frame
+        
+        Returns the boxes and the grayscale frame. The grayscale frame is a
+        per-thread buffer that the thread's next call overwrites. With
+        tuned=True and a detection budget configured, the search parameters
+        come from the tuner for this camera; otherwise the full range is
+        searched (as for enrollment). frame_scale is the factor decode()
+        returned, so a reduced frame is searched for the same face sizes
+        as the full-size one.
+        """
+        # Histogram equalization for better lighting normalization, which
+        # only the cascade backends use; face ROIs are equalized separately
+        gray = self.preprocessor.gray(frame, equalize=self.detector.needs_equalized_gray)
+        if not tuned or self.tuner is None:
+            return self.detector.detect(frame, gray, frame_scale=frame_scale), gray
+        
+        params = self.tuner.begin(camera, gray.shape, frame_scale)
+        faces = ()
+        start = time.perf_counter()
+        try:
+            faces = self.detector.detect(frame, gray, params, frame_scale)
+        finally:
+            self.tuner.end(camera, params, faces, time.perf_counter() - start)
         return faces, gray
     
-    def register_face(self, name: str, image_path: str = None, frame=None) -> Tuple[bool, str]:
+    def register_face(self, name: str, image_path: str = None, frame=None,
+                      frames=None) -> Tuple[bool, str]:
         """
         Register a new face with the given name
         
@@ -51,186 +212,753 @@ class SimpleFaceRecognitionSystem:
             name: User's name/ID
             image_path: Path to image file (optional)
             frame: Image frame from webcam (optional)
+            frames: Burst of webcam frames (optional). Frames without exactly
+                one face are skipped; the most distinct of the rest are kept,
+                up to max_samples_per_user.
         
         Returns:
             Tuple of (success, message)
         """
-        # Load image
+        # Load image(s)
         if image_path:
-            image = cv2.imread(image_path)
+            images = [cv2.imread(image_path)]
+        elif frames:
+            images = [image for image in frames if image is not None]
         elif frame is not None:
-            image = frame.copy()
+            images = [frame.copy()]
         else:
             return False, "No image provided"
         
-        # Detect faces
-        faces, gray = self.detect_faces(image)
-        
-        if len(faces) == 0:
-            return False, "No face detected in the image"
-        
-        if len(faces) > 1:
-            return False, "Multiple faces detected. Please ensure only one face is visible"
-        
-        # Get the face region
-        (x, y, w, h) = faces[0]
-        face_roi = gray[y:y+h, x:x+w]
-        
-        # Resize to standard size
-        face_roi = cv2.resize(face_roi, (200, 200))
+        # Detect faces and get the face region of every usable image
+        face_rois = []
+        error = "No image provided"
+        for image in images:
+            faces, gray = self.detect_faces(image)
+            
+            if len(faces) == 0:
+                error = "No face detected in the image"
+            elif len(faces) > 1:
+                error = "Multiple faces detected. Please ensure only one face is visible"
+            else:
+                face_rois.append(self._preprocess_face(gray, faces[0]))
         
-        # Apply additional preprocessing for better quality
-        face_roi = cv2.equalizeHist(face_roi)  # Normalize lighting
-        face_roi = cv2.GaussianBlur(face_roi, (3, 3), 0)  # Reduce noise
+        if not face_rois:
+            return False, error
         
-        # Check if user already exists
-        if name in self.known_face_names:
-            return False, f"User '{name}' already registered"
+        with self.snapshots.write_lock():
+            # The gallery on disk includes changes not trained into a model yet
+            names, samples = self.sample_store.load()
+            
+            # Check if user already exists
+            if name in names:
+                return False, f"User '{name}' already registered"
+            
+            # Store the selected samples
+            self._store_samples(samples, name, face_rois)
         
-        # Add to known faces
-        self.known_face_names.append(name)
+        # Retrain (now or in the background) without holding up other writers
+        self._gallery_changed()
+        return True, f"Successfully registered {name}"
+    
+    def add_face_sample(self, name: str, frame, location) -> bool:
+        """
+        Offer a confidently recognized face as an extra sample of that user
         
-        # Store face sample
-        if name not in self.face_samples:
-            self.face_samples[name] = []
-        self.face_samples[name].append(face_roi)
+        location is the face's location from recognize_faces(). The sample
+        is stored only if it makes the user's gallery more diverse; returns
+        whether it was kept.
+        """
+        top, right, bottom, left = (int(v) for v in location)
+        gray = self.preprocessor.gray(frame, equalize=self.detector.needs_equalized_gray)
+        face_roi = self._preprocess_face(gray, (left, top, right - left, bottom - top))
         
-        # Save data
-        self._save_data()
+        with self.snapshots.write_lock():
+            names, samples = self.sample_store.load()
+            if name not in names or not self._store_samples(samples, name, [face_roi]):
+                return False
+        self._gallery_changed()
+        return True
+    
+    def _store_samples(self, samples, name: str, new_samples) -> int:
+        """
+        Merge new samples into a user's stored gallery
         
-        # Retrain recognizer
-        self._train_recognizer()
+        The user's current and new samples compete for max_samples_per_user
+        places (see select_samples). Callers hold the write lock and retrain
+        afterwards. Returns the number of new samples kept.
+        """
+        existing = list(samples.get(name, ()))
+        pool = existing + list(new_samples)
+        keep = select_samples(pool, self.max_samples_per_user, redundancy=self.sample_redundancy)
+        kept_old = [i for i in keep if i < len(existing)]
+        kept_new = [pool[i] for i in keep if i >= len(existing)]
+        if kept_new:
+            # Save data (appends only the new sample bytes)
+            self.sample_store.replace(name, kept_old, kept_new)
+        return len(kept_new)
+    
+    def _gallery_changed(self):
+        """Retrain after a gallery change: queued in the background, or right away"""
+        if self.trainer is not None:
+            self.trainer.submit()
+        else:
+            self._rebuild_model()
+    
+    def gallery_revision(self) -> int:
+        """Revision of the gallery on disk, including changes not trained yet"""
+        return self.sample_store.read_revision()
+    
+    def training_status(self, revision: int) -> Dict:
+        """Whether the gallery change with the given revision is in the live model yet"""
+        state = self._state
+        version = self.snapshots.current_version()
+        if version == state.version:
+            live_revision = state.revision
+        else:
+            # Published by another worker and not loaded here yet
+            live_revision = self.sample_store.read_revision(
+                os.path.join(self.snapshots.path(version), SnapshotStore.INDEX_FILE))
         
-        return True, f"Successfully registered {name}"
+        status = {
+            "revision": revision,
+            "live_revision": live_revision,
+            "live": live_revision >= revision,
+            "model_version": version,
+        }
+        if self.trainer is not None:
+            status["training"] = self.trainer.stats()
+        return status
     
-    def recognize_faces(self, frame) -> List[Dict]:
+    def recognize_faces(self, frame, tracker=None, camera: str = None,
+                        frame_scale: int = 1) -> List[Dict]:
         """
         Recognize all faces in the given frame
         
         Args:
             frame: Image frame from webcam
+            tracker: Optional FaceTracker for the camera the frame came from.
+                Faces that continue an already identified track reuse its
+                identity instead of being recognized again.
+            camera: Optional camera (kiosk) id, which adaptive detection
+                learns face sizes and timings for
+            frame_scale: The factor decode() returned when the frame was
+                decoded at reduced size (see detect_faces())
         
         Returns:
             List of dictionaries containing face information
         """
+        # Pick up models published by other workers
+        self.check_for_updates()
+        
         # Detect faces
-        faces, gray = self.detect_faces(frame)
+        start = time.perf_counter()
+        faces, gray = self.detect_faces(frame, camera, tuned=True, frame_scale=frame_scale)
+        detected = time.perf_counter()
         
-        recognized_faces = []
+        # Hold on to one consistent model even if a writer swaps it mid-frame
+        state = self._state
+        version = state.version
         
-        for (x, y, w, h) in faces:
-            # Extract face region
-            face_roi = gray[y:y+h, x:x+w]
-            face_roi = cv2.resize(face_roi, (200, 200))
-            
+        if tracker is None:
             # Apply same preprocessing as registration
-            face_roi = cv2.equalizeHist(face_roi)
-            face_roi = cv2.GaussianBlur(face_roi, (3, 3), 0)
-            
-            name = "Unknown"
-            confidence = 0.0
-            
-            # Recognize face if we have trained data
-            if len(self.known_face_names) > 0 and hasattr(self.recognizer, 'predict'):
-                try:
-                    label, conf = self.recognizer.predict(face_roi)
-                    
-                    # Lower confidence value means better match
-                    # Threshold: accept if confidence < 60 (Balanced for security and usability)
-                    if conf < 60 and label < len(self.known_face_names):
-                        name = self.known_face_names[label]
-                        # Convert confidence to percentage (inverse)
-                        confidence = max(0, (100 - conf) / 100)
-                    
-                except Exception as e:
-                    print(f"Recognition error: {e}")
-            
+            face_rois = self.preprocessor.faces(gray, faces)
+            matches = self._identify(face_rois, state)
+            track_ids = [None] * len(matches)
+        else:
+            with tracker.lock:
+                now = time.monotonic()
+                tracks = tracker.associate(faces, now)
+                # Every face is compared with its track's verified appearance
+                face_rois = self.preprocessor.faces(gray, faces)
+                appearances = tracker.describe(face_rois)
+                pending = [i for i, track in enumerate(tracks)
+                           if tracker.needs_recognition(track, version, now, appearances[i])]
+                fresh = self._identify(face_rois[pending], state)
+                for i, identity in zip(pending, fresh):
+                    tracks[i] = tracker.remember(faces[i], tracks[i], identity, version, now, appearances[i])
+                matches = [(t.name, t.confidence, t.candidates) for t in tracks]
+                track_ids = [t.track_id for t in tracks]
+        
+        recognized_faces = []
+        
+        for (x, y, w, h), (name, confidence, candidates), track_id in zip(faces, matches, track_ids):
             recognized_faces.append({
                 "name": name,
                 "confidence": confidence,
+                "candidates": candidates,  # up to top_k (name, confidence), best first
+                "track_id": track_id,
                 "location": (y, x+w, y+h, x)  # top, right, bottom, left
             })
         
+        if self.metrics is not None:
+            self._record_metrics(recognized_faces, detected - start, time.perf_counter() - detected)
+        
         return recognized_faces
     
-    def _train_recognizer(self):
-        """Train the face recognizer with all stored samples"""
-        if not self.face_samples:
+    def _record_metrics(self, recognized_faces: List[Dict], detect_seconds: float, match_seconds: float):
+        """Stage latency, faces per frame and match outcomes of one frame"""
+        metrics = self.metrics
+        metrics.observe("face_stage_seconds", detect_seconds, stage="detect")
+        metrics.observe("face_stage_seconds", match_seconds, stage="match")
+        metrics.observe("face_faces_per_frame", len(recognized_faces))
+        for face in recognized_faces:
+            if face["name"] == "Unknown":
+                metrics.inc("face_recognitions_total", result="unknown")
+            else:
+                metrics.inc("face_recognitions_total", result="known")
+                metrics.observe("face_match_confidence", face["confidence"])
+    
+    def warm_up(self) -> Dict:
+        """
+        Run one detection and one match on a synthetic frame
+        
+        Touches the detector and the active recognizer backend once so their
+        lazy allocations happen before the first real frame. Returns the
+        latency of each step in milliseconds.
+        """
+        frame = np.full((480, 640, 3), 128, dtype=np.uint8)
+        
+        start = time.perf_counter()
+        _, gray = self.detect_faces(frame)
+        detected = time.perf_counter()
+        
+        state = self._state
+        self._identify(self.preprocessor.faces(gray, [(220, 140, 200, 200)]), state)
+        matched = time.perf_counter()
+        
+        return {
+            "detect_ms": round((detected - start) * 1000, 2),
+            "match_ms": round((matched - detected) * 1000, 2),
+            "model_version": state.version,
+        }
+    
+    def _identify(self, face_rois, state: ModelState) -> List[Tuple[str, float, List]]:
+        """Match preprocessed faces with whichever recognizer backend is active"""
+        if self.embedder:
+            return self._match_embeddings(face_rois, state.embedding_index, state.names)
+        # A model extended without retraining only has the NumPy matcher
+        use_matcher = self.recognizer_backend == "lbph_numpy" or state.recognizer is None
+        if state.lbph_matcher is not None and use_matcher:
+            return self._match_lbph_batch(face_rois, state.lbph_matcher, state.names)
+        return [self._match_lbph(face_roi, state.recognizer, state.names) for face_roi in face_rois]
+    
+    def _preprocess_face(self, gray, box):
+        """Crop a detected face and normalize it to the 200x200 gallery format (new array)"""
+        return self.preprocessor.face(gray, box)
+    
+    def _match_lbph(self, face_roi, recognizer, known_face_names) -> Tuple[str, float, List]:
+        """Identify one face with the LBPH model"""
+        name = "Unknown"
+        confidence = 0.0
+        candidates = []
+        
+        # Recognize face if we have trained data
+        if len(known_face_names) > 0 and hasattr(recognizer, 'predict'):
+            try:
+                label, conf = recognizer.predict(face_roi)
+                
+                # Lower confidence value means better match
+                # Threshold: accept if confidence < 60 (Balanced for security and usability)
+                if conf < 60 and label < len(known_face_names):
+                    name = known_face_names[label]
+                    # Convert confidence to percentage (inverse)
+                    confidence = max(0, (100 - conf) / 100)
+                    candidates = [(name, confidence)]
+                
+            except Exception as e:
+                print(f"Recognition error: {e}")
+        
+        return name, confidence, candidates
+    
+    def _match_lbph_batch(self, face_rois, lbph_matcher, known_face_names) -> List[Tuple[str, float, List]]:
+        """Identify every face in a frame with one batched LBPH comparison"""
+        matches = [("Unknown", 0.0, [])] * len(face_rois)
+        if len(face_rois) == 0 or len(lbph_matcher) == 0:
+            return matches
+        
+        try:
+            labels, dists = lbph_matcher.predict(face_rois, k=self.top_k)
+        except Exception as e:
+            print(f"Recognition error: {e}")
+            return matches
+        
+        for i in range(len(face_rois)):
+            # Same threshold and confidence scale as the OpenCV predict() path
+            candidates = [
+                (known_face_names[label], max(0, (100 - dist) / 100))
+                for label, dist in zip(labels[i], dists[i])
+                if dist < 60 and 0 <= label < len(known_face_names)
+            ]
+            if candidates:
+                matches[i] = (candidates[0][0], candidates[0][1], candidates)
+        return matches
+    
+    def _match_embeddings(self, face_rois, embedding_index, known_face_names) -> List[Tuple[str, float, List]]:
+        """Identify every face in a frame with one vectorized gallery search"""
+        matches = [("Unknown", 0.0, [])] * len(face_rois)
+        if len(face_rois) == 0 or len(embedding_index) == 0:
+            return matches
+        
+        try:
+            labels, scores = embedding_index.search(self.embedder.embed(face_rois), k=self.top_k)
+        except Exception as e:
+            print(f"Recognition error: {e}")
+            return matches
+        
+        for i in range(len(face_rois)):
+            # Cosine similarity of each user's best sample: higher is better
+            # (calibrate the threshold with manage.py calibrate_embeddings)
+            candidates = [
+                (known_face_names[label], float(score))
+                for label, score in zip(labels[i], scores[i])
+                if score >= self.embedding_threshold and 0 <= label < len(known_face_names)
+            ]
+            if candidates:
+                matches[i] = (candidates[0][0], candidates[0][1], candidates)
+        return matches
+    
+    def _build_embeddings(self, names, samples, rows, generation: int) -> EmbeddingIndex:
+        """
+        Embedding index for a gallery, reusing the live vectors where possible
+        
+        Users whose sample rows are unchanged keep their vectors (relabelled,
+        since labels shift when users are removed); everyone else is embedded.
+        """
+        state = self._state
+        live_labels = {name: label for label, name in enumerate(state.names)}
+        vectors, labels = [], []
+        for label, name in enumerate(names):
+            user_samples = samples.get(name)
+            if not user_samples:
+                continue
+            
+            user_vectors = None
+            if (state.embedding_index is not None and name in live_labels
+                    and generation == state.generation and state.rows.get(name) == tuple(rows.get(name, ()))):
+                user_vectors = state.embedding_index.vectors[state.embedding_index.labels == live_labels[name]]
+            if user_vectors is None or len(user_vectors) != len(user_samples):
+                user_vectors = self.embedder.embed(user_samples)
+            
+            vectors.append(user_vectors)
+            labels.append(np.full(len(user_vectors), label, dtype=np.int32))
+        
+        if not vectors:
+            return EmbeddingIndex()
+        return EmbeddingIndex(np.vstack(vectors), np.concatenate(labels))
+    
+    def _sync_embeddings(self, embedding_index, names, samples) -> EmbeddingIndex:
+        """Embed the samples of every user that is not in the index yet"""
+        indexed = set(int(label) for label in np.unique(embedding_index.labels))
+        for label, name in enumerate(names):
+            if label not in indexed and samples.get(name):
+                embedding_index = embedding_index.add(self.embedder.embed(samples[name]), label)
+        return embedding_index
+    
+    def recognize_faces_batch(self, frames, workers: int = None, chunksize: int = 4) -> List[List[Dict]]:
+        """
+        Recognize faces in many frames using a pool of worker processes
+        
+        Args:
+            frames: Iterable of image frames
+            workers: Number of worker processes (default: one per CPU core)
+            chunksize: Frames sent to a worker per round trip
+        
+        Returns:
+            One recognize_faces() result list per frame, in input order
+        """
+        frames = list(frames)
+        if not frames:
+            return []
+        
+        workers = workers or os.cpu_count() or 1
+        if workers == 1:
+            return [self.recognize_faces(frame) for frame in frames]
+        
+        pool = self._get_pool(workers)
+        return list(pool.map(_recognize_in_worker, frames, chunksize=max(1, chunksize)))
+    
+    def close(self):
+        """Shut down the batch recognition worker pool, if one was started"""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+            self._pool_workers = 0
+    
+    def _get_pool(self, workers: int) -> ProcessPoolExecutor:
+        """Start (or resize) the worker pool; each worker loads the model once"""
+        if self._pool is None or self._pool_workers != workers:
+            self.close()
+            self._pool = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(self._worker_kwargs,),
+            )
+            self._pool_workers = workers
+        return self._pool
+    
+    def rebuild(self):
+        """
+        Retrain the recognizer from scratch with all stored samples
+        
+        Users over the sample budget are trimmed, and sample rows left
+        behind by deleted users or evicted samples are reclaimed.
+        """
+        self._rebuild_model(compact=True)
+    
+    def _rebuild_model(self, compact: bool = False):
+        """
+        Train and publish a model from the gallery as it is on disk now
+        
+        Covers every change stored so far, so one call serves any number of
+        queued enrollments and deletions. The model is built in fresh objects
+        while recognition keeps using the live state. If users were only
+        added or given new samples, the live LBPH histograms are extended
+        with theirs (see _update_matcher); deletions and compact=True retrain
+        from scratch, and so does compaction, which renumbers the sample
+        rows. Evicted and deleted rows are compacted away once they outnumber
+        the live ones (always with compact=True).
+        
+        The write lock is only held to read the gallery and to publish, not
+        while training, so enrollments are never blocked behind a retrain.
+        A model whose gallery changed meanwhile is dropped instead of
+        published, and the newer gallery is trained (queued again with
+        background training, otherwise right away).
+        """
+        while True:
+            with self.snapshots.write_lock():
+                self._reload_latest()
+                names, samples = self.sample_store.load()
+                
+                if compact:
+                    # Trim users enrolled before the sample budget (or under a larger one)
+                    for name, user_samples in samples.items():
+                        if len(user_samples) > self.max_samples_per_user:
+                            keep = select_samples(user_samples, self.max_samples_per_user,
+                                                  redundancy=self.sample_redundancy)
+                            self.sample_store.replace(name, keep, [])
+                
+                if compact or self.sample_store.dead_rows() > self.sample_store.count // 2:
+                    self.sample_store.compact()
+                    names, samples = self.sample_store.load()
+                elif self.sample_store.revision == self._state.revision:
+                    # Another rebuild already trained this gallery
+                    return
+                revision = self.sample_store.revision
+                generation = self.sample_store.generation
+                rows = {name: tuple(user_rows) for name, user_rows in self.sample_store.rows.items()}
+                state = self._state
+            
+            embedding_index = self._build_embeddings(names, samples, rows, generation) if self.embedder else None
+            lbph_matcher = None if compact else self._update_matcher(state, names, samples, rows, generation)
+            recognizer = None if lbph_matcher is not None else self._train_recognizer(names, samples)
+            
+            with self.snapshots.write_lock():
+                if self.sample_store.read_revision() == revision:
+                    self._commit(names, samples, recognizer, embedding_index, lbph_matcher,
+                                 revision, rows, generation)
+                    return
+            
+            # Stale before it was published
+            if self.trainer is not None:
+                self.trainer.submit()
+                return
+            compact = False
+    
+    def _update_matcher(self, state: ModelState, names, samples, rows, generation: int):
+        """
+        The state's LBPH model extended to a gallery that only grew since
+        
+        Users that are new or whose sample rows changed get fresh histograms,
+        added as a new matcher segment; everyone else keeps the live ones,
+        so enrolling costs one user's histograms rather than a retrain or a
+        copy of the gallery. Returns None when a user was removed (labels are
+        positions in the name list, and LBPH cannot forget histograms) or the
+        sample file was compacted, which both need a full retrain.
+        """
+        if generation != state.generation or tuple(names[:len(state.names)]) != state.names:
+            return None
+        
+        matcher = state.lbph_matcher
+        if matcher is None:
+            matcher = LBPHMatcher.from_recognizer(state.recognizer or cv2.face.LBPHFaceRecognizer_create())
+        
+        changed = {}
+        for label, name in enumerate(names):
+            user_rows = rows.get(name, ())
+            if label < len(state.names) and state.rows.get(name, ()) == user_rows:
+                continue
+            user_samples = samples.get(name, ())
+            changed[label] = matcher.extract(user_samples) if user_samples else ()
+        return matcher.with_labels(changed)
+    
+    def check_for_updates(self):
+        """
+        Start loading a newer published snapshot, if there is one
+        
+        Only reads the tiny version marker, at most once per reload_interval.
+        The snapshot itself is loaded on a background thread and swapped in
+        when ready, so recognition keeps using the current model meanwhile.
+        """
+        now = time.monotonic()
+        if now - self._last_poll < self.reload_interval:
+            return
+        self._last_poll = now
+        
+        version = self.snapshots.current_version()
+        if version == self._state.version or self._reloading:
             return
         
+        self._reloading = True
+        threading.Thread(target=self._reload_in_background, args=(version,), daemon=True).start()
+    
+    def _reload_in_background(self, version: int):
+        try:
+            self._apply_snapshot(self._read_snapshot(version))
+        except Exception as e:
+            # Usually a snapshot pruned mid-read; the next poll retries
+            print(f"Error reloading model snapshot {version}: {e}")
+        finally:
+            self._reloading = False
+    
+    def _reload_latest(self):
+        """Synchronously load the newest snapshot (callers hold the write lock)"""
+        version = self.snapshots.current_version()
+        if version and version != self._state.version:
+            self._apply_snapshot(self._read_snapshot(version))
+    
+    def _read_snapshot(self, version: int) -> ModelState:
+        """
+        Load a published snapshot without touching the live model
+        
+        The snapshot's copy of the index is read through a store of its own:
+        self.sample_store belongs to writers, who reload the live index under
+        the write lock, and may hold users not trained into any snapshot yet.
+        """
+        path = self.snapshots.path(version)
+        if not os.path.isdir(path):
+            raise FileNotFoundError(f"Snapshot {path} does not exist")
+        store = SampleStore(self.encodings_dir)
+        names, samples = store.load(os.path.join(path, SnapshotStore.INDEX_FILE))
+        
+        # Segments are memory-mapped, so this does not read the histograms
+        lbph_matcher = LBPHMatcher.load(path, self.snapshots.segments_dir)
+        recognizer = None
+        model_path = os.path.join(path, SnapshotStore.MODEL_FILE)
+        if os.path.exists(model_path) and (self.recognizer_backend == "lbph" or lbph_matcher is None):
+            recognizer = cv2.face.LBPHFaceRecognizer_create()
+            recognizer.read(model_path)
+            if lbph_matcher is None:
+                lbph_matcher = LBPHMatcher.from_recognizer(recognizer)
+        
+        embedding_index = None
+        if self.embedder:
+            # Also covers snapshots published before the embedding backend was enabled
+            embedding_index = self._sync_embeddings(EmbeddingIndex.load(path), names, samples)
+        
+        return ModelState(version, names, samples, recognizer, embedding_index, lbph_matcher,
+                          revision=store.revision, rows=store.rows, generation=store.generation)
+    
+    def _apply_snapshot(self, state: ModelState):
+        """Swap a loaded snapshot in, unless something newer is already live"""
+        with self._swap_lock:
+            if state.version > self._state.version:
+                self._state = state
+    
+    def _commit(self, names, samples, recognizer, embedding_index, lbph_matcher=None,
+                revision: int = None, rows=None, generation: int = None):
+        """
+        Publish a model built by a writer as a new snapshot and swap it in
+        
+        The model is either a trained OpenCV recognizer, whose histograms
+        also seed an LBPHMatcher, or, when extended without retraining, an
+        LBPHMatcher alone (recognizer=None), which then serves recognition
+        whichever LBPH backend is configured. The recognizer itself is only
+        saved for the OpenCV backend. revision, rows and generation describe
+        the gallery it was built from (default: the store's own). Callers
+        hold the write lock.
+        """
+        if lbph_matcher is None and recognizer is not None:
+            lbph_matcher = LBPHMatcher.from_recognizer(recognizer)
+        has_samples = any(samples.values())
+        saved_recognizer = recognizer if self.recognizer_backend == "lbph" else None
+        version = self.snapshots.publish(saved_recognizer if has_samples else None,
+                                         self.sample_store.index_path, embedding_index,
+                                         lbph_matcher if has_samples else None)
+        if revision is None:
+            revision = self.sample_store.revision
+            rows = self.sample_store.rows
+            generation = self.sample_store.generation
+        state = ModelState(version, names, samples, recognizer, embedding_index, lbph_matcher,
+                           revision=revision, rows=rows, generation=generation)
+        with self._swap_lock:
+            if state.version > self._state.version:
+                self._state = state
+    
+    def _train_recognizer(self, names, samples):
+        """Train a fresh face recognizer with all given samples (None if there are none)"""
         faces = []
         labels = []
         
-        for idx, name in enumerate(self.known_face_names):
-            if name in self.face_samples:
-                for face_sample in self.face_samples[name]:
-                    faces.append(face_sample)
-                    labels.append(idx)
-        
-        if faces:
-            self.recognizer.train(faces, np.array(labels))
-            # Save trained model
-            model_path = os.path.join(self.models_dir, "face_recognizer.yml")
-            self.recognizer.save(model_path)
-    
-    def _save_data(self):
-        """Save face samples and names"""
-        # Save names
-        names_file = os.path.join(self.encodings_dir, "names.pkl")
-        with open(names_file, 'wb') as f:
-            pickle.dump(self.known_face_names, f)
+        for idx, name in enumerate(names):
+            for face_sample in samples.get(name, ()):
+                faces.append(face_sample)
+                labels.append(idx)
         
-        # Save face samples
-        samples_file = os.path.join(self.encodings_dir, "samples.pkl")
-        with open(samples_file, 'wb') as f:
-            pickle.dump(self.face_samples, f)
+        if not faces:
+            return None
+        
+        recognizer = cv2.face.LBPHFaceRecognizer_create()
+        recognizer.train(faces, np.array(labels))
+        return recognizer
+    
+    def _sync_recognizer(self, recognizer, names, samples):
+        """Bring a legacy model up to date with users enrolled since it was saved"""
+        labels = recognizer.getLabels()
+        trained = set() if labels is None else set(int(l) for l in labels.ravel())
+        
+        # Labels beyond the name list mean the saved model is from another gallery
+        if any(label >= len(names) for label in trained):
+            return self._train_recognizer(names, samples)
+        
+        for idx, name in enumerate(names):
+            if idx not in trained and samples.get(name):
+                recognizer.update(samples[name], np.full(len(samples[name]), idx, dtype=np.int32))
+        return recognizer
     
     def load_encodings(self):
         """Load all saved face data"""
-        self.known_face_names = []
-        self.face_samples = {}
+        if self.read_only:
+            # Snapshots are published atomically, so reading needs no lock;
+            # until one can be read the model stays empty and polling retries
+            version = self.snapshots.current_version()
+            if version:
+                try:
+                    self._apply_snapshot(self._read_snapshot(version))
+                except Exception as e:
+                    print(f"Error loading model snapshot {version}: {e}")
+            return
         
-        # Load names
-        names_file = os.path.join(self.encodings_dir, "names.pkl")
-        if os.path.exists(names_file):
+        with self.snapshots.write_lock():
+            version = self.snapshots.current_version()
+            if version:
+                try:
+                    self._apply_snapshot(self._read_snapshot(version))
+                    self.sample_store.load()
+                    # Changes queued by a worker that exited before training them
+                    if self.trainer is not None and self.gallery_revision() > self._state.revision:
+                        self.trainer.submit()
+                    return
+                except Exception as e:
+                    print(f"Error loading model snapshot {version}: {e}")
+            
+            # No usable snapshot yet: build one from the gallery on disk. A
+            # pre-snapshot model is only trusted if nothing was ever published
+            # (it was saved alongside the legacy gallery), and is removed once
+            # migrated; later it may be from another gallery with shifted labels.
+            names, samples, recognizer = self._load_unversioned(legacy_model=not version)
+            embedding_index = None
+            if self.embedder:
+                embedding_index = self._build_embeddings(names, samples, self.sample_store.rows,
+                                                         self.sample_store.generation)
+            self._commit(names, samples, recognizer, embedding_index)
             try:
-                with open(names_file, 'rb') as f:
-                    self.known_face_names = pickle.load(f)
-            except Exception as e:
-                print(f"Error loading names: {e}")
-        
-        # Load samples
+                os.remove(os.path.join(self.models_dir, SnapshotStore.MODEL_FILE))
+            except OSError:
+                pass
+    
+    def _load_unversioned(self, legacy_model: bool = True):
+        """Load the gallery and, if legacy_model, any pre-snapshot model from their legacy locations"""
+        # One-time migration from the legacy pickled gallery
+        names_file = os.path.join(self.encodings_dir, "names.pkl")
         samples_file = os.path.join(self.encodings_dir, "samples.pkl")
-        if os.path.exists(samples_file):
-            try:
-                with open(samples_file, 'rb') as f:
-                    self.face_samples = pickle.load(f)
-            except Exception as e:
-                print(f"Error loading samples: {e}")
+        try:
+            if self.sample_store.migrate_from_pickles(names_file, samples_file):
+                print(f"Migrated face gallery from {names_file} to memory-mapped store")
+        except Exception as e:
+            print(f"Error migrating legacy gallery: {e}")
+        
+        # Map samples without copying them into the heap
+        names, samples = [], {}
+        try:
+            names, samples = self.sample_store.load()
+        except Exception as e:
+            print(f"Error loading samples: {e}")
         
         # Load trained model if exists
-        model_path = os.path.join(self.models_dir, "face_recognizer.yml")
-        if os.path.exists(model_path):
+        recognizer = None
+        model_path = os.path.join(self.models_dir, SnapshotStore.MODEL_FILE)
+        if legacy_model and os.path.exists(model_path):
             try:
-                self.recognizer.read(model_path)
+                recognizer = cv2.face.LBPHFaceRecognizer_create()
+                recognizer.read(model_path)
+                # Add users enrolled since the model was last rebuilt
+                recognizer = self._sync_recognizer(recognizer, names, samples)
             except Exception as e:
                 print(f"Error loading model: {e}")
                 # Retrain if model loading fails
-                self._train_recognizer()
+                recognizer = self._train_recognizer(names, samples)
+        else:
+            recognizer = self._train_recognizer(names, samples)
+        
+        return names, samples, recognizer
     
     def delete_user(self, name: str) -> bool:
         """Delete a registered user"""
-        if name in self.known_face_names:
-            self.known_face_names.remove(name)
-            if name in self.face_samples:
-                del self.face_samples[name]
-            
-            self._save_data()
-            self._train_recognizer()
+        with self.snapshots.write_lock():
+            names, _ = self.sample_store.load()
+            if name not in names:
+                return False
             
-            return True
-        return False
+            self.sample_store.remove(name)
+        
+        # LBPH cannot forget histograms, so deletion needs a retrain
+        self._gallery_changed()
+        return True
     
     def get_registered_users(self) -> List[str]:
         """Get list of all registered users"""
-        return self.known_face_names.copy()
+        self.check_for_updates()
+        return list(self._state.names)
+    
+    def detection_stats(self) -> Dict:
+        """Detector latency and, with adaptive detection, each camera's current parameters"""
+        stats = self.detector.latency_stats()
+        stats["adaptive"] = self.tuner.stats() if self.tuner is not None else None
+        return stats
+    
+    def gallery_stats(self) -> Dict:
+        """Gallery size: users, samples per user and rows awaiting compaction"""
+        self.check_for_updates()
+        state = self._state
+        names, samples, store = state.names, state.samples, self.sample_store
+        
+        counts = [len(samples.get(name, [])) for name in names]
+        return {
+            "users": len(names),
+            "samples": sum(counts),
+            "max_samples_per_user": self.max_samples_per_user,
+            "samples_per_user": {
+                "min": min(counts, default=0),
+                "mean": round(sum(counts) / len(counts), 2) if counts else 0.0,
+                "max": max(counts, default=0),
+            },
+            "users_at_budget": sum(1 for count in counts if count >= self.max_samples_per_user),
+            "stored_rows": store.count,
+            "dead_rows": store.dead_rows(),
+            "model_version": state.version,
+        }
+
+
+# Per-process recognition system used by recognize_faces_batch() workers
+_worker_system = None
+
+
+def _init_worker(kwargs):
+    global _worker_system
+    # One OpenCV thread per process so N workers scale across N cores
+    cv2.setNumThreads(1)
+    _worker_system = SimpleFaceRecognitionSystem(read_only=True, **kwargs)
+
+
+def _recognize_in_worker(frame):
+    return _worker_system.recognize_faces(frame)
@@ -0,0 +1,89 @@
+import threading
+import time
+from typing import Callable, Dict
+
+
+class TrainingQueue:
+    """
+    Background worker that retrains the face model after gallery changes
+
+    submit() only records that the gallery changed and returns at once. The
+    worker thread waits delay seconds for further changes, then makes one
+    rebuild() call that covers all of them, so enrolling a batch of users
+    costs one retrain rather than one per user. Changes submitted while a
+    rebuild is running are picked up by the next one.
+    """
+
+    def __init__(self, rebuild: Callable[[], None], delay: float = 0.5):
+        self.rebuild = rebuild
+        self.delay = delay
+
+        self.submitted = 0
+        self.runs = 0
+        self.last_duration = 0.0
+        self.last_error = None
+
+        self._pending = False
+        self._running = False
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def submit(self):
+        """Note a gallery change; the worker thread starts on first use"""
+        with self._cond:
+            self.submitted += 1
+            self._pending = True
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='face-training', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def wait(self, timeout: float = None) -> bool:
+        """Block until no rebuild is pending or running; False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._pending or self._running:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def stats(self) -> Dict:
+        """Changes submitted, rebuilds run, and the last rebuild's duration and error"""
+        with self._cond:
+            return {
+                "pending": self._pending,
+                "running": self._running,
+                "submitted": self.submitted,
+                "rebuilds": self.runs,
+                "last_duration_ms": round(self.last_duration * 1000, 2),
+                "last_error": self.last_error,
+            }
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+
+            # Let the rest of a burst arrive before training once for all of it
+            time.sleep(self.delay)
+            with self._cond:
+                self._pending = False
+                self._running = True
+
+            start = time.perf_counter()
+            error = None
+            try:
+                self.rebuild()
+            except Exception as e:
+                error = str(e)
+                print(f"Background face model rebuild failed: {e}")
+
+            with self._cond:
+                self.runs += 1
+                self.last_duration = time.perf_counter() - start
+                self.last_error = error
+                self._running = False
+                self._cond.notify_all()